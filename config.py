@@ -2,12 +2,66 @@
 """
 スクリプト全体で使用する設定値と定数を定義します。
 """
+import logging
+import os
+
+
+def _env_int(name: str, default: int, minimum: int) -> int:
+    """環境変数を整数として読み込む。未設定・空なら default、不正な値なら警告を出して default を使う (minimum 未満は切り上げ)。"""
+    raw_value = os.environ.get(name, '').strip()
+    if not raw_value:
+        return default
+    try:
+        return max(minimum, int(raw_value))
+    except ValueError:
+        logging.getLogger(__name__).warning(f"環境変数 {name} の値 '{raw_value}' は整数ではないため、既定値 {default} を使用します。")
+        return default
 
 # --- Playwright 関連設定 ---
 DEFAULT_ACTION_TIMEOUT = 10000  # 10000 デフォルトのアクションタイムアウト (ミリ秒)
 IFRAME_LOCATOR_TIMEOUT = 5000   #  5000 iframe存在確認のタイムアウト (ミリ秒)
 PDF_DOWNLOAD_TIMEOUT   = 60000  # 60000 PDFダウンロードのタイムアウト (ミリ秒)
-NEW_PAGE_EVENT_TIMEOUT = 4000   #  4000 新しいページが開くのを待つタイムアウト (ミリ秒)(クリック後常に待つので長くすると常にクリック後遅い)
+NEW_PAGE_EVENT_TIMEOUT = 4000   #  4000 新しいページが開くのを監視する上限 (ミリ秒)(クリック時間に加算)
+# クリック完了後、新しいページが開くのを待つ時間 (ミリ秒)。新しいページが開いた時点で待機は終わる。
+# 遅れて開くポップアップ (target=_blank + JS リダイレクト等) を取りこぼさないよう既定は NEW_PAGE_EVENT_TIMEOUT と同じ。
+# ステップに opens_new_page を指定すると、true で監視の上限まで待ち、false で待たない
+NEW_PAGE_CLICK_GRACE_MS = NEW_PAGE_EVENT_TIMEOUT
+IFRAME_SCAN_CACHE_TTL_MS = 500  #   500 スコープ直下のiframe探索結果を再利用する期間 (ミリ秒)(連続するステップでの再探索を省略。0で無効)
+PAGE_POOL_MAX_SIZE     = 4      #     4 URLごとのテキスト/メール取得で使い回す一時ページの、コンテキストあたりの最大保持数 (0で無効)
+TEXT_FETCH_BLOCK_MEDIA = True   #  True URLごとのテキスト/メール取得用の一時ページで、画像・動画・フォントの読み込みを中止する
+
+# --- PDF処理関連設定 ---
+PDF_TEXT_CACHE_MAX_ENTRIES = 64 # PDFテキスト抽出結果をキャッシュする最大件数 (同一内容のPDFの再抽出を省略)
+# 複数PDFを処理する際の同時処理数 (ダウンロード+抽出)。環境変数 PDF_CONCURRENCY で上書き可能
+PDF_DOWNLOAD_CONCURRENCY   = _env_int('PDF_CONCURRENCY', 8, minimum=1)
+PDF_EXTRACT_MAX_WORKERS    = None # PDFテキスト抽出プロセスプールのワーカー数 (None: CPU数の半分, 最低2)
+PDFTOTEXT_MIN_BYTES        = 200000 # これより大きいPDFは pdftotext (poppler) があればそちらで抽出する (バイト)
+PDF_SHARED_MEMORY_MIN_BYTES = 1024 * 1024 # これより大きいPDFは共有メモリ経由で抽出プロセスへ渡す (pickle によるコピー・転送を省略)
+# これより大きいPDFはテキスト抽出を行わずにスキップする (バイト)。環境変数 PDF_MAX_BYTES で上書き可能。0で無制限
+PDF_MAX_BYTES              = _env_int('PDF_MAX_BYTES', 50 * 1024 * 1024, minimum=0)
+# ダウンロード前に HEAD で Content-Length を確認し、PDF_MAX_BYTES を超えるPDFは取得しない (1/true/yes で有効)。
+# PDFごとに1往復増えるため既定は無効 (上限はダウンロード後のサイズ確認で適用される)。条件付きリクエスト時は行わない
+PDF_MAX_BYTES_HEAD_CHECK   = os.environ.get('PDF_MAX_BYTES_HEAD_CHECK', '').strip().lower() in ('1', 'true', 'yes')
+# URLごとのPDF抽出テキストをディスクにキャッシュするディレクトリ (ETag/Last-Modified で再検証)。
+# 取得したテキストがディスクに残るため既定は無効 (空文字)。環境変数 PDF_TEXT_DISK_CACHE_DIR で指定した場合のみ有効
+PDF_TEXT_DISK_CACHE_DIR         = os.environ.get('PDF_TEXT_DISK_CACHE_DIR', '')
+PDF_TEXT_DISK_CACHE_MAX_ENTRIES = 1000 # ディスクキャッシュの最大件数 (超えた分は最終利用が古いものから削除)
+PDF_TEXT_DISK_CACHE_PRUNE_INTERVAL = 50 # 上限件数の確認 (ディレクトリの走査) を行う書き込み間隔 (件数)
+# PDFテキストを読み順 (座標順) に並べ替えて抽出するか。既定は並べ替えなし (高速)。環境変数で有効化 (1/true/yes)
+PDF_PRESERVE_READING_ORDER = os.environ.get('PDF_PRESERVE_READING_ORDER', '').strip().lower() in ('1', 'true', 'yes')
+
+# --- ブラウザ常駐 (CDP接続) 関連設定 ---
+CDP_ENDPOINT_FILE         = '.playwright_cdp' # 常駐ブラウザの接続先 (wsEndpoint) を保存するファイル
+CDP_REMOTE_DEBUGGING_PORT = 9222              # 常駐ブラウザ起動時のリモートデバッグポート
+CDP_STARTUP_TIMEOUT       = 15000             # 常駐ブラウザの起動待ちタイムアウト (ミリ秒)
+
+# --- コンテキストプール (常駐プロセスでのブラウザ使い回し時) ---
+# MCPサーバーでブラウザコンテキストを呼び出し間で使い回すか。既定は無効 (呼び出しごとに新規作成して完全に分離)。
+# 使い回すと Cookie・権限以外 (localStorage, IndexedDB, Service Worker, HTTPキャッシュ等) は次の呼び出しに残るため、
+# それを許容できる場合のみ環境変数で有効化する (1/true/yes)
+CONTEXT_POOL_ENABLED     = os.environ.get('CONTEXT_POOL_ENABLED', '').strip().lower() in ('1', 'true', 'yes')
+CONTEXT_POOL_MAX_SIZE    = 4   # 使い回すために保持しておくブラウザコンテキストの最大数
+CONTEXT_POOL_MAX_AGE_SEC = 600 # これより古いコンテキストは再利用せずに閉じる (秒)
 
 # --- 動的探索関連設定 ---
 DYNAMIC_SEARCH_MAX_DEPTH = 2    # iframe探索の最大深度
@@ -17,6 +71,7 @@ LOG_FILE               = 'output_web_runner.log'
 DEFAULT_INPUT_FILE     = 'input.json'
 DEFAULT_SCREENSHOT_DIR = 'screenshots'
 RESULTS_OUTPUT_FILE    = 'output_results.txt'
+LOG_BUFFER_CAPACITY    = 512 # バッファリング時にまとめて書き出すログレコード数
 
 # --- その他 ---
 # 必要に応じて他の設定値を追加
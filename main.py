@@ -5,28 +5,125 @@ MCPサーバーとは独立して、このファイル単体でも実行可能
 """
 import argparse
 import asyncio
+import contextlib
+import functools
+import glob
+import importlib
+import json
 import logging
 import os
 import sys
-import pprint
+from typing import List, Optional
+from urllib.parse import urlparse
 
 # --- 各モジュールをインポート ---
+# config は定数のみで軽量なため先に読み込む。
+# utils (PyMuPDF/Playwright に依存), playwright_launcher は
+# --help や入力ファイル不在による早期終了時に読み込まずに済むよう、使用直前で読み込む。
 import config
-import utils
-# --- ▼▼▼ 修正 ▼▼▼ ---
-# import playwright_handler -> playwright_launcher をインポート
-import playwright_launcher
-# --- ▲▲▲ 修正 ▲▲▲ ---
 
-# --- エントリーポイント ---
-if __name__ == "__main__":
-    # --- 1. ロギング設定 (単体実行用) ---
-    # --- ▼▼▼ 修正 ▼▼▼ ---
-    # ログファイルのパスを MCP_SERVER_LOG_FILE に変更
-    utils.setup_logging_for_standalone(config.MCP_SERVER_LOG_FILE)
-    # --- ▲▲▲ 修正 ▲▲▲ ---
 
-    # --- 2. コマンドライン引数解析 ---
+def _expand_input_paths(input_arg: str, input_dir: Optional[str] = None) -> List[str]:
+    """
+    --input / --input-dir の指定から、実行対象の JSON ファイルパスのリストを作成する。
+    --input はファイル名・パス・グロブパターン (例: 'json/google_*.json') を受け付ける。
+    """
+    if input_dir:
+        if not os.path.isdir(input_dir):
+            logging.critical("指定された入力ディレクトリ '%s' が見つかりません。", input_dir)
+            sys.exit(1)
+        paths = sorted(
+            os.path.join(input_dir, name) for name in os.listdir(input_dir)
+            if name.lower().endswith('.json') and os.path.isfile(os.path.join(input_dir, name))
+        )
+        if not paths:
+            logging.critical("入力ディレクトリ '%s' に JSON ファイルがありません。", input_dir)
+            sys.exit(1)
+        return paths
+
+    if glob.has_magic(input_arg):
+        paths = sorted(glob.glob(input_arg))
+        # パターンがファイル名のみの場合は json/ ディレクトリ内も探す
+        if not paths and not os.path.dirname(input_arg):
+            paths = sorted(glob.glob(os.path.join('json', input_arg)))
+        if not paths:
+            logging.critical("指定されたパターン '%s' に一致する入力ファイルが見つかりません。", input_arg)
+            sys.exit(1)
+        return paths
+
+    try:
+        return [_resolve_json_path(input_arg)]
+    except FileNotFoundError:
+        logging.critical("指定された入力ファイル '%s' が見つかりません。", input_arg) # criticalに変更
+        sys.exit(1) # 単体実行時は見つからなければ終了
+
+
+@functools.lru_cache(maxsize=128)
+def _resolve_json_path(input_arg: str) -> str:
+    """
+    --input の値を実際の JSON ファイルパスに解決する (結果はプロセス内でキャッシュ)。
+    ファイル名のみの指定で json/ ディレクトリに存在する場合はそちらを優先する。
+    存在確認は os.stat 1回ずつで行い、どちらにもなければ FileNotFoundError を送出する。
+    """
+    if not os.path.dirname(input_arg): # ファイル名のみ (絶対パスはディレクトリ部を持つ)
+        json_dir_path = os.path.join('json', input_arg)
+        try:
+            os.stat(json_dir_path)
+            logging.info("--input でファイル名のみ指定され、'json' ディレクトリ内に '%s' が見つかったため、'%s' を使用します。", input_arg, json_dir_path)
+            return json_dir_path
+        except FileNotFoundError:
+            pass
+    os.stat(input_arg) # 見つからなければ FileNotFoundError
+    return input_arg
+
+
+def _prefetch_input_files(json_file_paths: List[str]) -> None:
+    """
+    入力ファイルの先読みをカーネルに依頼する (posix_fadvise WILLNEED, Linux等のみ)。
+    ロギング設定やブラウザ起動と並行してページキャッシュが温まるため、後続の読み込みでディスク待ちが発生しにくくなる。
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for json_file_path in json_file_paths:
+        try:
+            fd = os.open(json_file_path, os.O_RDONLY)
+        except OSError:
+            continue # 読み込み時に改めてエラー処理される
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError as e:
+            logging.debug("posix_fadvise に失敗しました (%s): %s", json_file_path, e)
+        finally:
+            os.close(fd)
+
+
+def _results_output_path_for(json_file_path: str) -> str:
+    """バッチ実行時の入力ファイルごとの結果ファイルパス (例: output_results_input.txt) を返す。"""
+    base, ext = os.path.splitext(config.RESULTS_OUTPUT_FILE)
+    stem = os.path.splitext(os.path.basename(json_file_path))[0]
+    return f"{base}_{stem}{ext}"
+
+
+def _install_event_loop_policy() -> None:
+    """
+    利用可能なら uvloop をイベントループとして使用する (オプション依存)。
+    Playwright は CDP の JSON メッセージ送受信が中心のため、ループのオーバーヘッド削減が効く。
+    Windows では uvloop が使えないため、サブプロセス対応の Proactor ループを明示する。
+    """
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+        return
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logging.info("イベントループに uvloop を使用します。")
+    except ImportError:
+        logging.debug("uvloop が見つからないため、標準の asyncio イベントループを使用します。")
+
+
+@functools.lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
+    """コマンドライン引数パーサーを構築する。構築結果はプロセス内でキャッシュして再利用する。"""
     parser = argparse.ArgumentParser(
         description="JSON入力に基づき Playwright 自動化を実行 (iframe動的探索対応)。",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -35,7 +132,20 @@ if __name__ == "__main__":
         "--input",
         default=config.DEFAULT_INPUT_FILE,
         metavar="FILE",
-        help="URL とアクションを含む JSON ファイルのパス。"
+        help="URL とアクションを含む JSON ファイルのパス。グロブパターン (例: 'json/google_*.json') で複数指定も可能。"
+    )
+    parser.add_argument(
+        "--input-dir",
+        default=None,
+        metavar="DIR",
+        help="ディレクトリ内のすべての JSON ファイルを1つのブラウザで並行実行する (--input より優先)。"
+    )
+    parser.add_argument(
+        '--parallelism',
+        type=int,
+        default=min(10, (os.cpu_count() or 1) * 2),
+        metavar="N",
+        help="複数ファイル実行時の同時実行ジョブ数 (ジョブごとに BrowserContext を作成)。"
     )
     parser.add_argument(
         '--headless',
@@ -50,63 +160,285 @@ if __name__ == "__main__":
         metavar="MS",
         help="各操作間の待機時間(ms)。"
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        '--cdp-endpoint',
+        default=None,
+        metavar="URL",
+        help="起動済みブラウザの CDP 接続先 (例: ws://127.0.0.1:9222/devtools/browser/...)。指定時はブラウザを起動せず接続する。"
+    )
+    parser.add_argument(
+        '--keep-alive',
+        action='store_true',
+        help=f"ブラウザを常駐させて次回以降の実行で再利用する (接続先は '{config.CDP_ENDPOINT_FILE}' に保存)。"
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help="標準入力から1行1件の JSON (target_url, actions, default_timeout_ms) を読み込み、1つのブラウザを使い回して順に実行する。結果は1件ごとに1行の JSON で標準出力へ書き出す。"
+    )
+    parser.add_argument(
+        '--stream-results',
+        default=None,
+        metavar="FILE",
+        help="各ステップの結果を確定した順に JSON Lines 形式で FILE へ逐次書き出す (単一入力時のみ)。結果全体の整形表示は省略する。"
+    )
+    parser.add_argument(
+        '--warm-import',
+        action='store_true',
+        help="Playwright の読み込みと target_url の名前解決を JSON 読み込みと並行して事前に行う。"
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help="予期せぬエラーで終了する際にスタックトレースもログに出力する。"
+    )
+    return parser
 
-    # --- 3. 入力ファイルパス解決 ---
-    input_arg = args.input
-    json_file_path = input_arg
-    # 入力がファイル名のみで、json/ ディレクトリに存在する場合、そちらを優先
-    if not os.path.isabs(input_arg) and \
-       not os.path.dirname(input_arg) and \
-       os.path.exists(os.path.join('json', input_arg)):
-        json_file_path = os.path.join('json', input_arg)
-        logging.info(f"--input でファイル名のみ指定され、'json' ディレクトリ内に '{input_arg}' が見つかったため、'{json_file_path}' を使用します。")
-    elif not os.path.exists(input_arg):
-        logging.critical(f"指定された入力ファイル '{input_arg}' が見つかりません。") # criticalに変更
-        sys.exit(1) # 単体実行時は見つからなければ終了
 
-    # スクリーンショットディレクトリ作成
-    os.makedirs(config.DEFAULT_SCREENSHOT_DIR, exist_ok=True)
+async def _warm_resolve_hosts(target_urls: List[str]) -> None:
+    """
+    target_url のホスト名を事前に名前解決する (--warm-import 用)。
+    ローカルのリゾルバキャッシュを温め、最初のナビゲーション時の DNS 待ちを短縮するのが目的。
+    失敗やタイムアウトは無視する (本来のナビゲーション時に改めて解決される)。
+    """
+    loop = asyncio.get_running_loop()
+    hosts = {urlparse(url).hostname for url in target_urls} - {None}
+    if not hosts:
+        return
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(loop.getaddrinfo(host, 443) for host in hosts), return_exceptions=True),
+            timeout=5
+        )
+        logging.info("事前の名前解決が完了しました: %s", ", ".join(sorted(hosts)))
+    except asyncio.TimeoutError:
+        logging.warning("事前の名前解決がタイムアウトしました (無視して続行): %s", ", ".join(sorted(hosts)))
 
-    # --- 4. メイン処理実行 ---
+
+async def _stream_results_to_file(
+    playwright_launcher,
+    args: argparse.Namespace,
+    target_url: str,
+    actions: list,
+    default_timeout: int,
+    output_path: str
+) -> int:
+    """
+    ステップ結果を確定した順に JSON Lines 形式で output_path へ書き出し、終了コードを返す。
+    結果はメモリに溜めず、成否判定用のエラー件数と総件数のみを保持する。
+    """
+    import utils
+    utils.ensure_directory(os.path.dirname(output_path))
+    record_count = 0
+    error_count = 0
+    with open(output_path, 'wb') as f:
+        async for _, record in playwright_launcher.run_playwright_automation_stream(
+            target_url=target_url,
+            actions=actions,
+            headless_mode=args.headless,
+            slow_motion=args.slowmo,
+            default_timeout=default_timeout,
+            cdp_endpoint=args.cdp_endpoint,
+            keep_alive=args.keep_alive
+        ):
+            f.write(utils.dumps_json_line(record))
+            f.flush()
+            record_count += 1
+            if record.get("status") == "error":
+                error_count += 1
+    logging.info("結果を '%s' に逐次書き出しました (件数: %d, エラー: %d)。", output_path, record_count, error_count)
+    return 0 if error_count == 0 else 1
+
+
+async def _serve(args: argparse.Namespace) -> int:
+    """
+    --serve モード: Playwright とブラウザを1回だけ起動し、標準入力から読み込んだ JSON を1行ずつ実行する。
+    ジョブごとに新しい BrowserContext を作成して分離し、{"ok": bool, "results": [...]} を1行の JSON で標準出力へ書き出す。
+    標準入力が閉じられると終了し、全ジョブ成功なら0、それ以外は1を返す。
+    """
+    import utils
+    import playwright_launcher
+
+    all_ok = True
+    job_count = 0
+    playwright, browser = await playwright_launcher.launch_shared_browser(
+        headless_mode=args.headless,
+        slow_motion=args.slowmo,
+        cdp_endpoint=args.cdp_endpoint,
+        keep_alive=args.keep_alive
+    )
     try:
+        while True:
+            line = await asyncio.to_thread(sys.stdin.buffer.readline)
+            if not line:
+                break # 標準入力のクローズで終了
+            if not line.strip():
+                continue
+            job_count += 1
+            try:
+                payload = utils.loads_json(line)
+                target_url = payload.get("target_url") if isinstance(payload, dict) else None
+                actions = payload.get("actions") if isinstance(payload, dict) else None
+                if not target_url or not isinstance(actions, list) or not actions:
+                    raise ValueError("入力に target_url または actions (空でないリスト) がありません。")
+            except ValueError as e: # JSONDecodeError を含む
+                logging.error("[serve] ジョブ %d の入力が不正です: %s", job_count, e)
+                response = {"ok": False, "error": f"Invalid input: {e}"}
+            else:
+                default_timeout = payload.get("default_timeout_ms", config.DEFAULT_ACTION_TIMEOUT)
+                logging.info("[serve] ジョブ %d を実行します: %s", job_count, target_url)
+                ok, results = await playwright_launcher.run_actions_on_browser(browser, str(target_url), actions, default_timeout)
+                response = {"ok": ok, "results": results}
+            all_ok = all_ok and response["ok"]
+            sys.stdout.buffer.write(utils.dumps_json_line(response))
+            sys.stdout.buffer.flush()
+    finally:
+        await playwright_launcher.close_shared_browser(playwright, browser, args.keep_alive)
+    logging.info("[serve] 終了します (処理したジョブ数: %d)。", job_count)
+    return 0 if all_ok else 1
+
+
+async def _amain(args: argparse.Namespace, json_file_paths: Optional[List[str]] = None) -> int:
+    """
+    入力JSONの読み込み・自動化の実行・結果出力 (ステップ4, 5) を行い、終了コード (全成功で0、それ以外は1) を返す。
+    既存のイベントループ内から await できるため、外部のドライバー (MCPサーバー等) からも
+    イベントループや Playwright の起動を重複させずに呼び出せる。
+    入力の不備は FileNotFoundError / ValueError として送出する。
+    """
+    import utils
+
+    # --warm-import: Playwright の読み込みを別スレッドで開始し、JSON の読み込みと並行させる
+    warm_import_task = None
+    if getattr(args, "warm_import", False):
+        warm_import_task = asyncio.create_task(asyncio.to_thread(importlib.import_module, "playwright_launcher"))
+
+    if json_file_paths is None:
+        json_file_paths = _expand_input_paths(args.input, args.input_dir)
+
+    # --- 4. メイン処理実行 ---
+    jobs = []
+    for json_file_path in json_file_paths:
         input_data = utils.load_input_from_json(json_file_path)
         target_url = input_data.get("target_url")
         actions = input_data.get("actions")
 
         # JSONファイル内のタイムアウト指定を優先、なければconfigの値
         effective_default_timeout = input_data.get("default_timeout_ms", config.DEFAULT_ACTION_TIMEOUT)
-        logging.info(f"実行に使用するデフォルトアクションタイムアウト: {effective_default_timeout}ms")
+        logging.info("実行に使用するデフォルトアクションタイムアウト: %sms (%s)", effective_default_timeout, json_file_path)
 
         if not target_url or not actions:
-            logging.critical(f"エラー: JSON '{json_file_path}' から target_url または actions を取得できませんでした。")
-            sys.exit(1)
+            raise ValueError(f"JSON '{json_file_path}' から target_url または actions を取得できませんでした。")
+        jobs.append((str(target_url), actions, effective_default_timeout)) # URLは文字列として渡す
 
+    if warm_import_task is not None:
+        # target_url の名前解決を Playwright の読み込みと並行して済ませておく
+        await asyncio.gather(_warm_resolve_hosts([target_url for target_url, _, _ in jobs]), warm_import_task)
+
+    # --- ▼▼▼ 修正 ▼▼▼ ---
+    # import playwright_handler -> playwright_launcher をインポート (Playwright本体の読み込みはここで初めて発生)
+    import playwright_launcher
+    # --- ▲▲▲ 修正 ▲▲▲ ---
+
+    stream_results_path = getattr(args, "stream_results", None)
+    if stream_results_path and len(jobs) == 1:
+        target_url, actions, effective_default_timeout = jobs[0]
+        return await _stream_results_to_file(playwright_launcher, args, target_url, actions, effective_default_timeout, stream_results_path)
+    if stream_results_path:
+        logging.warning("--stream-results は単一入力時のみ有効です。通常の結果出力を行います。")
+
+    if len(jobs) == 1:
         # --- ▼▼▼ 修正 ▼▼▼ ---
         # Playwrightハンドラ -> ランチャー を呼び出し
-        success, results = asyncio.run(playwright_launcher.run_playwright_automation_async(
-            target_url=str(target_url), # URLは文字列として渡す
+        target_url, actions, effective_default_timeout = jobs[0]
+        success, results = await playwright_launcher.run_playwright_automation_async(
+            target_url=target_url,
             actions=actions,
             headless_mode=args.headless, # BooleanOptionalAction の結果を渡す
             slow_motion=args.slowmo,
-            default_timeout=effective_default_timeout
-        ))
+            default_timeout=effective_default_timeout,
+            cdp_endpoint=args.cdp_endpoint,
+            keep_alive=args.keep_alive
+        )
         # --- ▲▲▲ 修正 ▲▲▲ ---
+        batch_outcomes = [(success, results)]
+        results_output_paths = [config.RESULTS_OUTPUT_FILE]
+    else:
+        # 複数ファイルは Playwright とブラウザを1回だけ起動し、ジョブごとのコンテキストで並行実行
+        logging.info("%d 個の入力ファイルを同時実行数 %d でバッチ実行します。", len(jobs), args.parallelism)
+        batch_outcomes = await playwright_launcher.run_playwright_batch_async(
+            jobs,
+            headless_mode=args.headless,
+            slow_motion=args.slowmo,
+            parallelism=args.parallelism,
+            cdp_endpoint=args.cdp_endpoint,
+            keep_alive=args.keep_alive
+        )
+        results_output_paths = [_results_output_path_for(path) for path in json_file_paths]
 
-        # --- 5. 結果表示・出力 ---
-        print("\n--- 最終実行結果 ---")
-        # pprintで見やすく整形して表示
-        pprint.pprint(results)
-        logging.info(f"最終実行結果(詳細):\n{pprint.pformat(results)}")
+    # --- 5. 結果表示・出力 ---
+    # 整形表示は人が画面で見る場合のみ行う (ヘッドレス実行や出力リダイレクト時は1行の要約のみ)
+    pretty_print_results = sys.stdout.isatty() and not args.headless
+    for json_file_path, (success, results), results_output_path in zip(json_file_paths, batch_outcomes, results_output_paths):
+        if pretty_print_results:
+            # 整形は1回だけ行い、画面表示とログで同じ文字列を使い回す (orjson があれば pprint より大幅に速い)
+            formatted_results = utils.dumps_json(results)
+            sys.stdout.write(f"\n--- 最終実行結果 ({json_file_path}) ---\n{formatted_results}\n")
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info("最終実行結果(詳細) (%s):\n%s", json_file_path, formatted_results)
+        else:
+            summary_line = f"input={json_file_path} actions_ok={success} n={len(results)} output={results_output_path}"
+            sys.stdout.write(summary_line + "\n")
+            logging.info("最終実行結果(要約): %s", summary_line)
 
         # 結果ファイル書き込み (utils内の関数を使用)
-        utils.write_results_to_file(results, config.RESULTS_OUTPUT_FILE) # 単体実行用出力ファイル
+        utils.write_results_to_file(results, results_output_path) # 単体実行用出力ファイル
+
+    return 0 if all(success for success, _ in batch_outcomes) else 1
+
+
+# --- エントリーポイント ---
+if __name__ == "__main__":
+    # --- 1. コマンドライン引数解析 (--help はここで終了するため重いモジュールは未読み込み) ---
+    args = _build_parser().parse_args()
+
+    # --- 2. ロギング設定 (単体実行用) ---
+    import utils
+    # --- ▼▼▼ 修正 ▼▼▼ ---
+    # ログファイルのパスを MCP_SERVER_LOG_FILE に変更
+    # ヘッドレス実行 (バッチ用途) ではファイルへのログ書き込みをバッファリングしてシステムコールを削減
+    # --serve では標準出力を結果の受け渡しに使うため、コンソールへのログは標準エラーへ出す
+    with contextlib.redirect_stdout(sys.stderr if args.serve else sys.stdout):
+        utils.setup_logging_for_standalone(config.MCP_SERVER_LOG_FILE, buffered=args.headless)
+    # --- ▲▲▲ 修正 ▲▲▲ ---
+
+    if args.serve:
+        _install_event_loop_policy()
+        utils.ensure_directory(config.DEFAULT_SCREENSHOT_DIR)
+        try:
+            sys.exit(asyncio.run(_serve(args)))
+        except Exception as e:
+            logging.critical("serve モードで予期せぬエラーが発生: %s: %s", type(e).__name__, e, exc_info=args.debug)
+            sys.exit(1)
 
-        sys.exit(0 if success else 1)
+    # --- 3. 入力ファイルパス解決 ---
+    json_file_paths = _expand_input_paths(args.input, args.input_dir)
+    _prefetch_input_files(json_file_paths)
+
+    # イベントループの設定 (uvloop があれば使用)
+    _install_event_loop_policy()
 
-    except FileNotFoundError as e:
-         logging.critical(f"入力ファイル処理中にエラー: {e}")
+    # スクリーンショットディレクトリ作成
+    utils.ensure_directory(config.DEFAULT_SCREENSHOT_DIR)
+
+    # --- 4, 5. 実行と結果出力 (イベントループの作成はこの1回のみ) ---
+    try:
+        exit_code = asyncio.run(_amain(args, json_file_paths))
+    except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+         # 入力ファイルの不在・形式不正は原因が明確なため、スタックトレースは出力しない
+         logging.critical("入力ファイル処理中にエラー: %s", e)
          sys.exit(1)
     except Exception as e:
-        logging.critical(f"スクリプト実行の最上位で予期せぬエラーが発生: {e}", exc_info=True)
-        sys.exit(1)
\ No newline at end of file
+        # スタックトレースの整形は --debug 指定時のみ行う
+        logging.critical("スクリプト実行の最上位で予期せぬエラーが発生: %s: %s", type(e).__name__, e, exc_info=args.debug)
+        sys.exit(1)
+    sys.exit(exit_code)
@@ -3,14 +3,15 @@
 Playwrightの各アクション（クリック、入力、取得など）を実行するコアロジック。
 """
 import asyncio
+import functools
 import logging
 import os
 import time
-import pprint
 import traceback
 import re # <<< 正規表現モジュールをインポート
 from urllib.parse import urljoin, urlparse # <<< urlparse を追加
-from typing import List, Tuple, Optional, Union, Dict, Any, Set # <<< Set を追加
+from collections import deque
+from typing import List, Tuple, Optional, Union, Dict, Any, Set, Callable, Deque, Awaitable # <<< Set を追加
 
 from playwright.async_api import (
     Page,
@@ -25,8 +26,8 @@ from playwright.async_api import (
 
 import config
 import utils # PDF処理などで使用
-from playwright_finders import find_element_dynamically, find_all_elements_dynamically
-from playwright_helper_funcs import get_page_inner_text # get_page_inner_text は別途使用
+from playwright_finders import find_element_dynamically, find_all_elements_dynamically, invalidate_iframe_cache
+from playwright_helper_funcs import get_pages_inner_texts, acquire_pooled_page, release_pooled_page
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +37,7 @@ EMAIL_REGEX = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
 
 async def _extract_emails_from_page_async(context: BrowserContext, url: str, timeout: int) -> List[str]:
     """
-    指定されたURLに新しいページでアクセスし、ページのinnerTextとmailtoリンクからメールアドレスを抽出する。
+    指定されたURLに一時ページ (プールから再利用) でアクセスし、ページのinnerTextとmailtoリンクからメールアドレスを抽出する。
     重複を含むメールアドレスのリストを返す。失敗時は空リストを返す。
     """
     page = None
@@ -47,11 +48,12 @@ async def _extract_emails_from_page_async(context: BrowserContext, url: str, tim
     logger.info(f"URLからメール抽出開始: {url} (タイムアウト: {page_access_timeout}ms)")
 
     try:
-        page = await context.new_page()
+        page = await acquire_pooled_page(context) # 一時ページはプールから再利用
         # ナビゲーションタイムアウトを設定
         nav_timeout = max(int(page_access_timeout * 0.9), 10000)
         logger.debug(f"  Navigating to {url} with timeout {nav_timeout}ms")
-        await page.goto(url, wait_until="load", timeout=nav_timeout)
+        # メール抽出にはDOMの構築完了で十分なため、サブリソースの読み込み完了 (load) は待たない
+        await page.goto(url, wait_until="domcontentloaded", timeout=nav_timeout)
         logger.debug(f"  Navigation to {url} successful.")
 
         # ページ全体のテキストを取得 (タイムアウトは残り時間で)
@@ -70,29 +72,31 @@ async def _extract_emails_from_page_async(context: BrowserContext, url: str, tim
                 logger.debug(f"  Found {len(found_in_text)} potential emails in page text.")
                 emails_found.update(found_in_text) # Setに追加して重複排除
 
-        # mailto: リンクからメールアドレスを抽出
-        mailto_links = await page.locator("a[href^='mailto:']").all()
-        if mailto_links:
-            logger.debug(f"  Found {len(mailto_links)} mailto links.")
-            for link in mailto_links:
-                try:
-                    href = await link.get_attribute('href', timeout=500) # mailtoリンク取得は短時間で
-                    if href and href.startswith('mailto:'):
-                        # "mailto:" の部分と、?subject=...などのパラメータを除去
-                        email_part = href[len('mailto:'):].split('?')[0]
-                        if email_part:
-                             # URLデコードが必要な場合もあるが、まずはそのまま追加
-                             # 簡易バリデーション
-                             if EMAIL_REGEX.match(email_part):
-                                 emails_found.add(email_part)
-                                 logger.debug(f"    Extracted email from mailto: {email_part}")
-                             else:
-                                  logger.debug(f"    Skipping invalid mailto part: {email_part}")
-
-                except PlaywrightTimeoutError:
-                    logger.warning(f"  Timeout getting href from a mailto link on {url}")
-                except Exception as link_err:
-                    logger.warning(f"  Error processing a mailto link on {url}: {link_err}")
+        # mailto: リンクからメールアドレスを抽出 (href は1回の evaluate_all でまとめて取得)
+        try:
+            mailto_hrefs: List[Optional[str]] = await page.locator("a[href^='mailto:']").evaluate_all(
+                "els => els.map(e => e.getAttribute('href'))"
+            )
+        except PlaywrightTimeoutError:
+            logger.warning(f"  Timeout getting hrefs from mailto links on {url}")
+            mailto_hrefs = []
+        except Exception as link_err:
+            logger.warning(f"  Error processing mailto links on {url}: {link_err}")
+            mailto_hrefs = []
+        if mailto_hrefs:
+            logger.debug(f"  Found {len(mailto_hrefs)} mailto links.")
+            for href in mailto_hrefs:
+                if href and href.startswith('mailto:'):
+                    # "mailto:" の部分と、?subject=...などのパラメータを除去
+                    email_part = href[len('mailto:'):].split('?')[0]
+                    if email_part:
+                         # URLデコードが必要な場合もあるが、まずはそのまま追加
+                         # 簡易バリデーション
+                         if EMAIL_REGEX.match(email_part):
+                             emails_found.add(email_part)
+                             logger.debug(f"    Extracted email from mailto: {email_part}")
+                         else:
+                              logger.debug(f"    Skipping invalid mailto part: {email_part}")
 
         elapsed = (time.monotonic() - start_time) * 1000
         logger.info(f"メール抽出完了 ({url})。ユニーク候補数: {len(emails_found)} ({elapsed:.0f}ms)")
@@ -114,29 +118,388 @@ async def _extract_emails_from_page_async(context: BrowserContext, url: str, tim
     finally:
         if page and not page.is_closed():
             try:
-                await page.close()
-                logger.debug(f"メール抽出用一時ページ ({url}) を閉じました。")
+                await release_pooled_page(context, page)
+                logger.debug(f"メール抽出用一時ページ ({url}) をプールに返しました。")
             except Exception as close_e:
-                logger.warning(f"メール抽出用一時ページ ({url}) クローズ中にエラー (無視): {close_e}")
+                logger.warning(f"メール抽出用一時ページ ({url}) の返却中にエラー (無視): {close_e}")
 # --- ▲▲▲ 追加 ▲▲▲ ---
 
 
+# スクリーンショットのファイル名に使えない文字 (英数字・'_'・'.'・'-' 以外) を除去する正規表現
+_SCREENSHOT_FILENAME_STRIP = re.compile(r"[^\w.\-]+")
+
+# 既に絶対URLであるhrefは urljoin/urlparse を通さずにそのまま使う (リンク数が多い場合のURL解析コスト削減)
+_ABSOLUTE_HTTP_PREFIXES = ('http://', 'https://')
+_HTTP_SCHEMES = frozenset({'http', 'https'})
+
+@functools.lru_cache(maxsize=8192)
+def _join_url(base_url: str, href: str) -> str:
+    """urljoin の結果をキャッシュする (メニューやページ送りなど、同じ相対hrefはステップをまたいで何度も現れるため)。"""
+    return urljoin(base_url, href)
+
+def _to_absolute_url(base_url: str, href: str) -> str:
+    """hrefを絶対URLに変換する。http(s)で始まる場合はそのまま返す。"""
+    if href.startswith(_ABSOLUTE_HTTP_PREFIXES):
+        return href
+    return _join_url(base_url, href)
+
+def _is_pdf_url(url: str) -> bool:
+    """URLが .pdf で終わるか (大文字小文字を区別しない)。"""
+    return url[-4:].lower() == '.pdf'
+
+
+# 一括取得に失敗した場合の要素ごとの取得タイムアウト (見つかっている要素の属性読み取りは通常すぐ終わるため短め)
+_PER_ELEMENT_FALLBACK_TIMEOUT_MS = 500
+
+async def _evaluate_all_by_scope(
+    found_elements_list: List[Tuple[Locator, Union[Page, FrameLocator]]],
+    selector: str,
+    expression: str,
+    arg: Any,
+    timeout: int,
+    label: str,
+    per_element: Callable[[Locator, int], Awaitable[Optional[str]]]
+) -> List[Optional[str]]:
+    """
+    動的探索で見つかった要素群に対し、スコープごとに1回の evaluate_all で値をまとめて取得する。
+    要素ごとの取得 (要素数ぶんのCDP往復) を避けるため。結果は探索順に並ぶ。
+    evaluate_all 自体が失敗した場合 (タイムアウト以外) は、そのスコープだけ per_element による要素ごとの取得に切り替える
+    (要素ごとのタイムアウトは短くし、スコープ全体でも timeout で打ち切る)。
+    スコープ単位でタイムアウトした場合、そのスコープの要素数ぶんエラーメッセージ文字列を入れる。
+    """
+    # find_all_elements_dynamically はスコープごとに連続して要素を返すため、出現順にグループ化する
+    scopes_in_order: List[Union[Page, FrameLocator]] = []
+    locators_by_scope: Dict[int, List[Locator]] = {}
+    for locator, scope in found_elements_list:
+        scope_id = id(scope)
+        if scope_id not in locators_by_scope:
+            scopes_in_order.append(scope)
+            locators_by_scope[scope_id] = []
+        locators_by_scope[scope_id].append(locator)
+
+    element_timeout = min(timeout, _PER_ELEMENT_FALLBACK_TIMEOUT_MS)
+
+    async def get_one(locator: Locator) -> Optional[str]:
+        try:
+            return await per_element(locator, element_timeout)
+        except PlaywrightTimeoutError:
+            return f"Error: Timeout getting {label}"
+        except Exception as e:
+            return f"Error: {type(e).__name__} getting {label}"
+
+    async def evaluate_scope(scope: Union[Page, FrameLocator]) -> List[Optional[str]]:
+        scope_locators = locators_by_scope[id(scope)]
+        count = len(scope_locators)
+        try:
+            # evaluate_all 自体にはタイムアウト指定がないため、全体で打ち切る
+            values = await asyncio.wait_for(scope.locator(selector).evaluate_all(expression, arg), timeout=timeout / 1000)
+            # 探索時の件数上限を超えた分は捨て、found_elements_list と位置を揃える
+            return values[:count]
+        except (asyncio.TimeoutError, PlaywrightTimeoutError):
+            logger.warning(f"  スコープ '{type(scope).__name__}' での{label}一括取得タイムアウト ({timeout}ms)。")
+            return [f"Error: Timeout getting {label}"] * count
+        except Exception as e:
+            logger.warning(f"  スコープ '{type(scope).__name__}' での{label}一括取得中にエラー: {type(e).__name__}。要素ごとの取得に切り替えます。")
+            element_tasks = [asyncio.create_task(get_one(locator)) for locator in scope_locators]
+            # 要素ごとの取得もスコープ全体で timeout までに打ち切り、終わらなかった分はタイムアウト扱いにする
+            _, pending = await asyncio.wait(element_tasks, timeout=timeout / 1000)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            return [task.result() if task not in pending else f"Error: Timeout getting {label}" for task in element_tasks]
+
+    async with asyncio.TaskGroup() as scope_group:
+        scope_tasks = [scope_group.create_task(evaluate_scope(scope)) for scope in scopes_in_order]
+    return [value for task in scope_tasks for value in task.result()]
+
+
+async def _get_attribute_values_by_scope(
+    found_elements_list: List[Tuple[Locator, Union[Page, FrameLocator]]],
+    selector: str,
+    attr_name: str,
+    timeout: int
+) -> List[Optional[str]]:
+    """要素群の属性値をスコープごとに一括取得する。"""
+    return await _evaluate_all_by_scope(
+        found_elements_list, selector, "(els, name) => els.map(e => e.getAttribute(name))",
+        attr_name, timeout, f"attribute '{attr_name}'",
+        lambda locator, element_timeout: locator.get_attribute(attr_name, timeout=element_timeout)
+    )
+
+
+async def _get_text_contents_by_scope(
+    found_elements_list: List[Tuple[Locator, Union[Page, FrameLocator]]],
+    selector: str,
+    timeout: int
+) -> List[Optional[str]]:
+    """要素群の textContent (前後空白除去済み) をスコープごとに一括取得する。"""
+    async def text_content_of(locator: Locator, element_timeout: int) -> Optional[str]:
+        return ((await locator.text_content(timeout=element_timeout)) or '').strip()
+
+    return await _evaluate_all_by_scope(
+        found_elements_list, selector, "els => els.map(e => (e.textContent || '').trim())",
+        None, timeout, "textContent", text_content_of
+    )
+
+
+# --- 状態を変更しない単一要素アクションのハンドラ ---
+# 各ハンドラは (要素, ステップ定義, タイムアウト, 結果詳細) を受け取り、結果詳細を更新する
+
+async def _do_input(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    value = step_data.get("value")
+    if not element: raise ValueError("Input action requires an element.")
+    if value is None: raise ValueError("Input action requires 'value'.")
+    input_value_str = str(value)
+    logger.info(f"要素に '{input_value_str[:50]}{'...' if len(input_value_str) > 50 else ''}' を入力します...")
+    # fill: 要素の内容をクリアしてから入力する
+    await element.fill(input_value_str, timeout=action_wait_time)
+    logger.info("入力が成功しました。")
+    details["value"] = value # 結果には元の値を保持
+
+async def _do_hover(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    if not element: raise ValueError("Hover action requires an element.")
+    logger.info("要素にマウスオーバーします...")
+    await element.hover(timeout=action_wait_time)
+    logger.info("ホバーが成功しました。")
+
+async def _do_get_inner_text(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    if not element: raise ValueError("Get innerText action requires an element.")
+    logger.info("要素の innerText を取得します...")
+    text = await element.inner_text(timeout=action_wait_time)
+    text = text.strip() if text else "" # 前後の空白除去
+    logger.info(f"取得テキスト(innerText): '{text[:100]}{'...' if len(text) > 100 else ''}'") # 長いテキストは省略
+    details["text"] = text
+
+async def _do_get_text_content(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    if not element: raise ValueError("Get textContent action requires an element.")
+    logger.info("要素の textContent を取得します...")
+    text = await element.text_content(timeout=action_wait_time)
+    text = text.strip() if text else "" # 前後の空白を除去
+    logger.info(f"取得テキスト(textContent): '{text[:100]}{'...' if len(text) > 100 else ''}'")
+    details["text"] = text
+
+async def _do_get_inner_html(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    if not element: raise ValueError("Get innerHTML action requires an element.")
+    logger.info("要素の innerHTML を取得します...")
+    html_content = await element.inner_html(timeout=action_wait_time)
+    logger.info(f"取得HTML(innerHTML):\n{html_content[:500]}{'...' if len(html_content) > 500 else ''}") # 先頭のみ表示
+    details["html"] = html_content
+
+async def _do_wait_visible(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    # 要素探索自体が required_state='visible' で行われているため、
+    # ここに到達した時点で要素は可視のはず。ログのみ。
+    if not element: raise ValueError("Wait visible action requires an element.")
+    logger.info("要素が表示されていることを確認しました (動的探索時に確認済み)。")
+
+_SELECT_OPTION_TYPES = frozenset({'value', 'index', 'label'})
+
+async def _do_select_option(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    option_type = step_data.get("option_type")
+    option_value = step_data.get("option_value")
+    if not element: raise ValueError("Select option action requires an element.")
+    if option_type not in _SELECT_OPTION_TYPES or option_value is None:
+        raise ValueError("Invalid 'option_type' or 'option_value' for select_option action.")
+    logger.info(f"ドロップダウンを選択します (Type: {option_type}, Value: '{option_value}')...")
+    # select_option は内部で要素が選択可能になるのを待つ
+    if option_type == 'value':
+        await element.select_option(value=str(option_value), timeout=action_wait_time)
+    elif option_type == 'index':
+        try: index_val = int(option_value)
+        except (ValueError, TypeError): raise ValueError("Option type 'index' requires an integer value.")
+        await element.select_option(index=index_val, timeout=action_wait_time)
+    elif option_type == 'label':
+        await element.select_option(label=str(option_value), timeout=action_wait_time)
+    logger.info("ドロップダウンの選択が成功しました。")
+    details.update({"option_type": option_type, "option_value": option_value})
+
+async def _do_scroll_to_element(element: Optional[Locator], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    if not element: raise ValueError("Scroll action requires an element.")
+    logger.info("要素が表示されるまでスクロールします...")
+    # scroll_into_view_if_needed は要素がビューポートに入るようにスクロールする
+    await element.scroll_into_view_if_needed(timeout=action_wait_time)
+    await asyncio.sleep(0.3) # スクロール後の安定待ち
+    logger.info("要素へのスクロールが成功しました。")
+
+_ELEMENT_ACTION_HANDLERS: Dict[str, Callable[[Optional[Locator], Dict[str, Any], int, Dict[str, Any]], Awaitable[None]]] = {
+    "input": _do_input,
+    "hover": _do_hover,
+    "get_inner_text": _do_get_inner_text,
+    "get_text_content": _do_get_text_content,
+    "get_inner_html": _do_get_inner_html,
+    "wait_visible": _do_wait_visible,
+    "select_option": _do_select_option,
+    "scroll_to_element": _do_scroll_to_element,
+}
+
+# --- 複数要素アクションのハンドラ ---
+# (動的探索で見つかった要素とスコープのリスト, ステップ定義, タイムアウト, 結果詳細) を受け取る
+
+async def _do_get_all_text_contents(found_elements_list: List[Tuple[Locator, Union[Page, FrameLocator]]], step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    selector = step_data.get("selector")
+    if not selector: raise ValueError("Action 'get_all_text_contents' requires 'selector'.")
+    text_list: List[Optional[str]] = []
+    if not found_elements_list:
+        logger.warning(f"動的探索で要素 '{selector}' が見つからなかったため、テキスト取得をスキップします。")
+        details["results_count"] = 0
+    else:
+        num_found = len(found_elements_list)
+        logger.info(f"動的探索で見つかった {num_found} 個の要素から textContent を取得します。")
+        # スコープごとに1回の evaluate_all で textContent をまとめて取得
+        text_list = await _get_text_contents_by_scope(found_elements_list, selector, action_wait_time)
+        logger.info(f"取得したテキストリスト ({len(text_list)}件)")
+        details["results_count"] = len(text_list)
+    details["text_list"] = text_list
+
+_ELEMENT_LIST_ACTION_HANDLERS: Dict[str, Callable[[List[Tuple[Locator, Union[Page, FrameLocator]]], Dict[str, Any], int, Dict[str, Any]], Awaitable[None]]] = {
+    "get_all_text_contents": _do_get_all_text_contents,
+}
+
+# --- ページ全体操作のハンドラ ---
+# (ルートページ, ステップ定義, タイムアウト, 結果詳細) を受け取る
+
+async def _do_wait_page_load(page: Page, step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    logger.info("ページの読み込み完了 (load) を待ちます...")
+    await page.wait_for_load_state("load", timeout=action_wait_time)
+    invalidate_iframe_cache() # 読み込み後はiframe構成が変わり得る
+    logger.info("ページの読み込みが完了しました。")
+
+async def _do_sleep(page: Page, step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    value = step_data.get("value")
+    try:
+        seconds = float(value) if value is not None else 1.0 # デフォルト1秒
+        if seconds < 0: raise ValueError("Sleep time cannot be negative.")
+    except (TypeError, ValueError):
+        raise ValueError("Invalid value for sleep action. Must be a non-negative number (seconds).")
+    logger.info(f"{seconds:.1f} 秒待機します...")
+    await asyncio.sleep(seconds)
+    details["duration_sec"] = seconds
+
+async def _do_scroll_page_to_bottom(page: Page, step_data: Dict[str, Any], action_wait_time: int, details: Dict[str, Any]) -> None:
+    logger.info("ページ最下部へスクロールします...")
+    # JavaScriptを実行してスクロール
+    await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
+    await asyncio.sleep(0.5) # スクロール後の描画やイベント発生を少し待つ
+    logger.info("ページ最下部へのスクロールが完了しました。")
+
+_PAGE_ACTION_HANDLERS: Dict[str, Callable[[Page, Dict[str, Any], int, Dict[str, Any]], Awaitable[None]]] = {
+    "wait_page_load": _do_wait_page_load,
+    "sleep": _do_sleep,
+    "scroll_page_to_bottom": _do_scroll_page_to_bottom,
+}
+
+# --- アクションの分類 (ステップごとに作り直さないようモジュールレベルで定義) ---
+_PAGE_ACTIONS = frozenset(_PAGE_ACTION_HANDLERS)
+# アクションが単一要素を必要とするか、複数要素を対象とするか
+_SINGLE_ELEMENT_ACTIONS = frozenset({"click", "input", "hover", "get_inner_text", "get_text_content", "get_inner_html", "get_attribute", "wait_visible", "select_option", "scroll_to_element", "download_pdf"})
+_MULTIPLE_ELEMENT_ACTIONS = frozenset({"get_all_attributes", "get_all_text_contents"})
+# 要素が可視になるまで探索するアクション (それ以外の読み取り系は attached)
+# 操作系は可視の要素が見つかるまで iframe を探索する (上位ドキュメントの非表示の同名要素で探索を打ち切らない)
+_VISIBLE_STATE_ACTIONS = frozenset({'click', 'hover', 'screenshot', 'select_option', 'input', 'wait_visible', 'scroll_to_element'})
+# get_all_attributes で href を取得してURLとして扱う特殊モード
+_HREF_ATTRIBUTE_MODES = frozenset({'href', 'pdf', 'content', 'mail'})
+# 特殊モードごとに url_list 以外で結果へ含めるキー
+_ATTRIBUTE_MODE_RESULT_KEYS = {'pdf': 'pdf_texts', 'content': 'scraped_texts', 'mail': 'extracted_emails'}
+_KNOWN_ACTIONS = _PAGE_ACTIONS | _SINGLE_ELEMENT_ACTIONS | _MULTIPLE_ELEMENT_ACTIONS | frozenset({"screenshot", "switch_to_iframe", "switch_to_parent_frame"})
+
+
+class _NotifyingResultList(list):
+    """append されたステップ結果を即座にコールバックへ通知するリスト (結果のストリーミング用)。"""
+    def __init__(self, on_append: Callable[[Dict[str, Any]], None]):
+        super().__init__()
+        self._on_append = on_append
+
+    def append(self, item: Dict[str, Any]) -> None:
+        super().append(item)
+        self._on_append(item)
+
+
+# エラー時のスクリーンショットの保存を待つ上限 (エラー結果を返すまでの時間を長く延ばさない)
+_ERROR_SCREENSHOT_TIMEOUT_MS = 5000
+
+
+async def _save_error_screenshot(page: Page, path: str) -> Optional[str]:
+    """エラー発生時のフルページスクリーンショットを保存し、保存先パスを返す (失敗・タイムアウト時は None)。"""
+    async def capture_and_write() -> None:
+        error_ss_bytes = await page.screenshot(full_page=True, timeout=_ERROR_SCREENSHOT_TIMEOUT_MS)
+        await utils.write_bytes_to_file_async(path, error_ss_bytes)
+
+    try:
+        utils.ensure_directory(config.DEFAULT_SCREENSHOT_DIR)
+        await asyncio.wait_for(capture_and_write(), timeout=_ERROR_SCREENSHOT_TIMEOUT_MS / 1000)
+        logger.info(f"エラー発生時のスクリーンショットを保存しました: {path}")
+        return path
+    except Exception as ss_e:
+        logger.error(f"エラー発生時のスクリーンショット保存に失敗しました: {type(ss_e).__name__} - {ss_e}")
+        return None
+
+
+async def _resolve_deferred_pdf_texts(deferred_pdf_tasks: List[Tuple[Dict[str, Any], asyncio.Task]]) -> None:
+    """後回しにしたPDFのダウンロード・抽出の完了を待ち、各ステップの結果に pdf_text を書き込む。"""
+    if not deferred_pdf_tasks:
+        return
+    logger.info(f"バックグラウンドで処理中のPDF {len(deferred_pdf_tasks)} 件の完了を待ちます...")
+    pdf_texts = await asyncio.gather(*(task for _, task in deferred_pdf_tasks), return_exceptions=True)
+    for (details, _), pdf_text in zip(deferred_pdf_tasks, pdf_texts):
+        if isinstance(pdf_text, BaseException):
+            logger.error(f"  PDF処理中にエラーが発生しました (URL: '{details.get('value')}'): {type(pdf_text).__name__} - {pdf_text}")
+            pdf_text = f"Error processing URL or PDF: {pdf_text}"
+        elif isinstance(pdf_text, str) and pdf_text.startswith("Error:"):
+            logger.error(f"  PDFテキスト抽出エラー: {pdf_text}")
+        details["pdf_text"] = pdf_text
+
+
 async def execute_actions_async(
     initial_page: Page,
     actions: List[Dict[str, Any]],
     api_request_context: APIRequestContext,
-    default_timeout: int
+    default_timeout: int,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
 ) -> Tuple[bool, List[Dict[str, Any]]]:
     """
     指定されたページを起点として、定義されたアクションリストを順に実行します。
     iframeの探索や切り替え、データ取得、エラーハンドリングなどを行います。
     実行全体の成否 (bool) と、各ステップの結果詳細のリスト (List[dict]) を返します。
+    on_result を指定すると、各ステップの結果が確定した時点でその結果を渡して呼び出します。
+    on_result を指定しない場合、get_attribute でのPDF処理はバックグラウンドで行い、後続のステップと並行させます
+    (結果の pdf_text は戻る前に埋められます)。
     """
-    results: List[Dict[str, Any]] = []
+    deferred_pdf_tasks: List[Tuple[Dict[str, Any], asyncio.Task]] = []
+    try:
+        outcome = await _execute_actions(initial_page, actions, api_request_context, default_timeout, on_result, deferred_pdf_tasks)
+    except BaseException:
+        # 中断された場合、バックグラウンドのPDF処理も打ち切る
+        for _, task in deferred_pdf_tasks:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in deferred_pdf_tasks), return_exceptions=True)
+        raise
+    await _resolve_deferred_pdf_texts(deferred_pdf_tasks)
+    return outcome
+
+
+async def _execute_actions(
+    initial_page: Page,
+    actions: List[Dict[str, Any]],
+    api_request_context: APIRequestContext,
+    default_timeout: int,
+    on_result: Optional[Callable[[Dict[str, Any]], None]],
+    deferred_pdf_tasks: List[Tuple[Dict[str, Any], asyncio.Task]]
+) -> Tuple[bool, List[Dict[str, Any]]]:
+    """execute_actions_async の本体。後回しにしたPDF処理は deferred_pdf_tasks に (結果詳細, タスク) として追加する。"""
+    results: List[Dict[str, Any]] = _NotifyingResultList(on_result) if on_result else []
     current_target: Union[Page, FrameLocator] = initial_page # 現在の操作対象スコープ
     root_page: Page = initial_page # ルートとなるページオブジェクト (ページ遷移後も更新)
     current_context: BrowserContext = root_page.context # 現在のブラウザコンテキスト
-    iframe_stack: List[Union[Page, FrameLocator]] = [] # iframe切り替えのためのスタック
+    iframe_stack: Deque[Union[Page, FrameLocator]] = deque() # iframe切り替えのためのスタック
+    iframe_stack_ids: Set[int] = set() # スタック内スコープのID (重複チェック用)
+    # ログレベルで出力されないログのための文字列組み立て・通信を省略する
+    info_enabled = logger.isEnabledFor(logging.INFO)
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    # 後回しにしたPDF処理のURLごとのタスク (同じPDFへのリンクを複数のステップで取得しても、ダウンロードは1回だけ行う)
+    deferred_pdf_task_by_url: Dict[str, asyncio.Task] = {}
+    # ログ用のページタイトル。ルートページとURLが前回と同じ間は再取得しない
+    title_cache_key: Optional[Tuple[Page, str]] = None
+    root_page_title = ""
 
     for i, step_data in enumerate(actions):
         step_num = i + 1
@@ -150,13 +513,14 @@ async def execute_actions_async(
         # アクション固有タイムアウト > 全体デフォルトタイムアウト > configデフォルト
         action_wait_time = step_data.get("wait_time_ms", default_timeout)
 
-        logger.info(f"--- ステップ {step_num}/{len(actions)}: Action='{action}' ---")
-        step_info = {"selector": selector, "value": value, "iframe(指定)": iframe_selector_input,
-                     "option_type": option_type, "option_value": option_value, "attribute_name": attribute_name}
-        # Noneでない値だけをログに出力
-        step_info_str = ", ".join([f"{k}='{str(v)[:50]}{'...' if len(str(v)) > 50 else ''}'" # 値が長い場合は省略
-                                   for k, v in step_info.items() if v is not None])
-        logger.info(f"詳細: {step_info_str} (timeout: {action_wait_time}ms)")
+        if info_enabled:
+            logger.info(f"--- ステップ {step_num}/{len(actions)}: Action='{action}' ---")
+            step_info = {"selector": selector, "value": value, "iframe(指定)": iframe_selector_input,
+                         "option_type": option_type, "option_value": option_value, "attribute_name": attribute_name}
+            # Noneでない値だけをログに出力
+            step_info_str = ", ".join([f"{k}='{str(v)[:50]}{'...' if len(str(v)) > 50 else ''}'" # 値が長い場合は省略
+                                       for k, v in step_info.items() if v is not None])
+            logger.info(f"詳細: {step_info_str} (timeout: {action_wait_time}ms)")
 
         try:
             # 各ステップ開始前にページが閉じられていないか確認
@@ -164,10 +528,12 @@ async def execute_actions_async(
                 raise PlaywrightError(f"Root page was closed before step {step_num}.")
             # 現在の状態をログ出力
             current_base_url = root_page.url
-            root_page_title = await root_page.title()
-            current_target_type = type(current_target).__name__
-            logger.info(f"現在のルートページ: URL='{current_base_url}', Title='{root_page_title}'")
-            logger.info(f"現在の探索スコープ: {current_target_type}")
+            if info_enabled: # タイトル取得はログ専用の通信なので、INFOが無効なら行わない
+                if title_cache_key != (root_page, current_base_url): # ページ切替・遷移時のみ取得し直す
+                    root_page_title = await root_page.title()
+                    title_cache_key = (root_page, current_base_url)
+                logger.info(f"現在のルートページ: URL='{current_base_url}', Title='{root_page_title}'")
+                logger.info(f"現在の探索スコープ: {type(current_target).__name__}")
         except Exception as e:
             logger.error(f"ステップ {step_num} 開始前の状態取得中にエラー: {e}", exc_info=True)
             results.append({"step": step_num, "status": "error", "action": action, "message": f"Failed to get target info before step: {e}"})
@@ -192,8 +558,10 @@ async def execute_actions_async(
                     raise PlaywrightError(f"Iframe '{iframe_selector_input}' への切り替え中に予期せぬエラーが発生しました: {e}")
 
                 # 切り替え成功
-                if id(current_target) not in [id(s) for s in iframe_stack]: # 現在のターゲットがまだスタックになければ追加
+                invalidate_iframe_cache()
+                if id(current_target) not in iframe_stack_ids: # 現在のターゲットがまだスタックになければ追加
                     iframe_stack.append(current_target)
+                    iframe_stack_ids.add(id(current_target))
                 current_target = target_frame_locator # ターゲットを新しい FrameLocator に更新
                 logger.info(f"FrameLocator '{iframe_selector_input}' への切り替え成功。")
                 results.append({"step": step_num, "status": "success", "action": action, "selector": iframe_selector_input})
@@ -210,35 +578,19 @@ async def execute_actions_async(
                 else:
                     logger.info("[ユーザー指定] 親ターゲットに戻ります...")
                     current_target = iframe_stack.pop() # スタックから親ターゲットを取り出す
+                    iframe_stack_ids.discard(id(current_target))
                     target_type = type(current_target).__name__
                     logger.info(f"親ターゲットへの切り替え成功。現在の探索スコープ: {target_type}")
                     results.append({"step": step_num, "status": "success", "action": action})
                 continue # 次のステップへ
 
 
-            # --- ページ全体操作 ---
-            if action in ["wait_page_load", "sleep", "scroll_page_to_bottom"]:
-                if action == "wait_page_load":
-                    logger.info("ページの読み込み完了 (load) を待ちます...")
-                    await root_page.wait_for_load_state("load", timeout=action_wait_time)
-                    logger.info("ページの読み込みが完了しました。")
-                    results.append({"step": step_num, "status": "success", "action": action})
-                elif action == "sleep":
-                    try:
-                        seconds = float(value) if value is not None else 1.0 # デフォルト1秒
-                        if seconds < 0: raise ValueError("Sleep time cannot be negative.")
-                    except (TypeError, ValueError):
-                        raise ValueError("Invalid value for sleep action. Must be a non-negative number (seconds).")
-                    logger.info(f"{seconds:.1f} 秒待機します...")
-                    await asyncio.sleep(seconds)
-                    results.append({"step": step_num, "status": "success", "action": action, "duration_sec": seconds})
-                elif action == "scroll_page_to_bottom":
-                    logger.info("ページ最下部へスクロールします...")
-                    # JavaScriptを実行してスクロール
-                    await root_page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-                    await asyncio.sleep(0.5) # スクロール後の描画やイベント発生を少し待つ
-                    logger.info("ページ最下部へのスクロールが完了しました。")
-                    results.append({"step": step_num, "status": "success", "action": action})
+            # --- ページ全体操作 (ハンドラ表で処理) ---
+            page_action_handler = _PAGE_ACTION_HANDLERS.get(action)
+            if page_action_handler is not None:
+                page_result_details: Dict[str, Any] = {"step": step_num, "status": "success", "action": action}
+                await page_action_handler(root_page, step_data, action_wait_time, page_result_details)
+                results.append(page_result_details)
                 continue # 次のステップへ
 
 
@@ -247,20 +599,17 @@ async def execute_actions_async(
             found_elements_list: List[Tuple[Locator, Union[Page, FrameLocator]]] = [] # 複数要素操作用
             found_scope: Optional[Union[Page, FrameLocator]] = None # 要素が見つかったスコープ
 
-            # アクションが単一要素を必要とするか、複数要素を対象とするか
-            single_element_required_actions = ["click", "input", "hover", "get_inner_text", "get_text_content", "get_inner_html", "get_attribute", "wait_visible", "select_option", "scroll_to_element"]
-            multiple_elements_actions = ["get_all_attributes", "get_all_text_contents"]
             # スクリーンショットはセレクターがあれば単一要素、なければページ全体
             is_screenshot_element = action == "screenshot" and selector is not None
 
-            if action in single_element_required_actions or action in multiple_elements_actions or is_screenshot_element:
+            if action in _SINGLE_ELEMENT_ACTIONS or action in _MULTIPLE_ELEMENT_ACTIONS or is_screenshot_element:
                 if not selector:
                     raise ValueError(f"Action '{action}' requires a 'selector'.")
 
                 # --- 要素探索 ---
-                if action in single_element_required_actions or is_screenshot_element:
+                if action in _SINGLE_ELEMENT_ACTIONS or is_screenshot_element:
                     # 探索する要素の状態を決定
-                    required_state = 'visible' if action in ['click', 'hover', 'screenshot', 'select_option', 'input', 'wait_visible', 'scroll_to_element'] else 'attached'
+                    required_state = 'visible' if action in _VISIBLE_STATE_ACTIONS else 'attached'
                     logger.info(f"単一要素 '{selector}' (状態: {required_state}) を動的に探索します...")
                     element, found_scope = await find_element_dynamically(
                         current_target, selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=action_wait_time, target_state=required_state
@@ -277,15 +626,20 @@ async def execute_actions_async(
                         found_scope_type = type(found_scope).__name__
                         logger.info(f"要素発見スコープ({found_scope_type})が現在のスコープ({type(current_target).__name__})と異なるため、探索スコープを更新します。")
                         # スタック管理: 現在のターゲットをスタックに追加 (重複回避)
-                        if id(current_target) not in [id(s) for s in iframe_stack]:
+                        if id(current_target) not in iframe_stack_ids:
                             iframe_stack.append(current_target)
+                            iframe_stack_ids.add(id(current_target))
                         current_target = found_scope
                     logger.info(f"最終的な単一操作対象スコープ: {type(current_target).__name__}")
 
-                elif action in multiple_elements_actions:
+                elif action in _MULTIPLE_ELEMENT_ACTIONS:
                     logger.info(f"複数要素 '{selector}' を動的に探索します...")
+                    max_results = step_data.get("max_results")
+                    if max_results is not None and (not isinstance(max_results, int) or isinstance(max_results, bool) or max_results <= 0):
+                        raise ValueError("'max_results' must be a positive integer.")
                     found_elements_list = await find_all_elements_dynamically(
-                        current_target, selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=action_wait_time
+                        current_target, selector, max_depth=config.DYNAMIC_SEARCH_MAX_DEPTH, timeout=action_wait_time,
+                        max_results=max_results
                     )
                     if not found_elements_list:
                         # 複数要素が見つからなくてもエラーとはせず、警告ログに留め、後続処理で空リストとして扱う
@@ -294,89 +648,77 @@ async def execute_actions_async(
 
 
             # --- 各アクション実行 ---
-            action_result_details = {"selector": selector} if selector else {} # 結果にセレクター情報を含める
-
-            if action == "click":
+            # 成功時の結果辞書をそのまま組み立て、最後に results へ追加する (展開によるコピーを避ける)
+            action_result_details: Dict[str, Any] = {"step": step_num, "status": "success", "action": action}
+            if selector:
+                action_result_details["selector"] = selector # 結果にセレクター情報を含める
+
+            # 状態 (スコープ・ページ) を変更しない要素アクションはハンドラ表で処理
+            element_action_handler = _ELEMENT_ACTION_HANDLERS.get(action)
+            element_list_action_handler = _ELEMENT_LIST_ACTION_HANDLERS.get(action)
+            if element_action_handler is not None:
+                await element_action_handler(element, step_data, action_wait_time, action_result_details)
+                results.append(action_result_details)
+            elif element_list_action_handler is not None:
+                await element_list_action_handler(found_elements_list, step_data, action_wait_time, action_result_details)
+                results.append(action_result_details)
+
+            elif action == "click":
                 if not element: raise ValueError("Click action requires an element, but it was not found.")
                 logger.info("要素をクリックします...")
-                context_for_click = root_page.context # 新しいページが開くイベントはルートページのコンテキストで捕捉
                 new_page: Optional[Page] = None
                 try:
-                    # 新しいページが開く可能性を考慮して待機 (タイムアウトは短めに設定)
-                    async with context_for_click.expect_page(timeout=config.NEW_PAGE_EVENT_TIMEOUT) as new_page_info:
-                        await element.click(timeout=action_wait_time)
-                    # タイムアウト内に新しいページが開いた場合
-                    new_page = await new_page_info.value
-                    new_page_url = new_page.url
-                    logger.info(f"クリックにより新しいページが開きました: URL={new_page_url}")
+                    # 新しいページの発生をクリック前から監視し、クリック後は NEW_PAGE_CLICK_GRACE_MS まで待つ
+                    # (ステップの opens_new_page が true なら監視の上限まで、false なら待たない)
+                    # 監視自体のタイムアウトはクリック時間を含めた上限で、待機を終えた時点でキャンセルされる
+                    # 新しいページが開くイベントはルートページのコンテキスト (current_context で追跡済み) で捕捉
+                    new_page_task = asyncio.create_task(
+                        current_context.wait_for_event("page", timeout=action_wait_time + config.NEW_PAGE_EVENT_TIMEOUT)
+                    )
                     try:
-                        # 新しいページのロード完了を待つ (タイムアウトはアクション固有時間)
-                        await new_page.wait_for_load_state("load", timeout=action_wait_time)
-                        logger.info("新しいページのロードが完了しました。")
-                    except PlaywrightTimeoutError:
-                        logger.warning(f"新しいページのロード待機がタイムアウトしました ({action_wait_time}ms)。処理は続行します。")
-                    # 操作対象を新しいページに切り替え、iframeスタックをクリア
-                    root_page = new_page
-                    current_target = new_page
-                    current_context = new_page.context
-                    iframe_stack.clear()
-                    logger.info("スコープを新しいページにリセットしました。iframeスタックもクリアされました。")
-                    action_result_details.update({"new_page_opened": True, "new_page_url": new_page_url})
-                    results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-                except PlaywrightTimeoutError:
-                    # expect_pageがタイムアウトした場合 (新しいページが開かなかった場合)
-                    logger.info(f"クリックは完了しましたが、{config.NEW_PAGE_EVENT_TIMEOUT}ms 以内に新しいページは開きませんでした。")
-                    action_result_details["new_page_opened"] = False
-                    results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
+                        await element.click(timeout=action_wait_time)
+                        invalidate_iframe_cache() # クリックでDOM (iframe構成) が変わり得る
+                        opens_new_page = step_data.get("opens_new_page")
+                        if opens_new_page:
+                            new_page_wait_sec = None # 監視タスク自体のタイムアウトまで待つ
+                        else:
+                            new_page_wait_sec = 0 if opens_new_page is False else config.NEW_PAGE_CLICK_GRACE_MS / 1000
+                        done, _ = await asyncio.wait({new_page_task}, timeout=new_page_wait_sec)
+                        if new_page_task in done and new_page_task.exception() is None:
+                            new_page = new_page_task.result()
+                    finally:
+                        if not new_page_task.done():
+                            new_page_task.cancel()
+                        await asyncio.gather(new_page_task, return_exceptions=True)
+
+                    if new_page is not None:
+                        # 待機中に新しいページが開いた場合
+                        new_page_url = new_page.url
+                        logger.info(f"クリックにより新しいページが開きました: URL={new_page_url}")
+                        try:
+                            # 新しいページのロード完了を待つ (タイムアウトはアクション固有時間)
+                            await new_page.wait_for_load_state("load", timeout=action_wait_time)
+                            logger.info("新しいページのロードが完了しました。")
+                        except PlaywrightTimeoutError:
+                            logger.warning(f"新しいページのロード待機がタイムアウトしました ({action_wait_time}ms)。処理は続行します。")
+                        # 操作対象を新しいページに切り替え、iframeスタックをクリア
+                        root_page = new_page
+                        current_target = new_page
+                        current_context = new_page.context
+                        iframe_stack.clear()
+                        iframe_stack_ids.clear()
+                        logger.info("スコープを新しいページにリセットしました。iframeスタックもクリアされました。")
+                        action_result_details.update({"new_page_opened": True, "new_page_url": new_page_url})
+                    else:
+                        # 新しいページが開かなかった場合
+                        logger.info("クリックは完了しましたが、新しいページは開きませんでした。")
+                        action_result_details["new_page_opened"] = False
+                    results.append(action_result_details)
                 except Exception as click_err:
                     # クリック自体が失敗した場合など
                     logger.error(f"クリック操作中に予期せぬエラーが発生しました: {click_err}", exc_info=True)
                     raise click_err # エラーを再送出してステップ全体のエラーハンドリングに任せる
 
-            elif action == "input":
-                 if not element: raise ValueError("Input action requires an element.")
-                 if value is None: raise ValueError("Input action requires 'value'.")
-                 input_value_str = str(value)
-                 logger.info(f"要素に '{input_value_str[:50]}{'...' if len(input_value_str) > 50 else ''}' を入力します...")
-                 # fill: 要素の内容をクリアしてから入力する
-                 await element.fill(input_value_str, timeout=action_wait_time)
-                 logger.info("入力が成功しました。")
-                 action_result_details["value"] = value # 結果には元の値を保持
-                 results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
-            elif action == "hover":
-                 if not element: raise ValueError("Hover action requires an element.")
-                 logger.info("要素にマウスオーバーします...")
-                 await element.hover(timeout=action_wait_time)
-                 logger.info("ホバーが成功しました。")
-                 results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
-            elif action == "get_inner_text":
-                 if not element: raise ValueError("Get innerText action requires an element.")
-                 logger.info("要素の innerText を取得します...")
-                 text = await element.inner_text(timeout=action_wait_time)
-                 text = text.strip() if text else "" # 前後の空白除去
-                 logger.info(f"取得テキスト(innerText): '{text[:100]}{'...' if len(text) > 100 else ''}'") # 長いテキストは省略
-                 action_result_details["text"] = text
-                 results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
-            elif action == "get_text_content":
-                 if not element: raise ValueError("Get textContent action requires an element.")
-                 logger.info("要素の textContent を取得します...")
-                 text = await element.text_content(timeout=action_wait_time)
-                 text = text.strip() if text else "" # 前後の空白を除去
-                 logger.info(f"取得テキスト(textContent): '{text[:100]}{'...' if len(text) > 100 else ''}'")
-                 action_result_details["text"] = text
-                 results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
-            elif action == "get_inner_html":
-                 if not element: raise ValueError("Get innerHTML action requires an element.")
-                 logger.info("要素の innerHTML を取得します...")
-                 html_content = await element.inner_html(timeout=action_wait_time)
-                 logger.info(f"取得HTML(innerHTML):\n{html_content[:500]}{'...' if len(html_content) > 500 else ''}") # 先頭のみ表示
-                 action_result_details["html"] = html_content
-                 results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
             elif action == "get_attribute":
                 if not element: raise ValueError("Get attribute action requires an element.")
                 if not attribute_name: raise ValueError("Action 'get_attribute' requires 'attribute_name'.")
@@ -390,27 +732,31 @@ async def execute_actions_async(
                     original_url = attr_value
                     try:
                         # 絶対URLに変換
-                        absolute_url = urljoin(current_base_url, original_url)
+                        absolute_url = _to_absolute_url(current_base_url, original_url)
                         if original_url != absolute_url:
-                            logger.info(f"  href属性値を絶対URLに変換: '{original_url}' -> '{absolute_url}'")
+                            if info_enabled: logger.info(f"  href属性値を絶対URLに変換: '{original_url}' -> '{absolute_url}'")
                         processed_value = absolute_url # 結果には絶対URLを
 
                         # PDFかどうかを判定して処理
-                        if isinstance(absolute_url, str) and absolute_url.lower().endswith('.pdf'):
-                            logger.info(f"  リンク先がPDFファイルです。ダウンロードとテキスト抽出を試みます: {absolute_url}")
-                            # PDFダウンロード (utilsを使用)
-                            pdf_bytes = await utils.download_pdf_async(api_request_context, absolute_url)
-                            if pdf_bytes:
-                                # PDFテキスト抽出 (utilsを使用, 同期関数を非同期実行)
-                                pdf_text_content = await asyncio.to_thread(utils.extract_text_from_pdf_sync, pdf_bytes)
+                        if isinstance(absolute_url, str) and _is_pdf_url(absolute_url):
+                            if on_result is None:
+                                # 結果を逐次通知しない場合は、ダウンロードと抽出をバックグラウンドで行い後続のステップと並行させる
+                                logger.info(f"  リンク先がPDFファイルです。バックグラウンドでダウンロードとテキスト抽出を開始します: {absolute_url}")
+                                pdf_task = deferred_pdf_task_by_url.get(absolute_url)
+                                if pdf_task is None:
+                                    pdf_task = deferred_pdf_task_by_url[absolute_url] = asyncio.create_task(
+                                        utils.download_and_extract_pdf_text_async(api_request_context, absolute_url)
+                                    )
+                                deferred_pdf_tasks.append((action_result_details, pdf_task))
+                            else:
+                                logger.info(f"  リンク先がPDFファイルです。ダウンロードとテキスト抽出を試みます: {absolute_url}")
+                                # PDFダウンロードとテキスト抽出 (utilsを使用, 抽出はプロセスプールで実行)
+                                pdf_text_content = await utils.download_and_extract_pdf_text_async(api_request_context, absolute_url)
                                 if isinstance(pdf_text_content, str) and pdf_text_content.startswith("Error:"):
                                      logger.error(f"  PDFテキスト抽出エラー: {pdf_text_content}")
-                                else:
+                                elif info_enabled: # 先頭200文字の切り出しはログ専用のため、INFOが無効なら行わない
                                      log_text = pdf_text_content[:200] + '...' if pdf_text_content and len(pdf_text_content) > 200 else pdf_text_content
                                      logger.info(f"  PDFテキスト抽出完了 (先頭200文字): {log_text if log_text else 'None'}")
-                            else:
-                                pdf_text_content = "Error: PDF download failed or returned no data."
-                                logger.error(f"  PDFダウンロード失敗: {absolute_url}")
                         else:
                              logger.debug(f"  リンク先はPDFではありません ({absolute_url})。")
                     except Exception as url_e:
@@ -422,22 +768,52 @@ async def execute_actions_async(
                 action_result_details.update({"attribute": attribute_name, "value": processed_value}) # 結果には処理後の値を保存
                 if pdf_text_content is not None:
                     action_result_details["pdf_text"] = pdf_text_content # PDFテキストも結果に含める
-                results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
+                results.append(action_result_details)
+
+            elif action == "download_pdf":
+                if not element: raise ValueError("Download PDF action requires an element.")
+                # リンクをクリックしてブラウザ自身にダウンロードさせる (ログイン済みセッションのCookieがそのまま使われ、転送も1回で済む)
+                logger.info("要素をクリックしてPDFをダウンロードします...")
+                async with root_page.expect_download(timeout=action_wait_time + config.PDF_DOWNLOAD_TIMEOUT) as download_info:
+                    await element.click(timeout=action_wait_time)
+                download = await download_info.value
+                download_path = await download.path() # ダウンロード完了まで待機
+                downloaded_size = await asyncio.to_thread(os.path.getsize, download_path) if download_path else 0
+                logger.info(f"  ダウンロード完了: {download.url} ({downloaded_size} bytes)")
+                if utils.is_pdf_too_large(downloaded_size):
+                    # 上限を超えるPDFは読み込み・抽出を行わない
+                    pdf_text_content = f"Error: PDF skipped because it is too large ({downloaded_size} bytes > {config.PDF_MAX_BYTES} bytes)."
+                    logger.warning(f"  PDFのサイズが上限を超えるため、テキスト抽出をスキップします: {download.url}")
+                elif downloaded_size:
+                    pdf_bytes = await asyncio.to_thread(download_path.read_bytes)
+                    pdf_text_content = await utils.extract_text_from_pdf_async(pdf_bytes)
+                    if isinstance(pdf_text_content, str) and pdf_text_content.startswith("Error:"):
+                        logger.error(f"  PDFテキスト抽出エラー: {pdf_text_content}")
+                else:
+                    pdf_text_content = "Error: PDF download failed or returned no data."
+                    logger.error(f"  PDFダウンロード失敗: {download.url}")
+                action_result_details.update({
+                    "download_url": download.url,
+                    "suggested_filename": download.suggested_filename,
+                    "pdf_text": pdf_text_content
+                })
+                results.append(action_result_details)
 
             # --- get_all_attributes 修正版 ---
             elif action == "get_all_attributes":
                 if not selector: raise ValueError("Action 'get_all_attributes' requires 'selector'.")
                 if not attribute_name: raise ValueError("Action 'get_all_attributes' requires 'attribute_name'.")
+                attr_mode = attribute_name.lower() # 取得モード (href/pdf/content/mail または通常の属性名)
 
                 if not found_elements_list:
                     logger.warning(f"動的探索で要素 '{selector}' が見つからなかったため、属性/コンテンツ取得をスキップします。")
                     action_result_details["results_count"] = 0 # 結果件数を0にする
-                    if attribute_name.lower() in ['href', 'pdf', 'content', 'mail']:
+                    if attr_mode in _HREF_ATTRIBUTE_MODES:
                         action_result_details["url_list"] = []
-                    if attribute_name.lower() == 'pdf': action_result_details["pdf_texts"] = []
-                    if attribute_name.lower() == 'content': action_result_details["scraped_texts"] = []
-                    if attribute_name.lower() == 'mail': action_result_details["extracted_emails"] = []
-                    if attribute_name.lower() not in ['href', 'pdf', 'content', 'mail']:
+                        mode_result_key = _ATTRIBUTE_MODE_RESULT_KEYS.get(attr_mode)
+                        if mode_result_key:
+                            action_result_details[mode_result_key] = []
+                    else:
                         action_result_details["attribute_list"] = []
                 else:
                     num_found = len(found_elements_list)
@@ -452,105 +828,117 @@ async def execute_actions_async(
 
                     # --- 属性名に応じて処理を分岐 ---
                     # href, pdf, content モード (処理を共通化)
-                    if attribute_name.lower() in ['href', 'pdf', 'content', 'mail']: # <<< mail を追加
-                        logger.info(f"モード '{attribute_name.lower()}': href属性を取得し、絶対URLに変換、必要に応じてコンテンツを取得します...")
-
-                        CONCURRENT_LIMIT = 5 # 同時実行数
-                        semaphore = asyncio.Semaphore(CONCURRENT_LIMIT)
-                        logger.info(f"URLアクセス/コンテンツ取得の同時実行数を {CONCURRENT_LIMIT} に制限します。")
-
-                        # 個々の要素から属性/コンテンツを取得する内部関数
-                        async def process_single_element_for_href_related(
-                            locator: Locator, index: int, base_url: str, attr_mode: str, sem: asyncio.Semaphore
-                        ) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[List[str]]]: # <<< mail 用のリストを追加
-                            """ 1要素のhrefを取得し、モードに応じてPDF/コンテンツ/メールも取得 (セマフォで同時実行制御) """
-                            original_href: Optional[str] = None
-                            absolute_url: Optional[str] = None
-                            pdf_text: Optional[str] = None
-                            scraped_text: Optional[str] = None
-                            emails_from_page: Optional[List[str]] = None # <<< mail 用
-
+                    if attr_mode in _HREF_ATTRIBUTE_MODES: # <<< mail を追加
+                        logger.info(f"モード '{attr_mode}': href属性を取得し、絶対URLに変換、必要に応じてコンテンツを取得します...")
+
+                        CONCURRENT_LIMIT = 5 # ページアクセス (content/mail) の同時実行数
+                        # pdf モードの同時処理数は PDF_DOWNLOAD_CONCURRENCY で制限する。抽出完了までセマフォを保持し、
+                        # メモリ上に保持するPDFバイト列の数がリンク数ではなく上限値に比例するようにする
+                        fetch_limit = config.PDF_DOWNLOAD_CONCURRENCY if attr_mode == 'pdf' else CONCURRENT_LIMIT
+                        semaphore = asyncio.Semaphore(fetch_limit)
+                        logger.info(f"URLアクセス/コンテンツ取得の同時実行数を {fetch_limit} に制限します。")
+
+                        # 1つのURLについてモードに応じたPDF/メールを取得する内部関数
+                        async def fetch_for_url(
+                            absolute_url: str, index: int, attr_mode: str, sem: asyncio.Semaphore
+                        ) -> Union[Optional[str], List[str]]:
+                            """ モードに応じてPDFテキスト/メールアドレスリストを取得 (セマフォで同時実行制御)。content モードは get_pages_inner_texts で一括取得する """
                             async with sem: # セマフォで同時実行数を制御
                                 try:
-                                    logger.debug(f"  [{index+1}/{num_found}] Processing started ({attr_mode})...")
-                                    href_timeout = max(500, action_wait_time // num_found if num_found > 5 else action_wait_time // 3)
-                                    original_href = await locator.get_attribute("href", timeout=href_timeout)
-
-                                    if original_href is None:
-                                        logger.debug(f"  [{index+1}/{num_found}] href属性が見つかりません。")
-                                        return None, None, None, None # URLなし
-
-                                    # 絶対URL変換
-                                    try:
-                                        absolute_url = urljoin(base_url, original_href)
-                                        # URLスキーマが http/https でない場合はスキップ (javascript: mailto: など)
-                                        parsed_url = urlparse(absolute_url)
-                                        if parsed_url.scheme not in ['http', 'https']:
-                                            logger.debug(f"  [{index+1}/{num_found}] スキップ (非HTTP/HTTPS URL): {absolute_url}")
-                                            return absolute_url, None, None, None # URLは返す
-                                    except Exception as url_conv_e:
-                                         logger.warning(f"  [{index+1}/{num_found}] 絶対URL変換エラー ({original_href}): {url_conv_e}")
-                                         return f"Error converting URL: {original_href}", None, None, None # エラーURL
-
                                     # pdf モードの場合
-                                    if attr_mode == 'pdf' and absolute_url.lower().endswith('.pdf'):
+                                    if attr_mode == 'pdf':
                                         pdf_start = time.monotonic()
-                                        pdf_bytes = await utils.download_pdf_async(api_request_context, absolute_url)
-                                        if pdf_bytes:
-                                            pdf_text = await asyncio.to_thread(utils.extract_text_from_pdf_sync, pdf_bytes)
-                                        else:
-                                            pdf_text = "Error: PDF download failed or returned no data."
+                                        # 変更のないPDFはディスクキャッシュから返される (条件付きリクエストで再検証)
+                                        pdf_text = await utils.download_and_extract_pdf_text_async(api_request_context, absolute_url)
                                         pdf_elapsed = (time.monotonic() - pdf_start) * 1000
-                                        logger.info(f"  [{index+1}/{num_found}] PDF処理完了 ({pdf_elapsed:.0f}ms) URL: {absolute_url}")
-
-                                    # content モードの場合 (PDF以外)
-                                    elif attr_mode == 'content' and not absolute_url.lower().endswith('.pdf'):
-                                        content_start = time.monotonic()
-                                        success, content_or_error = await get_page_inner_text(current_context, absolute_url, action_wait_time)
-                                        scraped_text = content_or_error
-                                        content_elapsed = (time.monotonic() - content_start) * 1000
-                                        logger.info(f"  [{index+1}/{num_found}] Content取得試行完了 ({content_elapsed:.0f}ms) URL: {absolute_url} Success: {success}")
+                                        if info_enabled: logger.info(f"  [{index+1}/{num_found}] PDF処理完了 ({pdf_elapsed:.0f}ms) URL: {absolute_url}")
+                                        return pdf_text
 
                                     # mail モードの場合 (PDFかどうかは問わない)
-                                    elif attr_mode == 'mail':
-                                         mail_start = time.monotonic()
-                                         # ヘルパー関数を呼び出し
-                                         emails_from_page = await _extract_emails_from_page_async(current_context, absolute_url, action_wait_time)
-                                         mail_elapsed = (time.monotonic() - mail_start) * 1000
-                                         logger.info(f"  [{index+1}/{num_found}] Mail抽出試行完了 ({mail_elapsed:.0f}ms) URL: {absolute_url} Found: {len(emails_from_page) if emails_from_page else 0}")
-
-                                    logger.debug(f"  [{index+1}/{num_found}] Processing finished. URL: {absolute_url}")
-                                    return absolute_url, pdf_text, scraped_text, emails_from_page # <<< mail 結果を返す
-
-                                except PlaywrightTimeoutError:
-                                    logger.warning(f"  [{index+1}/{num_found}] href属性取得タイムアウト ({href_timeout}ms)。")
-                                    return f"Error: Timeout getting href", None, None, None
-                                except Exception as e:
-                                    logger.warning(f"  [{index+1}/{num_found}] href/コンテンツ/メール取得中に予期せぬエラー: {type(e).__name__} - {e}", exc_info=True)
-                                    return f"Error: {type(e).__name__} - {e}", None, None, None
+                                    mail_start = time.monotonic()
+                                    emails_from_page = await _extract_emails_from_page_async(current_context, absolute_url, action_wait_time)
+                                    mail_elapsed = (time.monotonic() - mail_start) * 1000
+                                    if info_enabled: logger.info(f"  [{index+1}/{num_found}] Mail抽出試行完了 ({mail_elapsed:.0f}ms) URL: {absolute_url} Found: {len(emails_from_page) if emails_from_page else 0}")
+                                    return emails_from_page
 
-                        # --- 見つかった全要素に対して並行処理 ---
-                        process_tasks = [
-                            process_single_element_for_href_related(loc, idx, current_base_url, attribute_name.lower(), semaphore)
-                            for idx, (loc, _) in enumerate(found_elements_list)
-                        ]
-                        results_tuples = await asyncio.gather(*process_tasks)
+                                except Exception as e:
+                                    # 要素ごとの警告ではスタックトレースはDEBUG時のみ記録する
+                                    logger.warning(f"  [{index+1}/{num_found}] コンテンツ/メール取得中に予期せぬエラー: {type(e).__name__} - {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+                                    return [] if attr_mode == 'mail' else f"Error: {type(e).__name__} - {e}"
+
+                        # --- href属性をスコープごとに一括取得し、絶対URLに変換 (通信なしで一括処理) ---
+                        original_href_list = await _get_attribute_values_by_scope(found_elements_list, selector, "href", action_wait_time)
+                        num_found = len(original_href_list)
+                        # 通信が必要なURLごとの要素インデックス (モードごとに対象を絞る)。
+                        # 同じURLへのリンクが複数あっても取得はURLごとに1回だけ行い、結果を全インデックスに配る
+                        fetch_indices_by_url: Dict[str, List[int]] = {}
+                        # モードごとの取得対象の判定はループの外で1回だけ決める (pdf: PDFのみ, content: PDF以外, mail: すべて, href: なし)
+                        fetch_all_urls = attr_mode == 'mail'
+                        fetch_pdf_only: Optional[bool] = {'pdf': True, 'content': False}.get(attr_mode)
+                        for idx, original_href in enumerate(original_href_list):
+                            if original_href is None or original_href.startswith("Error:"):
+                                url_list_for_file.append(original_href) # URLなし、または一括取得時のエラー
+                                continue
+                            try:
+                                absolute_url = _to_absolute_url(current_base_url, original_href)
+                            except Exception as url_conv_e:
+                                logger.warning(f"  [{idx+1}/{num_found}] 絶対URL変換エラー ({original_href}): {url_conv_e}")
+                                url_list_for_file.append(f"Error converting URL: {original_href}")
+                                continue
+                            url_list_for_file.append(absolute_url)
+                            # URLスキーマが http/https でない場合はスキップ (javascript: mailto: など)
+                            if not absolute_url.startswith(_ABSOLUTE_HTTP_PREFIXES) and urlparse(absolute_url).scheme not in _HTTP_SCHEMES:
+                                if debug_enabled: logger.debug(f"  [{idx+1}/{num_found}] スキップ (非HTTP/HTTPS URL): {absolute_url}")
+                                continue
+                            if fetch_all_urls or (fetch_pdf_only is not None and _is_pdf_url(absolute_url) == fetch_pdf_only):
+                                fetch_indices_by_url.setdefault(absolute_url, []).append(idx)
+
+                        # --- 通信が必要なURLに対してのみ並行処理し、完了したものから元の位置に格納する ---
+                        # TaskGroup により、このステップが中断された場合も残りの取得タスクは確実にキャンセルされる
+                        fetched_results: List[Union[Optional[str], List[str]]] = [None] * num_found
+
+                        async def fetch_into_slots(absolute_url: str, indices: List[int]) -> None:
+                            fetched = await fetch_for_url(absolute_url, indices[0], attr_mode, semaphore)
+                            for idx in indices:
+                                fetched_results[idx] = fetched
+
+                        # 取得対象の件数は fetch_indices_by_url で分かっているため、結果リストを走査せずに判定する
+                        if fetch_indices_by_url and attr_mode == 'content':
+                            # ページテキストは一括取得ヘルパーで並行取得し、URLごとの結果を全インデックスに配る
+                            logger.info(f"取得対象 {len(fetch_indices_by_url)} 件のユニークURLのテキストを並行取得します (要素数: {num_found})。")
+                            content_start = time.monotonic()
+                            page_texts = await get_pages_inner_texts(
+                                current_context, list(fetch_indices_by_url), action_wait_time, concurrency=CONCURRENT_LIMIT
+                            )
+                            for indices, (_, content_or_error) in zip(fetch_indices_by_url.values(), page_texts):
+                                for idx in indices:
+                                    fetched_results[idx] = content_or_error
+                            content_elapsed = (time.monotonic() - content_start) * 1000
+                            logger.info(f"  Content取得完了: 成功 {sum(1 for success, _ in page_texts if success)}/{len(page_texts)} 件 ({content_elapsed:.0f}ms)")
+                        elif fetch_indices_by_url:
+                            logger.info(f"取得対象 {len(fetch_indices_by_url)} 件のユニークURLを処理します (要素数: {num_found})。")
+                            async with asyncio.TaskGroup() as fetch_group:
+                                for absolute_url, indices in fetch_indices_by_url.items():
+                                    fetch_group.create_task(fetch_into_slots(absolute_url, indices))
+                        else:
+                            logger.info(f"モード '{attr_mode}' で取得対象となるURLはありませんでした。")
+                        if attr_mode == 'pdf':
+                            pdf_texts_list_for_file = fetched_results
+                        elif attr_mode == 'content':
+                            scraped_texts_list_for_file = fetched_results
 
-                        # 結果をリストに格納 & mailモードのドメイン重複排除
+                        # mailモードのドメイン重複排除用
                         all_extracted_emails_flat: List[str] = [] # mailモード用: 全メールアドレス（ドメイン重複排除前）
                         processed_domains: Set[str] = set() # mailモード用: 処理済みドメイン
-
-                        for abs_url, pdf_content, scraped_content, emails_list in results_tuples:
-                            url_list_for_file.append(abs_url) # URLは常に追加
-                            if attribute_name.lower() == 'pdf':
-                                pdf_texts_list_for_file.append(pdf_content)
-                            if attribute_name.lower() == 'content':
-                                scraped_texts_list_for_file.append(scraped_content)
-                            if attribute_name.lower() == 'mail' and emails_list:
-                                all_extracted_emails_flat.extend(emails_list) # まずフラットリストに追加
+                        if attr_mode == 'mail':
+                            # URLの初出順にメールを集める (ドメイン重複排除で先勝ちとなる順序を保つ)
+                            for indices in fetch_indices_by_url.values():
+                                emails_list = fetched_results[indices[0]]
+                                if emails_list:
+                                    all_extracted_emails_flat.extend(emails_list) # まずフラットリストに追加
 
                         # --- mail モードのドメイン重複排除処理 ---
-                        if attribute_name.lower() == 'mail':
+                        if attr_mode == 'mail':
                             logger.info(f"メールアドレスのドメイン重複排除を開始 (候補総数: {len(all_extracted_emails_flat)})...")
                             for email in all_extracted_emails_flat:
                                 if isinstance(email, str) and '@' in email:
@@ -559,23 +947,23 @@ async def execute_actions_async(
                                         if domain and domain not in processed_domains:
                                             email_list_for_file.append(email) # ユニークドメインのメールを最終リストへ
                                             processed_domains.add(domain) # ドメインを処理済みセットへ
-                                            logger.debug(f"    Added unique domain email: {email}")
+                                            if debug_enabled: logger.debug(f"    Added unique domain email: {email}")
                                         # else: logger.debug(f"    Skipping duplicate domain email: {email}")
                                     except IndexError:
                                         logger.warning(f"    Invalid email format skipped: {email}")
                                 else:
-                                     logger.debug(f"    Skipping invalid or non-string email entry: {email}")
+                                     if debug_enabled: logger.debug(f"    Skipping invalid or non-string email entry: {email}")
                             logger.info(f"ドメイン重複排除完了。ユニークドメインメールアドレス数: {len(email_list_for_file)}")
 
                         # 結果を action_result_details に格納
                         action_result_details["attribute"] = attribute_name
                         action_result_details["url_list"] = url_list_for_file # 常にURLリストを含める
                         action_result_details["results_count"] = len(url_list_for_file) # 処理したURL数をカウント
-                        if attribute_name.lower() == 'pdf':
+                        if attr_mode == 'pdf':
                              action_result_details["pdf_texts"] = pdf_texts_list_for_file
-                        if attribute_name.lower() == 'content':
+                        elif attr_mode == 'content':
                              action_result_details["scraped_texts"] = scraped_texts_list_for_file
-                        if attribute_name.lower() == 'mail':
+                        elif attr_mode == 'mail':
                              action_result_details["extracted_emails"] = email_list_for_file # ドメインユニークなリスト
 
                         if len(email_list_for_file) > 0:
@@ -585,24 +973,10 @@ async def execute_actions_async(
                     # --- href, pdf, content, mail 以外の通常の属性取得 ---
                     else:
                         logger.info(f"指定された属性 '{attribute_name}' を取得します...")
-                        # 属性値を取得する内部関数
-                        async def get_single_attr(locator: Locator, attr_name: str, index: int) -> Optional[str]:
-                            try:
-                                attr_timeout = max(500, action_wait_time // num_found if num_found > 5 else action_wait_time // 3)
-                                return await locator.get_attribute(attr_name, timeout=attr_timeout)
-                            except PlaywrightTimeoutError:
-                                logger.warning(f"  [{index+1}/{num_found}] 属性 '{attr_name}' 取得タイムアウト ({attr_timeout}ms)。")
-                                return f"Error: Timeout getting attribute '{attr_name}'"
-                            except Exception as e:
-                                logger.warning(f"  [{index+1}/{num_found}] 属性 '{attr_name}' 取得中にエラー: {type(e).__name__}")
-                                return f"Error: {type(e).__name__} getting attribute '{attr_name}'"
-
-                        # 並行処理で属性を取得
-                        attr_tasks = [
-                            get_single_attr(loc, attribute_name, idx)
-                            for idx, (loc, _) in enumerate(found_elements_list)
-                        ]
-                        generic_attribute_list_for_file = await asyncio.gather(*attr_tasks)
+                        # スコープごとに1回の evaluate_all で属性値をまとめて取得
+                        generic_attribute_list_for_file = await _get_attribute_values_by_scope(
+                            found_elements_list, selector, attribute_name, action_wait_time
+                        )
 
                         action_result_details.update({
                             "attribute": attribute_name,
@@ -612,127 +986,53 @@ async def execute_actions_async(
                         logger.info(f"取得した属性値リスト ({len(generic_attribute_list_for_file)}件)")
 
                 # 最後に結果を追加
-                results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
+                results.append(action_result_details)
             # --- ここまで get_all_attributes の修正 ---
 
-            elif action == "get_all_text_contents":
-                if not selector: raise ValueError("Action 'get_all_text_contents' requires 'selector'.")
-                text_list: List[Optional[str]] = []
-                if not found_elements_list:
-                    logger.warning(f"動的探索で要素 '{selector}' が見つからなかったため、テキスト取得をスキップします。")
-                    action_result_details["results_count"] = 0
-                else:
-                    num_found = len(found_elements_list)
-                    logger.info(f"動的探索で見つかった {num_found} 個の要素から textContent を取得します。")
-                    # textContent を取得する内部関数
-                    async def get_single_text(locator: Locator, index: int) -> Optional[str]:
-                        try:
-                            text_timeout = max(500, action_wait_time // num_found if num_found > 5 else action_wait_time // 3)
-                            text = await locator.text_content(timeout=text_timeout)
-                            return text.strip() if text else "" # 前後空白除去
-                        except PlaywrightTimeoutError:
-                             logger.warning(f"  [{index+1}/{num_found}] textContent取得タイムアウト ({text_timeout}ms)。")
-                             return "Error: Timeout getting textContent"
-                        except Exception as e:
-                            logger.warning(f"  [{index+1}/{num_found}] textContent 取得中にエラー: {type(e).__name__}")
-                            return f"Error: {type(e).__name__} getting textContent"
-
-                    # 並行処理でテキストを取得
-                    get_text_tasks = [
-                        get_single_text(loc, idx) for idx, (loc, _) in enumerate(found_elements_list)
-                    ]
-                    text_list = await asyncio.gather(*get_text_tasks)
-                    logger.info(f"取得したテキストリスト ({len(text_list)}件)")
-                    action_result_details["results_count"] = len(text_list)
-
-                action_result_details["text_list"] = text_list
-                results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
-            elif action == "wait_visible":
-                # 要素探索自体が required_state='visible' で行われているため、
-                # ここに到達した時点で要素は可視のはず。ログのみ。
-                if not element: raise ValueError("Wait visible action requires an element.")
-                logger.info("要素が表示されていることを確認しました (動的探索時に確認済み)。")
-                results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
-            elif action == "select_option":
-                  if not element: raise ValueError("Select option action requires an element.")
-                  if option_type not in ['value', 'index', 'label'] or option_value is None:
-                       raise ValueError("Invalid 'option_type' or 'option_value' for select_option action.")
-                  logger.info(f"ドロップダウンを選択します (Type: {option_type}, Value: '{option_value}')...")
-                  # select_option は内部で要素が選択可能になるのを待つ
-                  if option_type == 'value':
-                      await element.select_option(value=str(option_value), timeout=action_wait_time)
-                  elif option_type == 'index':
-                      try: index_val = int(option_value)
-                      except (ValueError, TypeError): raise ValueError("Option type 'index' requires an integer value.")
-                      await element.select_option(index=index_val, timeout=action_wait_time)
-                  elif option_type == 'label':
-                      await element.select_option(label=str(option_value), timeout=action_wait_time)
-                  logger.info("ドロップダウンの選択が成功しました。")
-                  action_result_details.update({"option_type": option_type, "option_value": option_value})
-                  results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
-            elif action == "scroll_to_element":
-                   if not element: raise ValueError("Scroll action requires an element.")
-                   logger.info("要素が表示されるまでスクロールします...")
-                   # scroll_into_view_if_needed は要素がビューポートに入るようにスクロールする
-                   await element.scroll_into_view_if_needed(timeout=action_wait_time)
-                   await asyncio.sleep(0.3) # スクロール後の安定待ち
-                   logger.info("要素へのスクロールが成功しました。")
-                   results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
-
             elif action == "screenshot":
                   # ファイル名の決定 (valueがあればそれ、なければデフォルト名)
-                  filename_base = str(value).strip() if value else f"screenshot_step{step_num}"
+                  # パス区切り文字などは除去し、スクリーンショット用ディレクトリの外に書き込まないようにする
+                  filename_base = _SCREENSHOT_FILENAME_STRIP.sub('', str(value)).strip('.') if value else ""
+                  filename_base = filename_base or f"screenshot_step{step_num}"
                   # 拡張子がなければ .png を追加
                   filename = f"{filename_base}.png" if not filename_base.lower().endswith(('.png', '.jpg', '.jpeg')) else filename_base
                   screenshot_path = os.path.join(config.DEFAULT_SCREENSHOT_DIR, filename)
-                  # ディレクトリが存在しない場合は作成
-                  os.makedirs(config.DEFAULT_SCREENSHOT_DIR, exist_ok=True)
+                  # ディレクトリが存在しない場合は作成 (makedirs はプロセス内で初回のみ)
+                  utils.ensure_directory(config.DEFAULT_SCREENSHOT_DIR)
                   logger.info(f"スクリーンショットを '{screenshot_path}' に保存します...")
+                  # 画像はメモリ上に取得し、ファイル書き込みはスレッドで行う (イベントループをブロックしない)
                   if element: # 要素が指定されていれば要素のスクリーンショット
                        logger.info("要素のスクリーンショットを取得します...")
-                       await element.screenshot(path=screenshot_path, timeout=action_wait_time)
+                       screenshot_bytes = await element.screenshot(timeout=action_wait_time)
+                       await utils.write_bytes_to_file_async(screenshot_path, screenshot_bytes)
                        logger.info("要素のスクリーンショットを保存しました。")
                   else: # 要素が指定されていなければページ全体
                        logger.info("ページ全体のスクリーンショットを取得します...")
                        # ページ全体は時間がかかる可能性があるのでタイムアウトを少し長くする
-                       await root_page.screenshot(path=screenshot_path, full_page=True, timeout=action_wait_time*2)
+                       screenshot_bytes = await root_page.screenshot(full_page=True, timeout=action_wait_time*2)
+                       await utils.write_bytes_to_file_async(screenshot_path, screenshot_bytes)
                        logger.info("ページ全体のスクリーンショットを保存しました。")
                   action_result_details["filename"] = screenshot_path # 結果にファイルパスを含める
-                  results.append({"step": step_num, "status": "success", "action": action, **action_result_details})
+                  results.append(action_result_details)
 
             else:
-                  known_actions = [
-                      "click", "input", "hover", "get_inner_text", "get_text_content",
-                      "get_inner_html", "get_attribute", "get_all_attributes", "get_all_text_contents",
-                      "wait_visible", "select_option", "screenshot", "scroll_page_to_bottom",
-                      "scroll_to_element", "wait_page_load", "sleep", "switch_to_iframe",
-                      "switch_to_parent_frame"
-                  ]
-                  if action not in known_actions:
+                  if action not in _KNOWN_ACTIONS:
                      logger.warning(f"未定義または不明なアクション '{action}' です。このステップはスキップされます。")
                      results.append({"step": step_num, "status": "skipped", "action": action, "message": f"Undefined action: {action}"})
 
         # --- ステップごとのエラーハンドリング ---
-        except (PlaywrightTimeoutError, PlaywrightError, ValueError, Exception) as e:
+        except Exception as e:
+            # タイムアウトは想定内の失敗のため、スタックトレースの整形はDEBUG時のみ行う
+            is_timeout = isinstance(e, PlaywrightTimeoutError)
             error_message = f"ステップ {step_num} ({action}) の実行中にエラーが発生しました: {type(e).__name__} - {e}"
-            logger.error(error_message, exc_info=True) # スタックトレース付きでログ出力
+            logger.error(error_message, exc_info=debug_enabled or not is_timeout) # タイムアウト以外はスタックトレース付きでログ出力
             error_screenshot_path = None
             # エラー発生時のスクリーンショットを試みる
             if root_page and not root_page.is_closed():
                  timestamp = time.strftime("%Y%m%d_%H%M%S")
                  error_ss_filename = f"error_step{step_num}_{timestamp}.png"
                  error_ss_path = os.path.join(config.DEFAULT_SCREENSHOT_DIR, error_ss_filename)
-                 try:
-                     os.makedirs(config.DEFAULT_SCREENSHOT_DIR, exist_ok=True)
-                     # エラー時のスクショはタイムアウト短め、フルページで試す
-                     await root_page.screenshot(path=error_ss_path, full_page=True, timeout=10000)
-                     logger.info(f"エラー発生時のスクリーンショットを保存しました: {error_ss_path}")
-                     error_screenshot_path = error_ss_path
-                 except Exception as ss_e:
-                     logger.error(f"エラー発生時のスクリーンショット保存に失敗しました: {ss_e}")
+                 error_screenshot_path = await _save_error_screenshot(root_page, error_ss_path)
             elif root_page and root_page.is_closed():
                  # ページが閉じられている場合、エラーメッセージに追記
                  error_message += " (Note: Root page was closed during execution, possibly due to an unexpected navigation or crash)"
@@ -746,8 +1046,9 @@ async def execute_actions_async(
                 "selector": selector, # エラー発生時のセレクターも記録
                 "message": str(e), # エラーメッセージ本文
                 "full_error": error_message, # より詳細なエラー情報 (スタックトレースはログのみ)
-                "traceback": traceback.format_exc() # スタックトレースも結果に含める（デバッグ用）
             }
+            if debug_enabled or not is_timeout:
+                error_details["traceback"] = traceback.format_exc() # スタックトレースも結果に含める（デバッグ用）
             if error_screenshot_path:
                 error_details["error_screenshot"] = error_screenshot_path
             results.append(error_details)
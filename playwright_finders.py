@@ -5,20 +5,267 @@ Playwrightを使った動的な要素探索機能を提供します。
 import asyncio
 import logging
 import time
-from collections import deque
+from contextlib import aclosing
 from playwright.async_api import (
     Page,
     FrameLocator,
     Locator,
     TimeoutError as PlaywrightTimeoutError,
 )
-from typing import List, Tuple, Optional, Union, Deque
+from typing import List, Tuple, Optional, Union, Set, Dict, AsyncIterator
 
 import config
 
 logger = logging.getLogger(__name__)
 
+# --- iframe探索結果のキャッシュ ---
+# id(スコープ) -> (記録時刻(monotonic), スコープ本体, 起点ページのフレーム構成, 有効なiframeのリスト)
+# 連続するステップが同じDOMに対して探索する場合に、iframeの数え上げと有効性確認の通信を省略する。
+# スコープ本体も保持し、id の再利用による取り違えを防ぐ
+_IFRAME_SCAN_CACHE: Dict[int, Tuple[float, Union[Page, FrameLocator], Optional[Tuple], List[Tuple[int, FrameLocator]]]] = {}
+
+def _frames_signature(page: Page) -> Tuple:
+    """
+    ページ内のフレーム構成 (各フレームとそのURL) を通信なしで返します。
+    フレームの追加・削除・遷移があると値が変わるため、TTL内でもiframe探索結果を捨てる判定に使います。
+    """
+    return tuple((id(frame), frame.url) for frame in page.frames)
+
+def invalidate_iframe_cache() -> None:
+    """iframe探索結果のキャッシュを破棄します (ページ遷移・クリックなどDOMが変わり得る操作の後に呼び出す)。"""
+    _IFRAME_SCAN_CACHE.clear()
+
+async def _collect_attached_child_frames_cached(
+    current_scope: Union[Page, FrameLocator],
+    remaining_time_ms: float,
+    iframe_check_timeout: int,
+    label: str,
+    frames_signature: Optional[Tuple] = None
+) -> List[Tuple[int, FrameLocator]]:
+    """
+    _collect_attached_child_frames の結果を IFRAME_SCAN_CACHE_TTL_MS の間だけ再利用します。
+    TTL内でも起点ページのフレーム構成 (frames_signature) が記録時と異なれば再利用しません。
+    キャッシュは可視のiframeのみを保持し、可視性はフレーム構成が変わらなくても変わり得るため、TTLを過ぎたものは使いません。
+    """
+    ttl_ms = config.IFRAME_SCAN_CACHE_TTL_MS
+    if ttl_ms <= 0:
+        return await _collect_attached_child_frames(current_scope, remaining_time_ms, iframe_check_timeout, label)
+    now = time.monotonic()
+    entry = _IFRAME_SCAN_CACHE.get(id(current_scope))
+    if (
+        entry is not None and entry[1] is current_scope and (now - entry[0]) * 1000 < ttl_ms
+        and (frames_signature is None or entry[2] is None or entry[2] == frames_signature)
+    ):
+        return entry[3]
+    attached_frames = await _collect_attached_child_frames(current_scope, remaining_time_ms, iframe_check_timeout, label)
+    # 期限切れのエントリはここでまとめて捨てる (キャッシュが際限なく増えないように)
+    expired_ids = [
+        scope_id for scope_id, (recorded_at, _, _, _) in _IFRAME_SCAN_CACHE.items()
+        if (now - recorded_at) * 1000 >= ttl_ms
+    ]
+    for scope_id in expired_ids:
+        del _IFRAME_SCAN_CACHE[scope_id]
+    _IFRAME_SCAN_CACHE[id(current_scope)] = (time.monotonic(), current_scope, frames_signature, attached_frames)
+    return attached_frames
+
+# --- iframe探索の共通ヘルパー ---
+def _describe_scope(scope: Union[Page, FrameLocator]) -> str:
+    """ログ用のスコープ表記を返します (FrameLocator の repr は、ログを出す時にだけ組み立てる)。"""
+    if isinstance(scope, FrameLocator):
+        return f"FrameLocator ({repr(scope)})"
+    return type(scope).__name__
+
+async def _collect_attached_child_frames(
+    current_scope: Union[Page, FrameLocator],
+    remaining_time_ms: float,
+    iframe_check_timeout: int,
+    label: str
+) -> List[Tuple[int, FrameLocator]]:
+    """
+    スコープ直下の可視iframeのうち、中身がアタッチされているもの (nth番号, FrameLocator) を返します。
+    各iframeの有効性確認は並行して行うため、待ち時間はスコープあたり最大1回分で済みます。
+    中身を直接参照できる (同一オリジンの) iframeは、個別の待機なしで有効と判定します。
+    """
+    iframe_base_selector = 'iframe:visible' # 可視iframeのみを対象
+    debug_enabled = logger.isEnabledFor(logging.DEBUG) # DEBUG無効時はログ文字列の組み立てを省略
+    step_start_time = time.monotonic()
+    # まず可視判定なしで数える (:visible は候補ごとにレイアウトを調べるため、iframeのないスコープでは省略する)
+    if await current_scope.locator('iframe').count() == 0:
+        return []
+    # 可視iframeごとに、中身のドキュメントが参照できるか (同一オリジンで読み込み済みか) を1回の evaluate_all でまとめて調べる。
+    # 参照できないもの (クロスオリジンなど) は False/None となり、個別の :root 待機で確認する
+    same_origin_states: List[Optional[bool]] = await current_scope.locator(iframe_base_selector).evaluate_all(
+        "els => els.map(f => { try { return !!(f.contentDocument && f.contentDocument.documentElement); } catch (e) { return null; } })"
+    )
+    count = len(same_origin_states)
+    step_elapsed = (time.monotonic() - step_start_time) * 1000
+    if count == 0:
+        return []
+    if debug_enabled: logger.debug(f"      発見した可視iframe候補数: {count} (うち中身を直接確認済み: {sum(1 for state in same_origin_states if state)}) ({step_elapsed:.0f}ms)")
+
+    # iframeが有効かどうかのチェックタイムアウト (全iframe共通)
+    effective_iframe_check_timeout = max(50, min(iframe_check_timeout, int(remaining_time_ms - 50)))
+    frame_locators = [current_scope.frame_locator(f"{iframe_base_selector} >> nth={i}") for i in range(count)]
+
+    async def check_attached(frame_locator: FrameLocator, already_attached: Optional[bool]) -> None:
+        if already_attached:
+            return # 中身を確認済みのため待機不要
+        await frame_locator.locator(':root').wait_for(state='attached', timeout=effective_iframe_check_timeout)
+
+    # 確認できなかったiframeは、iframe内のルート要素が存在するかで有効性を判断 (並行実行)
+    check_results = await asyncio.gather(
+        *(check_attached(frame_locator, already_attached) for frame_locator, already_attached in zip(frame_locators, same_origin_states)),
+        return_exceptions=True
+    )
+    step_elapsed = (time.monotonic() - step_start_time) * 1000
+
+    attached_frames: List[Tuple[int, FrameLocator]] = []
+    for i, (frame_locator, result) in enumerate(zip(frame_locators, check_results)):
+        if isinstance(result, PlaywrightTimeoutError):
+            if debug_enabled: logger.debug(f"      iframe {i} は有効でないかタイムアウト ({effective_iframe_check_timeout}ms)。")
+        elif isinstance(result, Exception):
+            logger.warning(f"      iframe {i} の処理中にエラー({label}): {type(result).__name__} - {result}")
+        else:
+            attached_frames.append((i, frame_locator))
+    if debug_enabled: logger.debug(f"      有効なiframe: {len(attached_frames)}/{count} ({step_elapsed:.0f}ms)")
+    return attached_frames
+
+async def _collect_next_level(
+    current_level: List[Union[Page, FrameLocator]],
+    current_depth: int,
+    remaining_time_ms: float,
+    iframe_check_timeout: int,
+    visited_scope_ids: Set[int],
+    label: str,
+    frames_signature: Optional[Tuple] = None
+) -> List[FrameLocator]:
+    """
+    同じ深度のすべてのスコープについて、直下の有効なiframeを並行して探索し、次の深度のスコープ一覧を返します。
+    待ち時間はスコープ数によらず、深度あたり最大1回分で済みます。訪問済みのスコープは除外します。
+    """
+    debug_enabled = logger.isEnabledFor(logging.DEBUG) # DEBUG無効時はログ文字列の組み立てを省略
+    scopes_to_expand = [scope for scope in current_level if _may_have_child_frames(scope)] # iframeのないページは探索しない
+    if not scopes_to_expand:
+        return []
+    if debug_enabled: logger.debug(f"    深度 {current_depth} の {len(scopes_to_expand)} スコープ内の可視iframeを並行探索...")
+    step_start_time = time.monotonic()
+    collect_results = await asyncio.gather(
+        *(_collect_attached_child_frames_cached(scope, remaining_time_ms, iframe_check_timeout, label, frames_signature) for scope in scopes_to_expand),
+        return_exceptions=True
+    )
+    next_level: List[FrameLocator] = []
+    for current_scope, result in zip(scopes_to_expand, collect_results):
+        if isinstance(result, BaseException):
+            step_elapsed = (time.monotonic() - step_start_time) * 1000
+            logger.error(f"    スコープ '{_describe_scope(current_scope)}' でのiframe探索中に予期せぬエラー: {type(result).__name__} - {result} ({step_elapsed:.0f}ms)", exc_info=result if debug_enabled else None)
+            continue
+        for i, next_frame_locator in result:
+            # 訪問済みでなければ次の深度に追加
+            scope_id = id(next_frame_locator) # FrameLocatorオブジェクトのIDで訪問管理
+            if scope_id not in visited_scope_ids:
+                visited_scope_ids.add(scope_id)
+                next_level.append(next_frame_locator)
+                if debug_enabled: logger.debug(f"        キューに追加({label}): スコープ=FrameLocator(nth={i}), 新深度={current_depth + 1}")
+            else:
+                if debug_enabled: logger.debug(f"        スキップ({label}): FrameLocator(nth={i}) は訪問済み")
+    return next_level
+
+def _may_have_child_frames(scope: Union[Page, FrameLocator]) -> bool:
+    """
+    スコープ配下にiframeが存在し得るかを通信なしで判定します。
+    Page の場合はメインフレーム以外のフレームがなければ False (iframe探索自体を省略できる)。
+    FrameLocator の場合は判定できないため常に True。
+    """
+    if isinstance(scope, Page):
+        return len(scope.frames) > 1
+    return True
+
+# --- 幅優先探索の共通部分 ---
+# 残り時間がこれ未満の場合は次の深度のiframe探索を始めない (数え上げと有効性確認が間に合わないため)
+_MIN_DESCEND_TIME_MS = 200
+
+async def _iter_scope_levels(
+    base_locator: Union[Page, FrameLocator],
+    max_depth: int,
+    timeout: int,
+    start_time: float,
+    label: str
+) -> AsyncIterator[Tuple[List[Union[Page, FrameLocator]], int, float]]:
+    """
+    起点からiframeをたどり、同じ深度のスコープ一覧を (スコープ一覧, 深度, 残り時間ms) として浅い順に返します。
+    次の深度のiframe探索は、現在の深度を返す前に開始しておき、呼び出し側の要素探索と並行させます。
+    全体タイムアウト (start_time からの経過) に達した場合は終了します。
+    途中で抜ける場合は contextlib.aclosing で閉じてください (先行して開始したiframe探索をキャンセルします)。
+    """
+    current_level: List[Union[Page, FrameLocator]] = [base_locator]
+    current_depth = 0
+    visited_scope_ids = {id(base_locator)}
+    iframe_check_timeout = config.IFRAME_LOCATOR_TIMEOUT # iframe有効性確認のタイムアウト
+    # 起点がページの場合、そのフレーム構成が変わっていない間はiframe探索結果を使い回す
+    frames_signature = _frames_signature(base_locator) if isinstance(base_locator, Page) else None
+    deadline = start_time + timeout / 1000 # 全体の期限 (monotonic秒)。残り時間はここからの差分で求める
+    discovery_task: Optional[asyncio.Task] = None
+    try:
+        while current_level:
+            remaining_time_ms = (deadline - time.monotonic()) * 1000
+            if remaining_time_ms < 100: # 期限切れ、または残り時間が少なすぎる場合は探索打ち切り
+                logger.warning(f"動的探索({label})タイムアウト ({timeout}ms) - 残り時間: {max(0.0, remaining_time_ms):.0f}ms のため探索を打ち切ります。")
+                return
+
+            # 次の深度のiframe探索を、呼び出し側の要素探索と同時に開始する
+            # 最大深度に達している場合や、残り時間では子iframeを確認しきれない場合は探索しない
+            if current_depth < max_depth and remaining_time_ms >= _MIN_DESCEND_TIME_MS:
+                discovery_task = asyncio.create_task(_collect_next_level(
+                    current_level, current_depth, remaining_time_ms, iframe_check_timeout, visited_scope_ids, label, frames_signature
+                ))
+            yield current_level, current_depth, remaining_time_ms
+
+            if discovery_task is None:
+                return
+            # iframeの数え上げ自体にはタイムアウトがないため、全体の期限で打ち切る
+            try:
+                current_level = await asyncio.wait_for(discovery_task, timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                logger.warning(f"動的探索({label})タイムアウト ({timeout}ms) - 深度 {current_depth + 1} のiframe探索が期限内に終わりませんでした。")
+                return
+            discovery_task = None
+            current_depth += 1
+    finally:
+        # 呼び出し側が途中で抜けた場合、不要になったiframe探索を片付ける
+        if discovery_task is not None and not discovery_task.done():
+            discovery_task.cancel()
+            await asyncio.gather(discovery_task, return_exceptions=True)
+
 # --- 動的要素探索ヘルパー関数 (単一要素用) ---
+async def _exists(scope_locator: Locator) -> bool:
+    """Locatorに一致する要素が存在するかを待機せずに1回の問い合わせで判定します。"""
+    return await scope_locator.count() > 0
+
+async def _probe_scope_for_element(
+    scope: Union[Page, FrameLocator],
+    target_selector: str,
+    target_state: str,
+    wait_timeout: int,
+    wait_if_absent: bool = True
+) -> Optional[Locator]:
+    """
+    スコープ直下で要素を待機し、見つかればLocatorを、見つからなければNoneを返します。
+    wait_if_absent=False の場合、要素が存在しなければ待機せずに即座にNoneを返します。
+    """
+    # 存在確認と待機で同じLocatorを使い、セレクターからのLocator組み立てを1回で済ませる
+    scope_locator = scope.locator(target_selector)
+    element = scope_locator.first
+    try:
+        if not wait_if_absent and not await _exists(scope_locator):
+            return None
+        await element.wait_for(state=target_state, timeout=wait_timeout)
+        return element
+    except PlaywrightTimeoutError:
+        return None
+    except Exception as e:
+        logger.warning(f"    スコープ '{type(scope).__name__}' での要素 '{target_selector}' 探索中にエラー: {type(e).__name__} - {e}")
+        return None
+
 async def find_element_dynamically(
     base_locator: Union[Page, FrameLocator],
     target_selector: str,
@@ -28,104 +275,58 @@ async def find_element_dynamically(
 ) -> Tuple[Optional[Locator], Optional[Union[Page, FrameLocator]]]:
     """
     指定された起点からiframe内を含めて動的に単一の要素を探索します。
+    同じ深度のスコープは並行して探索し、最初に見つかった時点で残りの探索をキャンセルします。
     見つかった要素のLocatorと、それが見つかったスコープ (Page or FrameLocator) を返します。
     タイムアウトするか見つからない場合は (None, None) を返します。
     """
     logger.info(f"動的探索(単一)開始: 起点={type(base_locator).__name__}, セレクター='{target_selector}', 最大深度={max_depth}, 状態='{target_state}', 全体タイムアウト={timeout}ms")
     start_time = time.monotonic()
-    queue: Deque[Tuple[Union[Page, FrameLocator], int]] = deque([(base_locator, 0)])
-    visited_scope_ids = {id(base_locator)}
     element_wait_timeout = 2000  # 要素存在確認のタイムアウト（短め）
-    iframe_check_timeout = config.IFRAME_LOCATOR_TIMEOUT # iframe有効性確認のタイムアウト
-    logger.debug(f"  要素待機タイムアウト: {element_wait_timeout}ms, フレーム確認タイムアウト: {iframe_check_timeout}ms")
-
-    while queue:
-        current_monotonic_time = time.monotonic()
-        elapsed_time_ms = (current_monotonic_time - start_time) * 1000
-        if elapsed_time_ms >= timeout:
-            logger.warning(f"動的探索(単一)タイムアウト ({timeout}ms) - 経過時間: {elapsed_time_ms:.0f}ms")
-            return None, None
-        remaining_time_ms = timeout - elapsed_time_ms
-        if remaining_time_ms < 100: # 残り時間が少なすぎる場合は探索打ち切り
-             logger.warning(f"動的探索(単一)の残り時間がわずかなため ({remaining_time_ms:.0f}ms)、探索を打ち切ります。")
-             return None, None
-
-        current_scope, current_depth = queue.popleft()
-        scope_type_name = type(current_scope).__name__
-        scope_identifier = f" ({repr(current_scope)})" if isinstance(current_scope, FrameLocator) else ""
-        logger.debug(f"  探索中(単一): スコープ={scope_type_name}{scope_identifier}, 深度={current_depth}, 残り時間: {remaining_time_ms:.0f}ms")
+    debug_enabled = logger.isEnabledFor(logging.DEBUG) # DEBUG無効時はログ文字列の組み立てを省略
+    if debug_enabled: logger.debug(f"  要素待機タイムアウト: {element_wait_timeout}ms, フレーム確認タイムアウト: {config.IFRAME_LOCATOR_TIMEOUT}ms")
 
-        step_start_time = time.monotonic()
-        try:
-            element = current_scope.locator(target_selector).first
-            # 要素の待機タイムアウトは、全体タイムアウトの残り時間と設定値の小さい方、かつ最低50msを確保
-            effective_element_timeout = max(50, min(element_wait_timeout, int(remaining_time_ms - 50))) # 50msのマージン
-            await element.wait_for(state=target_state, timeout=effective_element_timeout)
-            step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.info(f"要素 '{target_selector}' をスコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) で発見。({step_elapsed:.0f}ms)")
-            return element, current_scope
-        except PlaywrightTimeoutError:
-            step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' 直下では見つからず (タイムアウト {effective_element_timeout}ms)。({step_elapsed:.0f}ms)")
-        except Exception as e:
-            step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.warning(f"    スコープ '{scope_type_name}{scope_identifier}' での要素 '{target_selector}' 探索中にエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)")
-
-        # --- iframe探索 ---
-        if current_depth < max_depth:
-            # 再度時間チェック
-            current_monotonic_time = time.monotonic()
-            elapsed_time_ms = (current_monotonic_time - start_time) * 1000
-            if elapsed_time_ms >= timeout: continue # 時間切れなら次のキューへ
-            remaining_time_ms = timeout - elapsed_time_ms
-            if remaining_time_ms < 100: continue # 残り時間が少なすぎる場合
+    # iframeのないページでは探索範囲はページ自身のみのため、幅優先探索を組み立てずに1回の待機で済ませる
+    if isinstance(base_locator, Page) and not _may_have_child_frames(base_locator):
+        element = await _probe_scope_for_element(base_locator, target_selector, target_state, max(50, min(element_wait_timeout, timeout - 50)))
+        elapsed_time_ms = (time.monotonic() - start_time) * 1000
+        if element is not None:
+            logger.info(f"要素 '{target_selector}' をスコープ 'Page' (深度 0, iframeなし) で発見。({elapsed_time_ms:.0f}ms)")
+            return element, base_locator
+        logger.warning(f"動的探索(単一)完了: iframeのないページで要素 '{target_selector}' が見つかりませんでした。({elapsed_time_ms:.0f}ms)")
+        return None, None
 
+    async with aclosing(_iter_scope_levels(base_locator, max_depth, timeout, start_time, "単一")) as scope_levels:
+        async for current_level, current_depth, remaining_time_ms in scope_levels:
+            if debug_enabled: logger.debug(f"  探索中(単一): 深度={current_depth}, スコープ数={len(current_level)}, 残り時間: {remaining_time_ms:.0f}ms")
             step_start_time = time.monotonic()
-            logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) 内の可視iframeを探索...")
+            # 要素の待機タイムアウトは、全体タイムアウトの残り時間と設定値の小さい方、かつ最低50msを確保
+            effective_element_timeout = max(50, min(element_wait_timeout, int(remaining_time_ms - 50))) # 50msのマージン
+            probe_tasks = {
+                # 起点スコープは描画待ちのため待機し、読み込み済みのiframe内は存在確認のみ (不在時の待機を省略)
+                asyncio.create_task(_probe_scope_for_element(
+                    scope, target_selector, target_state, effective_element_timeout, wait_if_absent=(current_depth == 0)
+                )): scope
+                for scope in current_level
+            }
+            pending = set(probe_tasks)
             try:
-                iframe_base_selector = 'iframe:visible' # 可視iframeのみを対象
-                visible_iframe_locators = current_scope.locator(iframe_base_selector)
-                count = await visible_iframe_locators.count()
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                if count > 0: logger.debug(f"      発見した可視iframe候補数: {count} ({step_elapsed:.0f}ms)")
-
-                for i in range(count):
-                    # ループ内でも時間チェック
-                    current_monotonic_time_inner = time.monotonic()
-                    elapsed_time_ms_inner = (current_monotonic_time_inner - start_time) * 1000
-                    if elapsed_time_ms_inner >= timeout:
-                         logger.warning(f"動的探索(単一)タイムアウト ({timeout}ms) - iframeループ中")
-                         break # このスコープのiframe探索を打ち切り
-                    remaining_time_ms_inner = timeout - elapsed_time_ms_inner
-                    if remaining_time_ms_inner < 50: break # 残り時間が少なすぎる場合
-
-                    iframe_step_start_time = time.monotonic()
-                    try:
-                        # nth=i で i番目の可視iframeを特定
-                        nth_iframe_selector = f"{iframe_base_selector} >> nth={i}"
-                        next_frame_locator = current_scope.frame_locator(nth_iframe_selector)
-                        # iframeが有効かどうかのチェックタイムアウト
-                        effective_iframe_check_timeout = max(50, min(iframe_check_timeout, int(remaining_time_ms_inner - 50)))
-                        # iframe内のルート要素が存在するかで有効性を判断
-                        await next_frame_locator.locator(':root').wait_for(state='attached', timeout=effective_iframe_check_timeout)
-                        # 訪問済みでなければキューに追加
-                        scope_id = id(next_frame_locator) # FrameLocatorオブジェクトのIDで訪問管理
-                        if scope_id not in visited_scope_ids:
-                            visited_scope_ids.add(scope_id)
-                            queue.append((next_frame_locator, current_depth + 1))
-                            iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                            logger.debug(f"        キューに追加(単一): スコープ=FrameLocator(nth={i}), 新深度={current_depth + 1} ({iframe_step_elapsed:.0f}ms)")
-                        else:
-                            logger.debug(f"        スキップ(単一): FrameLocator(nth={i}) は訪問済み")
-                    except PlaywrightTimeoutError:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.debug(f"      iframe {i} ('{nth_iframe_selector}') は有効でないかタイムアウト ({effective_iframe_check_timeout}ms)。({iframe_step_elapsed:.0f}ms)")
-                    except Exception as e:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.warning(f"      iframe {i} ('{nth_iframe_selector}') の処理中にエラー: {type(e).__name__} - {e} ({iframe_step_elapsed:.0f}ms)")
-            except Exception as e:
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                logger.error(f"    スコープ '{scope_type_name}{scope_identifier}' でのiframe探索中に予期せぬエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)", exc_info=True)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        element = task.result()
+                        if element is not None:
+                            found_scope = probe_tasks[task]
+                            step_elapsed = (time.monotonic() - step_start_time) * 1000
+                            logger.info(f"要素 '{target_selector}' をスコープ '{_describe_scope(found_scope)}' (深度 {current_depth}) で発見。({step_elapsed:.0f}ms)")
+                            return element, found_scope
+            finally:
+                # 見つかった (またはキャンセルされた) 場合、残りの探索タスクを片付ける
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+            step_elapsed = (time.monotonic() - step_start_time) * 1000
+            if debug_enabled: logger.debug(f"    深度 {current_depth} の {len(current_level)} スコープ直下では見つからず。({step_elapsed:.0f}ms)")
 
     final_elapsed_time = (time.monotonic() - start_time) * 1000
     logger.warning(f"動的探索(単一)完了: 要素 '{target_selector}' が最大深度 {max_depth} までで見つかりませんでした。({final_elapsed_time:.0f}ms)")
@@ -137,106 +338,57 @@ async def find_all_elements_dynamically(
     target_selector: str,
     max_depth: int = config.DYNAMIC_SEARCH_MAX_DEPTH,
     timeout: int = config.DEFAULT_ACTION_TIMEOUT,
+    max_results: Optional[int] = None
 ) -> List[Tuple[Locator, Union[Page, FrameLocator]]]:
     """
     指定された起点からiframe内を含めて動的に複数の要素を探索します。
     見つかったすべての要素のLocatorとそのスコープのタプルのリストを返します。
     タイムアウトした場合は、それまでに見つかった要素のリストを返します。
+    max_results を指定した場合、その件数に達した時点で以降の深度の探索を打ち切り、先頭からその件数だけ返します。
     """
     logger.info(f"動的探索(複数)開始: 起点={type(base_locator).__name__}, セレクター='{target_selector}', 最大深度={max_depth}, 全体タイムアウト={timeout}ms")
     start_time = time.monotonic()
     found_elements: List[Tuple[Locator, Union[Page, FrameLocator]]] = []
-    queue: Deque[Tuple[Union[Page, FrameLocator], int]] = deque([(base_locator, 0)])
-    visited_scope_ids = {id(base_locator)}
-    iframe_check_timeout = config.IFRAME_LOCATOR_TIMEOUT # iframe有効性確認のタイムアウト
-    logger.debug(f"  フレーム確認タイムアウト: {iframe_check_timeout}ms")
-
-    while queue:
-        current_monotonic_time = time.monotonic()
-        elapsed_time_ms = (current_monotonic_time - start_time) * 1000
-        if elapsed_time_ms >= timeout:
-            logger.warning(f"動的探索(複数)タイムアウト ({timeout}ms) - 経過時間: {elapsed_time_ms:.0f}ms")
-            break # 時間切れの場合はループを抜ける
-        remaining_time_ms = timeout - elapsed_time_ms
-        if remaining_time_ms < 100: # 残り時間が少なすぎる場合は探索打ち切り
-             logger.warning(f"動的探索(複数)の残り時間がわずかなため ({remaining_time_ms:.0f}ms)、探索を打ち切ります。")
-             break
-
-        current_scope, current_depth = queue.popleft()
-        scope_type_name = type(current_scope).__name__
-        scope_identifier = f" ({repr(current_scope)})" if isinstance(current_scope, FrameLocator) else ""
-        logger.debug(f"  探索中(複数): スコープ={scope_type_name}{scope_identifier}, 深度={current_depth}, 残り時間: {remaining_time_ms:.0f}ms")
+    debug_enabled = logger.isEnabledFor(logging.DEBUG) # DEBUG無効時はログ文字列の組み立てを省略
+    if debug_enabled: logger.debug(f"  フレーム確認タイムアウト: {config.IFRAME_LOCATOR_TIMEOUT}ms")
 
+    async def find_in_scope(current_scope: Union[Page, FrameLocator], current_depth: int, remaining_time_ms: float) -> List[Locator]:
+        """スコープ直下の一致要素をすべて返します (エラー・時間切れ時は空リスト)。"""
         step_start_time = time.monotonic()
         try:
             # 要素が表示されているかに関わらず、スコープ内のすべての要素を取得
-            # all() は要素がなくてもエラーにならない（空リストを返す）
-            elements_in_scope = await current_scope.locator(target_selector).all()
+            # count() 自体にはタイムアウトがないため、全体の残り時間で打ち切る。
+            # ヒットした場合のみ、同じ Locator から nth で各要素の Locator を作る (all() と同等)
+            scope_locator = current_scope.locator(target_selector)
+            match_count = await asyncio.wait_for(scope_locator.count(), timeout=remaining_time_ms / 1000)
+            elements_in_scope = [scope_locator.nth(index) for index in range(match_count)] if match_count else []
             step_elapsed = (time.monotonic() - step_start_time) * 1000
             if elements_in_scope:
-                logger.info(f"  スコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) で {len(elements_in_scope)} 個の要素を発見。({step_elapsed:.0f}ms)")
-                for elem in elements_in_scope:
-                    found_elements.append((elem, current_scope))
+                logger.info(f"  スコープ '{_describe_scope(current_scope)}' (深度 {current_depth}) で {len(elements_in_scope)} 個の要素を発見。({step_elapsed:.0f}ms)")
             else:
-                logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' 直下では要素が見つからず。({step_elapsed:.0f}ms)")
+                if debug_enabled: logger.debug(f"    スコープ '{_describe_scope(current_scope)}' 直下では要素が見つからず。({step_elapsed:.0f}ms)")
+            return elements_in_scope
+        except asyncio.TimeoutError:
+            step_elapsed = (time.monotonic() - step_start_time) * 1000
+            logger.warning(f"    スコープ '{_describe_scope(current_scope)}' での要素数の取得が残り時間内に終わりませんでした。({step_elapsed:.0f}ms)")
         except Exception as e:
             step_elapsed = (time.monotonic() - step_start_time) * 1000
-            logger.warning(f"    スコープ '{scope_type_name}{scope_identifier}' での要素 '{target_selector}' 複数探索中にエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)")
+            logger.warning(f"    スコープ '{_describe_scope(current_scope)}' での要素 '{target_selector}' 複数探索中にエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)")
+        return []
 
-        # --- iframe探索 ---
-        if current_depth < max_depth:
-            # 再度時間チェック
-            current_monotonic_time = time.monotonic()
-            elapsed_time_ms = (current_monotonic_time - start_time) * 1000
-            if elapsed_time_ms >= timeout: continue # 時間切れなら次のキューへ
-            remaining_time_ms = timeout - elapsed_time_ms
-            if remaining_time_ms < 100: continue # 残り時間が少なすぎる場合
-
-            step_start_time = time.monotonic()
-            logger.debug(f"    スコープ '{scope_type_name}{scope_identifier}' (深度 {current_depth}) 内の可視iframeを探索...")
-            try:
-                iframe_base_selector = 'iframe:visible' # 可視iframeのみを対象
-                visible_iframe_locators = current_scope.locator(iframe_base_selector)
-                count = await visible_iframe_locators.count()
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                if count > 0: logger.debug(f"      発見した可視iframe候補数: {count} ({step_elapsed:.0f}ms)")
-
-                for i in range(count):
-                    # ループ内でも時間チェック
-                    current_monotonic_time_inner = time.monotonic()
-                    elapsed_time_ms_inner = (current_monotonic_time_inner - start_time) * 1000
-                    if elapsed_time_ms_inner >= timeout:
-                         logger.warning(f"動的探索(複数)タイムアウト ({timeout}ms) - iframeループ中")
-                         break # このスコープのiframe探索を打ち切り
-                    remaining_time_ms_inner = timeout - elapsed_time_ms_inner
-                    if remaining_time_ms_inner < 50: break # 残り時間が少なすぎる場合
-
-                    iframe_step_start_time = time.monotonic()
-                    try:
-                        nth_iframe_selector = f"{iframe_base_selector} >> nth={i}"
-                        next_frame_locator = current_scope.frame_locator(nth_iframe_selector)
-                        # iframeが有効かどうかのチェックタイムアウト
-                        effective_iframe_check_timeout = max(50, min(iframe_check_timeout, int(remaining_time_ms_inner - 50)))
-                        await next_frame_locator.locator(':root').wait_for(state='attached', timeout=effective_iframe_check_timeout)
-                        # 訪問済みでなければキューに追加
-                        scope_id = id(next_frame_locator)
-                        if scope_id not in visited_scope_ids:
-                            visited_scope_ids.add(scope_id)
-                            queue.append((next_frame_locator, current_depth + 1))
-                            iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                            logger.debug(f"        キューに追加(複数): スコープ=FrameLocator(nth={i}), 新深度={current_depth + 1} ({iframe_step_elapsed:.0f}ms)")
-                        else:
-                             logger.debug(f"        スキップ(複数): FrameLocator(nth={i}) は訪問済み")
-                    except PlaywrightTimeoutError:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.debug(f"      iframe {i} ('{nth_iframe_selector}') は有効でないかタイムアウト ({effective_iframe_check_timeout}ms)。({iframe_step_elapsed:.0f}ms)")
-                    except Exception as e:
-                         iframe_step_elapsed = (time.monotonic() - iframe_step_start_time) * 1000
-                         logger.warning(f"      iframe {i} ('{nth_iframe_selector}') の処理中にエラー: {type(e).__name__} - {e} ({iframe_step_elapsed:.0f}ms)")
-            except Exception as e:
-                step_elapsed = (time.monotonic() - step_start_time) * 1000
-                logger.error(f"    スコープ '{scope_type_name}{scope_identifier}' でのiframe探索中に予期せぬエラー: {type(e).__name__} - {e} ({step_elapsed:.0f}ms)", exc_info=True)
+    async with aclosing(_iter_scope_levels(base_locator, max_depth, timeout, start_time, "複数")) as scope_levels:
+        async for current_level, current_depth, remaining_time_ms in scope_levels:
+            if debug_enabled: logger.debug(f"  探索中(複数): 深度={current_depth}, スコープ数={len(current_level)}, 残り時間: {remaining_time_ms:.0f}ms")
+            # 同じ深度のスコープは並行して探索し、結果はスコープの順に並べる
+            elements_per_scope = await asyncio.gather(*(find_in_scope(scope, current_depth, remaining_time_ms) for scope in current_level))
+            for current_scope, elements_in_scope in zip(current_level, elements_per_scope):
+                for elem in elements_in_scope:
+                    found_elements.append((elem, current_scope))
+            if max_results is not None and len(found_elements) >= max_results:
+                logger.info(f"動的探索(複数): 指定件数 {max_results} に達したため、以降の探索を打ち切ります。")
+                del found_elements[max_results:]
+                break
 
     final_elapsed_time = (time.monotonic() - start_time) * 1000
     logger.info(f"動的探索(複数)完了: 合計 {len(found_elements)} 個の要素が見つかりました。({final_elapsed_time:.0f}ms)")
-    return found_elements
\ No newline at end of file
+    return found_elements
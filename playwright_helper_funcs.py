@@ -5,16 +5,18 @@ Playwrightに関連するヘルパー関数 (要素探索以外) を提供しま
 """
 import asyncio
 import logging
+import re
 import time
 from playwright.async_api import (
     Page,
     Frame,
     Locator,
     BrowserContext,
+    Route,
     TimeoutError as PlaywrightTimeoutError,
     Error as PlaywrightError
 )
-from typing import Tuple, Optional, Union
+from typing import Tuple, Optional, Union, Dict, List
 from urllib.parse import urljoin
 
 import config
@@ -22,10 +24,69 @@ import utils # PDF関連の関数を使用するため
 
 logger = logging.getLogger(__name__)
 
+# --- 一時ページのプール ---
+# id(コンテキスト) -> (コンテキスト本体, 使い回せるページのリスト)
+# URLごとにページを作成・破棄する代わりに about:blank に戻したページを再利用する。
+# コンテキスト本体も保持し、id の再利用による取り違えを防ぐ
+_PAGE_POOLS: Dict[int, Tuple[BrowserContext, List[Page]]] = {}
+
+# テキスト取得に不要なリソース (画像・動画・音声・フォント) のURL。
+# スタイルシートは innerText (非表示要素の除外) に影響するため対象外。
+# URLパターンでの指定なので、該当しないリクエストは横取りされない (Pythonとの往復が発生しない)
+_MEDIA_URL_PATTERN = re.compile(
+    r"\.(?:png|jpe?g|gif|webp|avif|svg|ico|bmp|woff2?|ttf|otf|eot|mp4|webm|ogg|mp3|wav|m4a)(?:[?#]|$)", re.IGNORECASE
+)
+
+async def _abort_route(route: Route) -> None:
+    await route.abort()
+
+async def _new_text_fetch_page(context: BrowserContext) -> Page:
+    """テキスト/メール取得用の一時ページを作成します (設定により画像・動画・フォントの読み込みを中止)。"""
+    page = await context.new_page()
+    if config.TEXT_FETCH_BLOCK_MEDIA:
+        await page.route(_MEDIA_URL_PATTERN, _abort_route)
+    return page
+
+async def acquire_pooled_page(context: BrowserContext) -> Page:
+    """コンテキストのプールから使い回せるページを取り出します。なければ新しく作成します。"""
+    # 閉じられたコンテキストのページしか残っていないプールはここで捨てる
+    for context_id in [cid for cid, (_, pages) in _PAGE_POOLS.items() if all(p.is_closed() for p in pages)]:
+        del _PAGE_POOLS[context_id]
+    entry = _PAGE_POOLS.get(id(context))
+    if entry is not None and entry[0] is context:
+        pooled_pages = entry[1]
+        while pooled_pages:
+            page = pooled_pages.pop() # 直近に返したページから使う (LIFO)
+            if not page.is_closed():
+                return page
+    return await _new_text_fetch_page(context)
+
+async def release_pooled_page(context: BrowserContext, page: Page) -> None:
+    """
+    使い終わったページを about:blank に戻してプールに返します。
+    プールが上限に達している場合や、リセットに失敗した場合はページを閉じます。
+    """
+    if page.is_closed():
+        return
+    entry = _PAGE_POOLS.get(id(context))
+    if entry is None or entry[0] is not context:
+        entry = _PAGE_POOLS[id(context)] = (context, [])
+    pooled_pages = entry[1]
+    if len(pooled_pages) < config.PAGE_POOL_MAX_SIZE:
+        try:
+            await page.goto("about:blank", timeout=5000)
+            if not page.is_closed() and len(pooled_pages) < config.PAGE_POOL_MAX_SIZE:
+                pooled_pages.append(page)
+                return
+        except Exception as reset_e:
+            logger.debug(f"一時ページのリセットに失敗したため閉じます: {reset_e}")
+    if not page.is_closed():
+        await page.close()
+
 
 async def get_page_inner_text(context: BrowserContext, url: str, timeout: int) -> Tuple[bool, Optional[str]]:
     """
-    指定されたURLに新しいページでアクセスし、ページのinnerTextを取得する。
+    指定されたURLに一時ページ (プールから再利用) でアクセスし、ページのinnerTextを取得する。
     成功したかどうかとテキスト内容（またはエラーメッセージ）のタプルを返す。
     """
     page = None
@@ -34,11 +95,12 @@ async def get_page_inner_text(context: BrowserContext, url: str, timeout: int) -
     page_access_timeout = max(int(timeout * 0.8), 15000) # アクションタイムアウトの80%か15秒の大きい方
     logger.info(f"URLからテキスト取得開始: {url} (タイムアウト: {page_access_timeout}ms)")
     try:
-        page = await context.new_page()
+        page = await acquire_pooled_page(context) # 一時ページはプールから再利用
         # ナビゲーションタイムアウトを設定 (ページアクセスタイムアウトの90%か10秒の大きい方)
         nav_timeout = max(int(page_access_timeout * 0.9), 10000)
         logger.debug(f"  Navigating to {url} with timeout {nav_timeout}ms")
-        await page.goto(url, wait_until="load", timeout=nav_timeout)
+        # テキスト取得にはDOMの構築完了で十分なため、サブリソースの読み込み完了 (load) は待たない
+        await page.goto(url, wait_until="domcontentloaded", timeout=nav_timeout)
         logger.debug(f"  Navigation to {url} successful.")
 
         # <body>要素が表示されるまで待機 (残り時間の50%か2秒の大きい方)
@@ -79,27 +141,40 @@ async def get_page_inner_text(context: BrowserContext, url: str, timeout: int) -
     finally:
         if page and not page.is_closed():
             try:
-                await page.close()
-                logger.debug(f"一時ページ ({url}) を閉じました。")
+                await release_pooled_page(context, page)
+                logger.debug(f"一時ページ ({url}) をプールに返しました。")
             except Exception as close_e:
-                logger.warning(f"一時ページ ({url}) クローズ中にエラー (無視): {close_e}")
+                logger.warning(f"一時ページ ({url}) の返却中にエラー (無視): {close_e}")
+
+
+async def get_pages_inner_texts(
+    context: BrowserContext, urls: List[str], timeout: int, concurrency: int = 4
+) -> List[Tuple[bool, Optional[str]]]:
+    """
+    複数のURLについて get_page_inner_text を並行して実行し、URLの順に結果を返す。
+    同時実行数は concurrency 件までに制限する (一時ページはプールから再利用される)。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch_one(url: str) -> Tuple[bool, Optional[str]]:
+        async with semaphore:
+            return await get_page_inner_text(context, url, timeout)
+
+    return list(await asyncio.gather(*(fetch_one(url) for url in urls)))
 
 
 async def generate_iframe_selector_async(iframe_locator: Locator) -> Optional[str]:
     """
     iframe要素のLocatorから、特定しやすいセレクター文字列を生成する試み (id, name, src の順)。
-    属性取得は短いタイムアウトで並行実行し、エラーは無視します。
+    3つの属性は1回の evaluate でまとめて取得し (CDP往復を1回に削減)、エラーは無視します。
     """
     try:
-        # 属性取得を並行実行 (タイムアウト短め: 200ms)
-        attrs = await asyncio.gather(
-            iframe_locator.get_attribute('id', timeout=200),
-            iframe_locator.get_attribute('name', timeout=200),
-            iframe_locator.get_attribute('src', timeout=200),
-            return_exceptions=True # エラーが発生しても処理を止めない
+        # 属性をまとめて取得 (タイムアウト短め: 500ms)
+        attrs = await iframe_locator.evaluate(
+            "el => ({id: el.id, name: el.name, src: el.getAttribute('src')})",
+            timeout=500
         )
-        # 結果から例外を除外して値を取得
-        iframe_id, iframe_name, iframe_src = [a if not isinstance(a, Exception) else None for a in attrs]
+        iframe_id, iframe_name, iframe_src = attrs.get('id'), attrs.get('name'), attrs.get('src')
 
         # 優先度順にセレクターを生成
         if iframe_id:
@@ -110,9 +185,9 @@ async def generate_iframe_selector_async(iframe_locator: Locator) -> Optional[st
             # srcは長すぎる場合があるので注意が必要だが、特定には役立つ場合がある
             return f'iframe[src="{iframe_src}"]'
 
-    except Exception as e:
+    except (PlaywrightError, PlaywrightTimeoutError) as e:
         # 属性取得中のエラーはデバッグレベルでログ記録し、無視
         logger.debug(f"iframe属性取得中にエラー（無視）: {e}")
 
     # 適切なセレクターが見つからなければNoneを返す
-    return None
\ No newline at end of file
+    return None
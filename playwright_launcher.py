@@ -4,10 +4,15 @@ Playwrightの起動、初期設定、アクション実行の呼び出し、終
 ステルスモードエラー時のリトライ機能を追加。
 """
 import asyncio
+import json
 import logging
 import os
+import subprocess
+import sys
+import tempfile
 import time
 import traceback
+import urllib.request
 import warnings
 from playwright.async_api import (
     async_playwright,
@@ -18,9 +23,11 @@ from playwright.async_api import (
     Error as PlaywrightError,
 )
 from playwright_stealth import stealth_async
-from typing import List, Tuple, Dict, Any, Optional # Optional を追加
+from collections import deque
+from typing import List, Tuple, Dict, Any, Optional, Callable, AsyncIterator, Deque # Optional を追加
 
 import config
+import utils
 from playwright_actions import execute_actions_async # アクション実行関数をインポート
 
 logger = logging.getLogger(__name__)
@@ -34,20 +41,99 @@ ERROR_MESSAGE_SELECTOR = "body"
 # --- ▲▲▲ 追加 ▲▲▲ ---
 
 
-# --- ▼▼▼ 追加: ブラウザとコンテキストを起動するヘルパー関数 ▼▼▼ ---
-async def _launch_browser_and_context(
+# --- 常駐ブラウザ (CDP接続) 用ヘルパー関数 ---
+def _read_cdp_endpoint_file() -> Optional[str]:
+    """常駐ブラウザの接続先ファイルを読み込む。存在しなければ None を返す。"""
+    try:
+        with open(config.CDP_ENDPOINT_FILE, 'r', encoding='utf-8') as f:
+            endpoint = f.read().strip()
+        return endpoint or None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"CDP接続先ファイル '{config.CDP_ENDPOINT_FILE}' の読み込みに失敗しました: {e}")
+        return None
+
+def _spawn_persistent_chromium(executable_path: str, headless_mode: bool) -> str:
+    """
+    Playwright の管理外で Chromium をリモートデバッグ付きで起動し、wsEndpoint を返す (同期的)。
+    起動したブラウザはこのプロセスの終了後も残り、次回以降の実行で connect_over_cdp により再利用される。
+    """
+    port = config.CDP_REMOTE_DEBUGGING_PORT
+    user_data_dir = os.path.join(tempfile.gettempdir(), f"web_runner_cdp_profile_{port}")
+    launch_args = [
+        executable_path,
+        f"--remote-debugging-port={port}",
+        f"--user-data-dir={user_data_dir}",
+        "--no-first-run",
+        "--no-default-browser-check",
+    ]
+    if headless_mode:
+        launch_args.append("--headless=new")
+    logger.info(f"常駐用 Chromium を起動します (Port: {port}, Headless: {headless_mode})...")
+    popen_kwargs: Dict[str, Any] = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if sys.platform == "win32":
+        popen_kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_kwargs["start_new_session"] = True # 親プロセス終了時に巻き込まれないようにする
+    subprocess.Popen(launch_args, **popen_kwargs)
+
+    # DevTools の HTTP エンドポイントが応答するまで待機し、wsEndpoint を取得
+    version_url = f"http://127.0.0.1:{port}/json/version"
+    deadline = time.monotonic() + config.CDP_STARTUP_TIMEOUT / 1000
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(version_url, timeout=1) as response:
+                ws_endpoint = json.loads(response.read().decode('utf-8'))["webSocketDebuggerUrl"]
+            with open(config.CDP_ENDPOINT_FILE, 'w', encoding='utf-8') as f:
+                f.write(ws_endpoint)
+            logger.info(f"常駐用 Chromium の起動を確認しました: {ws_endpoint} (保存先: '{config.CDP_ENDPOINT_FILE}')")
+            return ws_endpoint
+        except Exception:
+            time.sleep(0.2)
+    raise PlaywrightError(f"常駐用 Chromium が {config.CDP_STARTUP_TIMEOUT}ms 以内に応答しませんでした ({version_url})。")
+
+async def _launch_browser(
     playwright_instance,
     headless_mode: bool,
     slow_motion: int,
-    default_timeout: int,
-    apply_stealth: bool = True # ステルスモードを適用するかどうかのフラグ
-) -> Tuple[Browser, BrowserContext]:
-    """ブラウザとコンテキストを起動し、オプションでステルスモードを適用する"""
+    cdp_endpoint: Optional[str] = None,
+    keep_alive: bool = False
+) -> Browser:
+    """
+    ブラウザを起動する。cdp_endpoint が指定されていれば既存ブラウザへ CDP で接続する。
+    keep_alive が指定され cdp_endpoint がない場合は、保存済みの常駐ブラウザへ接続し、
+    接続できなければ常駐ブラウザを新たに起動して接続する。
+    """
+    if not cdp_endpoint and keep_alive:
+        saved_endpoint = _read_cdp_endpoint_file()
+        if saved_endpoint:
+            try:
+                logger.info(f"保存済みの常駐ブラウザへ接続します: {saved_endpoint}")
+                return await playwright_instance.chromium.connect_over_cdp(saved_endpoint, slow_mo=slow_motion, timeout=5000)
+            except Exception as e:
+                logger.warning(f"保存済みの常駐ブラウザへ接続できませんでした。新たに起動します: {e}")
+        cdp_endpoint = await asyncio.to_thread(
+            _spawn_persistent_chromium, playwright_instance.chromium.executable_path, headless_mode
+        )
+
+    if cdp_endpoint:
+        logger.info(f"既存ブラウザへ CDP 接続します (Endpoint: {cdp_endpoint}, SlowMo: {slow_motion}ms)...")
+        return await playwright_instance.chromium.connect_over_cdp(cdp_endpoint, slow_mo=slow_motion)
+
     logger.info(f"ブラウザ起動 (Chromium, Headless: {headless_mode}, SlowMo: {slow_motion}ms)...")
-    browser = await playwright_instance.chromium.launch(
+    return await playwright_instance.chromium.launch(
         headless=headless_mode,
         slow_mo=slow_motion,
     )
+
+# --- ▼▼▼ 追加: ブラウザコンテキストを作成するヘルパー関数 ▼▼▼ ---
+async def _create_context(
+    browser: Browser,
+    default_timeout: int,
+    apply_stealth: bool = True # ステルスモードを適用するかどうかのフラグ
+) -> BrowserContext:
+    """ブラウザ上に新しいコンテキストを作成し、オプションでステルスモードを適用する"""
     logger.info("新しいブラウザコンテキストを作成します...")
     context = await browser.new_context(
         user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
@@ -70,41 +156,125 @@ async def _launch_browser_and_context(
     else:
         logger.info("Stealth mode is disabled for this context.")
 
-    return browser, context
+    return context
 # --- ▲▲▲ 追加 ▲▲▲ ---
 
 
-async def run_playwright_automation_async(
+async def _close_context_quietly(context: Optional[BrowserContext]) -> None:
+    """コンテキストを閉じる。既に閉じられている場合のエラーは無視する。"""
+    if not context:
+        logger.debug("ブラウザコンテキストは存在しません。")
+        return
+    try:
+        await context.close()
+        logger.info("ブラウザコンテキストを閉じました。")
+    except Exception as context_close_e:
+        if "closed" not in str(context_close_e).lower():
+            logger.warning(f"ブラウザコンテキストのクローズ中にエラーが発生しました (無視): {context_close_e}")
+
+
+# --- 使い回し用のブラウザコンテキストプール (ステルス適用済みのコンテキストのみ保持) ---
+# 要素は (コンテキスト, 作成時刻(monotonic))。ブラウザが切断・再起動されたものは取り出し時に破棄する
+_CONTEXT_POOL: Deque[Tuple[BrowserContext, float]] = deque()
+_CONTEXT_CREATED_AT: Dict[int, float] = {} # id(コンテキスト) -> 作成時刻 (貸出中のものも含む)
+
+
+def _is_context_expired(context: BrowserContext, created_at: float, browser: Browser) -> bool:
+    """プールのコンテキストが再利用できない (期限切れ・別ブラウザ・切断済み) かどうか。"""
+    return (
+        time.monotonic() - created_at > config.CONTEXT_POOL_MAX_AGE_SEC
+        or context.browser is not browser
+        or not browser.is_connected()
+    )
+
+
+async def _checkout_pooled_context(browser: Browser, default_timeout: int) -> BrowserContext:
+    """プールから指定ブラウザ上のステルス適用済みコンテキストを取り出す。なければ新規作成する。"""
+    for pooled_entry in list(_CONTEXT_POOL):
+        context, created_at = pooled_entry
+        if context.browser is not browser and context.browser is not None and context.browser.is_connected():
+            continue # 起動設定の異なる別の共有ブラウザのものは残しておく
+        if pooled_entry not in _CONTEXT_POOL:
+            continue # 待機中に他の呼び出しが取り出した
+        _CONTEXT_POOL.remove(pooled_entry)
+        if _is_context_expired(context, created_at, browser):
+            _CONTEXT_CREATED_AT.pop(id(context), None)
+            await _close_context_quietly(context)
+            continue
+        context.set_default_timeout(default_timeout)
+        logger.info("プール済みのブラウザコンテキストを再利用します。")
+        return context
+    context = await _create_context(browser, default_timeout, apply_stealth=True)
+    _CONTEXT_CREATED_AT[id(context)] = time.monotonic()
+    return context
+
+
+async def _release_pooled_context(context: BrowserContext, browser: Browser) -> None:
+    """
+    コンテキストを初期化 (Cookie・権限の消去、ページを閉じる) してプールに戻す。
+    プールが満杯・期限切れ・初期化失敗の場合は閉じる。
+    localStorage・IndexedDB・Service Worker・HTTPキャッシュは消去されないため、
+    reuse_context は実行間でそれらが残ることを許容する呼び出し側 (CONTEXT_POOL_ENABLED 有効時) だけが使う。
+    """
+    created_at = _CONTEXT_CREATED_AT.get(id(context))
+    if created_at is None or len(_CONTEXT_POOL) >= config.CONTEXT_POOL_MAX_SIZE or _is_context_expired(context, created_at, browser):
+        _CONTEXT_CREATED_AT.pop(id(context), None)
+        await _close_context_quietly(context)
+        return
+    try:
+        for pooled_page in list(context.pages):
+            await pooled_page.close()
+        await context.clear_cookies()
+        await context.clear_permissions()
+    except Exception as reset_err:
+        logger.warning(f"コンテキストの初期化に失敗したため破棄します: {type(reset_err).__name__} - {reset_err}")
+        _CONTEXT_CREATED_AT.pop(id(context), None)
+        await _close_context_quietly(context)
+        return
+    _CONTEXT_POOL.append((context, created_at))
+    logger.debug(f"ブラウザコンテキストをプールに戻しました (プール数: {len(_CONTEXT_POOL)})。")
+
+
+async def _close_pooled_contexts() -> None:
+    """プールに保持しているコンテキストをすべて閉じる。"""
+    while _CONTEXT_POOL:
+        context, _ = _CONTEXT_POOL.popleft()
+        await _close_context_quietly(context)
+    _CONTEXT_CREATED_AT.clear()
+
+
+async def run_actions_on_browser(
+        browser: Browser,
         target_url: str,
         actions: List[Dict[str, Any]],
-        headless_mode: bool = False,
-        slow_motion: int = 100,
-        default_timeout: int = config.DEFAULT_ACTION_TIMEOUT
+        default_timeout: int = config.DEFAULT_ACTION_TIMEOUT,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+        reuse_context: bool = False
     ) -> Tuple[bool, List[Dict[str, Any]]]:
     """
-    Playwright を非同期で初期化し、指定されたURLにアクセス後、一連のアクションを実行します。
-    ステルスモードでエラーが発生した場合、ステルスモードなしでリトライします。
+    起動済みのブラウザ上に専用のコンテキストを作成し、指定されたURLにアクセス後、一連のアクションを実行します。
+    ステルスモードでエラーが発生した場合、ステルスモードなしの新しいコンテキストでリトライします。
+    ブラウザ自体は閉じないため、複数のジョブで同じブラウザを共有できます。
+    on_result は各ステップの結果が確定するたびに呼び出されます (execute_actions_async に委譲)。
+    reuse_context=True の場合、ステルス適用済みのコンテキストをプールから取り出し、終了後に初期化して戻します
+    (Cookie・権限以外のストレージは前の実行から引き継がれるため、実行間の分離は保証されません)。
+    既定 (False) では実行ごとに専用のコンテキストを作成して閉じるため、実行間で状態は共有されません。
     """
-    logger.info("--- Playwright 自動化開始 (非同期) ---")
     all_success = False
     final_results: List[Dict[str, Any]] = []
-    playwright = None
-    browser: Optional[Browser] = None # Optional に変更
     context: Optional[BrowserContext] = None
     page: Optional[Page] = None
     initial_navigation_successful = False
     retry_attempted = False # リトライフラグ
+    effective_default_timeout = default_timeout if default_timeout else config.DEFAULT_ACTION_TIMEOUT
 
     try:
-        playwright = await async_playwright().start()
-        effective_default_timeout = default_timeout if default_timeout else config.DEFAULT_ACTION_TIMEOUT
-
         # --- 1回目の試行 (ステルスモードあり) ---
         logger.info("--- Initial attempt (with Stealth Mode) ---")
-        apply_stealth_mode = True # 最初はステルスモードを適用
-        browser, context = await _launch_browser_and_context(
-            playwright, headless_mode, slow_motion, effective_default_timeout, apply_stealth=apply_stealth_mode
-        )
+        if reuse_context:
+            context = await _checkout_pooled_context(browser, effective_default_timeout)
+        else:
+            context = await _create_context(browser, effective_default_timeout, apply_stealth=True)
 
         logger.info("新しいページを作成します...")
         page = await context.new_page()
@@ -132,18 +302,15 @@ async def run_playwright_automation_async(
                      retry_attempted = True
                      initial_navigation_successful = False # リトライするので一旦失敗扱い
 
-                     # --- 現在のブラウザとコンテキストを閉じる ---
-                     logger.info("Closing current browser and context for retry...")
-                     if context: await context.close()
-                     if browser: await browser.close()
-                     browser, context, page = None, None, None # リセット
+                     # --- 現在のコンテキストを閉じる (ステルスはコンテキスト単位なのでブラウザは再利用) ---
+                     logger.info("Closing current context for retry...")
+                     _CONTEXT_CREATED_AT.pop(id(context), None) # ブロックされたコンテキストはプールに戻さない
+                     await _close_context_quietly(context)
+                     context, page = None, None # リセット
 
                      # --- 2回目の試行 (ステルスモードなし) ---
                      logger.info("--- Retry attempt (without Stealth Mode) ---")
-                     apply_stealth_mode = False # ステルスモードを無効化
-                     browser, context = await _launch_browser_and_context(
-                         playwright, headless_mode, slow_motion, effective_default_timeout, apply_stealth=apply_stealth_mode
-                     )
+                     context = await _create_context(browser, effective_default_timeout, apply_stealth=False)
                      logger.info("新しいページを作成します (リトライ)...")
                      page = await context.new_page()
                      api_request_context = context.request # APIリクエストコンテキストを再取得
@@ -157,7 +324,7 @@ async def run_playwright_automation_async(
             except PlaywrightTimeoutError:
                  logger.warning(f"Timeout while checking for error message in '{ERROR_MESSAGE_SELECTOR}'. Assuming no error message found.")
             except Exception as check_err:
-                logger.warning(f"Error checking for stealth message: {check_err}. Proceeding...", exc_info=True)
+                logger.warning(f"Error checking for stealth message: {check_err}. Proceeding...", exc_info=logger.isEnabledFor(logging.DEBUG))
             # --- ▲▲▲ エラーメッセージチェック ▲▲▲ ---
 
         except (PlaywrightTimeoutError, PlaywrightError) as nav_error:
@@ -169,7 +336,7 @@ async def run_playwright_automation_async(
         if initial_navigation_successful and page:
             logger.info("アクションの実行を開始します...")
             all_success, final_results = await execute_actions_async(
-                page, actions, api_request_context, effective_default_timeout
+                page, actions, api_request_context, effective_default_timeout, on_result=on_result
             )
             if all_success:
                 logger.info("すべてのステップが正常に完了しました。")
@@ -185,65 +352,280 @@ async def run_playwright_automation_async(
 
     # --- 全体的なエラーハンドリング ---
     except (PlaywrightTimeoutError, PlaywrightError, Exception) as e:
-         error_msg_overall = f"Playwright 処理全体で予期せぬエラーが発生しました: {type(e).__name__} - {e}"
-         logger.error(error_msg_overall, exc_info=True)
-         overall_error_screenshot_path = None
-         if page and not page.is_closed():
-              timestamp = time.strftime("%Y%m%d_%H%M%S")
-              overall_error_ss_filename = f"error_overall_{timestamp}.png"
-              overall_error_ss_path = os.path.join(config.DEFAULT_SCREENSHOT_DIR, overall_error_ss_filename)
-              try:
-                  os.makedirs(config.DEFAULT_SCREENSHOT_DIR, exist_ok=True)
-                  await page.screenshot(path=overall_error_ss_path, full_page=True, timeout=10000)
-                  logger.info(f"全体エラー発生時のスクリーンショットを保存しました: {overall_error_ss_path}")
-                  overall_error_screenshot_path = overall_error_ss_path
-              except Exception as ss_e:
-                  logger.error(f"全体エラー発生時のスクリーンショット保存に失敗しました: {ss_e}")
-         if not final_results or (isinstance(final_results[-1].get("status"), str) and final_results[-1].get("status") != "error"):
-             error_details = {
-                 "step": "Overall Execution",
-                 "status": "error",
-                 "message": str(e),
-                 "full_error": error_msg_overall,
-                 "traceback": traceback.format_exc()
-             }
-             if overall_error_screenshot_path:
-                 error_details["error_screenshot"] = overall_error_screenshot_path
-             final_results.append(error_details)
+         all_success = False
+         _append_overall_error(final_results, e, await _save_overall_error_screenshot(page), on_result=on_result)
+
+    # --- コンテキストのクリーンアップ ---
+    finally:
+        if reuse_context and context is not None and not retry_attempted:
+            await _release_pooled_context(context, browser)
+        else:
+            await _close_context_quietly(context)
+
+    return all_success, final_results
+
+
+async def _save_overall_error_screenshot(page: Optional[Page]) -> Optional[str]:
+    """全体エラー発生時のスクリーンショットを保存し、そのパスを返す。保存できなければ None。"""
+    if not page or page.is_closed():
+        return None
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    overall_error_ss_filename = f"error_overall_{timestamp}.png"
+    overall_error_ss_path = os.path.join(config.DEFAULT_SCREENSHOT_DIR, overall_error_ss_filename)
+    try:
+        utils.ensure_directory(config.DEFAULT_SCREENSHOT_DIR)
+        # ファイル書き込みはイベントループを塞がないようスレッドで行う
+        overall_error_ss_bytes = await page.screenshot(full_page=True, timeout=10000)
+        await utils.write_bytes_to_file_async(overall_error_ss_path, overall_error_ss_bytes)
+        logger.info(f"全体エラー発生時のスクリーンショットを保存しました: {overall_error_ss_path}")
+        return overall_error_ss_path
+    except Exception as ss_e:
+        logger.error(f"全体エラー発生時のスクリーンショット保存に失敗しました: {ss_e}")
+        return None
+
+
+def _append_overall_error(
+    final_results: List[Dict[str, Any]],
+    e: BaseException,
+    overall_error_screenshot_path: Optional[str] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> None:
+    """
+    全体エラーの詳細をログ出力し、最後のステップがエラーでなければ結果リストに追加する。
+    on_result が指定されていれば、追加したエラーもステップの結果と同様に通知する。
+    """
+    error_msg_overall = f"Playwright 処理全体で予期せぬエラーが発生しました: {type(e).__name__} - {e}"
+    logger.error(error_msg_overall, exc_info=True)
+    if not final_results or (isinstance(final_results[-1].get("status"), str) and final_results[-1].get("status") != "error"):
+        error_details = {
+            "step": "Overall Execution",
+            "status": "error",
+            "message": str(e),
+            "full_error": error_msg_overall,
+            "traceback": traceback.format_exc()
+        }
+        if overall_error_screenshot_path:
+            error_details["error_screenshot"] = overall_error_screenshot_path
+        final_results.append(error_details)
+        if on_result:
+            on_result(error_details)
+
+
+async def run_playwright_automation_async(
+        target_url: str,
+        actions: List[Dict[str, Any]],
+        headless_mode: bool = False,
+        slow_motion: int = 100,
+        default_timeout: int = config.DEFAULT_ACTION_TIMEOUT,
+        cdp_endpoint: Optional[str] = None,
+        keep_alive: bool = False,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    Playwright を非同期で初期化し、指定されたURLにアクセス後、一連のアクションを実行します。
+    ステルスモードでエラーが発生した場合、ステルスモードなしでリトライします。
+    cdp_endpoint を指定すると既存ブラウザへ CDP 接続し、keep_alive を指定すると
+    常駐ブラウザを再利用して終了時にもブラウザを閉じません (コンテキストは実行ごとに新規作成)。
+    """
+    logger.info("--- Playwright 自動化開始 (非同期) ---")
+    all_success = False
+    final_results: List[Dict[str, Any]] = []
+    playwright = None
+    browser: Optional[Browser] = None # Optional に変更
+
+    try:
+        playwright = await async_playwright().start()
+        browser = await _launch_browser(playwright, headless_mode, slow_motion, cdp_endpoint, keep_alive)
+        all_success, final_results = await run_actions_on_browser(browser, target_url, actions, default_timeout, on_result=on_result)
+
+    # --- 起動時などのエラーハンドリング (アクション実行中のエラーは run_actions_on_browser 内で処理済み) ---
+    except (PlaywrightTimeoutError, PlaywrightError, Exception) as e:
+         _append_overall_error(final_results, e, on_result=on_result)
          all_success = False
 
     # --- クリーンアップ処理 ---
     finally:
         logger.info("クリーンアップ処理を開始します...")
-        if context:
-            try:
-                await context.close()
-                logger.info("ブラウザコンテキストを閉じました。")
-            except Exception as context_close_e:
-                if "closed" not in str(context_close_e).lower():
-                    logger.warning(f"ブラウザコンテキストのクローズ中にエラーが発生しました (無視): {context_close_e}")
-        else:
-             logger.debug("ブラウザコンテキストは存在しません。")
+        await _shutdown_playwright(playwright, browser, keep_alive)
 
-        if browser and browser.is_connected():
-            try:
-                await browser.close()
-                logger.info("ブラウザを閉じました。")
-            except Exception as browser_close_e:
-                logger.error(f"ブラウザのクローズ中にエラーが発生しました: {browser_close_e}")
-        else:
-             logger.debug("ブラウザは接続されていないか、存在しません。")
+    logger.info("--- Playwright 自動化終了 (非同期) ---")
+    return all_success, final_results
 
-        if playwright:
-            try:
-                await playwright.stop()
-                logger.info("Playwright を停止しました。")
-            except Exception as playwright_stop_e:
-                logger.error(f"Playwright の停止中にエラーが発生しました: {playwright_stop_e}")
+
+async def run_playwright_automation_stream(
+        target_url: str,
+        actions: List[Dict[str, Any]],
+        headless_mode: bool = False,
+        slow_motion: int = 100,
+        default_timeout: int = config.DEFAULT_ACTION_TIMEOUT,
+        cdp_endpoint: Optional[str] = None,
+        keep_alive: bool = False
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    run_playwright_automation_async と同じ処理を行い、各ステップの結果を確定した順に (インデックス, 結果) として yield します。
+    結果全体をメモリに溜めずに逐次書き出す用途向けです。
+    実行全体の成否は、status が "error" の結果が1件も yield されなかったかどうかで判定できます。
+    """
+    stream_end = object() # 実行完了を示す番兵
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(run_playwright_automation_async(
+        target_url, actions, headless_mode, slow_motion, default_timeout,
+        cdp_endpoint=cdp_endpoint, keep_alive=keep_alive, on_result=queue.put_nowait
+    ))
+    task.add_done_callback(lambda _: queue.put_nowait(stream_end))
+    streamed_count = 0
+    try:
+        while (record := await queue.get()) is not stream_end:
+            yield streamed_count, record
+            streamed_count += 1
+        # 全体エラーもコールバック経由で yield 済み。念のため、通知されずに残った結果があればここで返す
+        _, final_results = task.result()
+        for record in final_results[streamed_count:]:
+            yield streamed_count, record
+            streamed_count += 1
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def _shutdown_playwright(playwright, browser: Optional[Browser], keep_alive: bool = False) -> None:
+    """ブラウザを閉じ (keep_alive 時は残す)、Playwright を停止する。"""
+    if browser and keep_alive:
+        logger.info("keep_alive が指定されているため、常駐ブラウザは閉じずに残します。")
+    elif browser and browser.is_connected():
+        try:
+            await browser.close()
+            logger.info("ブラウザを閉じました。")
+        except Exception as browser_close_e:
+            logger.error(f"ブラウザのクローズ中にエラーが発生しました: {browser_close_e}")
+    else:
+         logger.debug("ブラウザは接続されていないか、存在しません。")
+
+    if playwright:
         try:
-            await asyncio.sleep(0.1)
-        except Exception as sleep_e:
-            logger.warning(f"クリーンアップ後の待機中にエラーが発生しました: {sleep_e}")
+            await playwright.stop()
+            logger.info("Playwright を停止しました。")
+        except Exception as playwright_stop_e:
+            logger.error(f"Playwright の停止中にエラーが発生しました: {playwright_stop_e}")
+    try:
+        await asyncio.sleep(0.1)
+    except Exception as sleep_e:
+        logger.warning(f"クリーンアップ後の待機中にエラーが発生しました: {sleep_e}")
 
-    logger.info("--- Playwright 自動化終了 (非同期) ---")
-    return all_success, final_results
\ No newline at end of file
+
+async def launch_shared_browser(
+        headless_mode: bool = False,
+        slow_motion: int = 100,
+        cdp_endpoint: Optional[str] = None,
+        keep_alive: bool = False
+    ) -> Tuple[Any, Browser]:
+    """
+    Playwright を起動してブラウザを1つ用意し、(playwright, browser) を返します。
+    呼び出し側が管理する長寿命のブラウザとして run_actions_on_browser に渡して使い回し、
+    不要になったら close_shared_browser で後始末します。
+    """
+    playwright = await async_playwright().start()
+    try:
+        browser = await _launch_browser(playwright, headless_mode, slow_motion, cdp_endpoint, keep_alive)
+    except BaseException:
+        await playwright.stop()
+        raise
+    return playwright, browser
+
+
+async def close_shared_browser(playwright, browser: Optional[Browser], keep_alive: bool = False) -> None:
+    """launch_shared_browser で用意したブラウザを閉じ (keep_alive 時は残す)、Playwright を停止します。"""
+    logger.info("共有ブラウザのクリーンアップ処理を開始します...")
+    await _shutdown_playwright(playwright, browser, keep_alive)
+
+
+# --- プロセス内で使い回すブラウザ (MCPサーバーなど、呼び出しごとの起動コストを避けたい常駐プロセス用) ---
+# 起動設定 (headless, slow_mo) ごとに1つのブラウザを保持する。別の設定の呼び出しが来ても既存のブラウザは閉じない
+_CACHED_PLAYWRIGHT = None
+_CACHED_BROWSERS: Dict[Tuple[bool, int], Browser] = {}
+_CACHED_BROWSER_LOCK: Optional[asyncio.Lock] = None
+
+
+async def get_cached_browser(headless_mode: bool = True, slow_motion: int = 0) -> Browser:
+    """
+    プロセス内で共有するブラウザを返します。起動設定 (headless, slow_mo) ごとに初回 (または切断後) のみ起動します。
+    別の起動設定で呼び出されても、実行中の他の呼び出しが使っているブラウザは閉じません。
+    """
+    global _CACHED_PLAYWRIGHT, _CACHED_BROWSER_LOCK
+    if _CACHED_BROWSER_LOCK is None:
+        _CACHED_BROWSER_LOCK = asyncio.Lock()
+    browser_key = (headless_mode, slow_motion)
+    async with _CACHED_BROWSER_LOCK:
+        browser = _CACHED_BROWSERS.get(browser_key)
+        if browser is not None:
+            if browser.is_connected():
+                return browser
+            # 切断済みのブラウザは使っている実行もすでに失敗しているため、この設定のものだけ破棄する
+            logger.info(f"共有ブラウザが切断されていたため再起動します (headless={headless_mode}, slow_mo={slow_motion})。")
+            del _CACHED_BROWSERS[browser_key]
+        if _CACHED_PLAYWRIGHT is None:
+            _CACHED_PLAYWRIGHT = await async_playwright().start()
+        browser = await _launch_browser(_CACHED_PLAYWRIGHT, headless_mode, slow_motion)
+        _CACHED_BROWSERS[browser_key] = browser
+        logger.info(f"共有ブラウザを起動しました (headless={headless_mode}, slow_mo={slow_motion})。")
+        return browser
+
+
+async def close_cached_browser() -> None:
+    """get_cached_browser で起動したすべてのブラウザを閉じ、Playwright を停止します。"""
+    global _CACHED_PLAYWRIGHT
+    await _close_pooled_contexts()
+    for browser in list(_CACHED_BROWSERS.values()):
+        await _shutdown_playwright(None, browser)
+    _CACHED_BROWSERS.clear()
+    if _CACHED_PLAYWRIGHT is not None:
+        await close_shared_browser(_CACHED_PLAYWRIGHT, None)
+    _CACHED_PLAYWRIGHT = None
+
+
+async def run_playwright_batch_async(
+        jobs: List[Tuple[str, List[Dict[str, Any]], int]],
+        headless_mode: bool = False,
+        slow_motion: int = 100,
+        parallelism: int = 4,
+        cdp_endpoint: Optional[str] = None,
+        keep_alive: bool = False
+    ) -> List[Tuple[bool, List[Dict[str, Any]]]]:
+    """
+    複数のジョブ (target_url, actions, default_timeout) を1つのブラウザで並行実行します。
+    Playwright とブラウザの起動は1回のみで、各ジョブは専用の BrowserContext で分離されます。
+    同時実行数は parallelism で制限し、結果はジョブと同じ順序で返します。
+    """
+    logger.info(f"--- Playwright バッチ自動化開始 (ジョブ数: {len(jobs)}, 同時実行数: {parallelism}) ---")
+    batch_results: List[Tuple[bool, List[Dict[str, Any]]]] = [(False, []) for _ in jobs]
+    playwright = None
+    browser: Optional[Browser] = None
+
+    try:
+        playwright = await async_playwright().start()
+        browser = await _launch_browser(playwright, headless_mode, slow_motion, cdp_endpoint, keep_alive)
+        semaphore = asyncio.Semaphore(max(1, parallelism))
+
+        async def run_one(index: int, target_url: str, actions: List[Dict[str, Any]], default_timeout: int) -> None:
+            async with semaphore:
+                logger.info(f"[ジョブ {index + 1}/{len(jobs)}] 開始: {target_url}")
+                batch_results[index] = await run_actions_on_browser(browser, target_url, actions, default_timeout)
+                logger.info(f"[ジョブ {index + 1}/{len(jobs)}] 終了 (成功: {batch_results[index][0]})")
+
+        await asyncio.gather(*(
+            run_one(idx, target_url, actions, default_timeout)
+            for idx, (target_url, actions, default_timeout) in enumerate(jobs)
+        ))
+
+    except (PlaywrightTimeoutError, PlaywrightError, Exception) as e:
+         # ブラウザ起動失敗など、まだ結果を持たないジョブにエラーを記録する
+         for success, job_results in batch_results:
+             if not success and not job_results:
+                 _append_overall_error(job_results, e)
+
+    finally:
+        logger.info("クリーンアップ処理を開始します...")
+        await _shutdown_playwright(playwright, browser, keep_alive)
+
+    logger.info("--- Playwright バッチ自動化終了 ---")
+    return batch_results
@@ -1,26 +1,84 @@
 # --- ファイル: utils.py (結果追記機能追加版) ---
 import json
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import shutil
 import sys
 import asyncio
+import atexit
+import hashlib
+import threading
 import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
 import fitz  # PyMuPDF
+try:
+    import orjson # 高速JSONパーサー (オプション)
+except ImportError:
+    orjson = None
 from playwright.async_api import APIRequestContext, TimeoutError as PlaywrightTimeoutError
 # <<< typing に Optional, Dict, Any, List, Union を追加 >>>
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Set, Tuple, Union
 from urllib.parse import urljoin
 
 import config
 
 logger = logging.getLogger(__name__)
 
+# ensure_directory で作成確認済みのディレクトリ (プロセス内で1回だけ makedirs する)
+_ENSURED_DIRS: Set[str] = set()
+
+def ensure_directory(dir_path: str) -> None:
+    """ディレクトリが存在することを保証する。同じパスに対する makedirs はプロセス内で初回のみ行う。"""
+    if dir_path and dir_path not in _ENSURED_DIRS:
+        os.makedirs(dir_path, exist_ok=True)
+        _ENSURED_DIRS.add(dir_path)
+
 # --- setup_logging_for_standalone, load_input_from_json, ---
 # --- extract_text_from_pdf_sync, download_pdf_async は変更なし ---
 # (コードは省略)
-def setup_logging_for_standalone(log_file_path: str = config.LOG_FILE):
-    """Web-Runner単体実行用のロギング設定を行います。"""
+_LOG_QUEUE_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+def _stop_log_queue_listener() -> None:
+    """QueueListener を停止し、キューに残ったログを書き出す。"""
+    global _LOG_QUEUE_LISTENER
+    if _LOG_QUEUE_LISTENER is not None:
+        _LOG_QUEUE_LISTENER.stop()
+        _LOG_QUEUE_LISTENER = None
+
+atexit.register(_stop_log_queue_listener)
+
+def _start_queued_file_logging(file_handler: logging.Handler) -> logging.handlers.QueueHandler:
+    """file_handler への出力を別スレッドの QueueListener 経由にし、ロガーに登録する QueueHandler を返す。"""
+    global _LOG_QUEUE_LISTENER
+    _stop_log_queue_listener() # 再設定時は前のリスナーを止めて残りを書き出す
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _LOG_QUEUE_LISTENER = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _LOG_QUEUE_LISTENER.start()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # 書式付けは file_handler 側で行う (basicConfig による書式の二重適用を防ぐ)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    return queue_handler
+
+# setup_logging_for_standalone で設定済みの (ログファイルパス, buffered)。同じ設定での再呼び出しを省略する
+_LOGGING_SETUP_KEY: Optional[Tuple[str, bool]] = None
+
+def setup_logging_for_standalone(log_file_path: str = config.LOG_FILE, buffered: bool = False):
+    """
+    Web-Runner単体実行用のロギング設定を行います。同じ引数での再呼び出しは何もしません (冪等)。
+    buffered=True の場合、ファイル出力を MemoryHandler で束ね、レコードごとの write を減らします
+    (ERROR 以上のレコード、容量到達時、終了時にまとめて書き出されます)。
+    """
+    global _LOGGING_SETUP_KEY
+    setup_key = (log_file_path, buffered)
+    if _LOGGING_SETUP_KEY == setup_key:
+        return # 同じ設定で設定済みならファイル操作・ハンドラ再作成を行わない
     log_level = logging.INFO # デフォルトレベル
     root_logger = logging.getLogger()
     for handler in root_logger.handlers[:]:
@@ -33,26 +91,21 @@ def setup_logging_for_standalone(log_file_path: str = config.LOG_FILE):
     file_handler = None
     try:
         log_dir = os.path.dirname(log_file_path)
-        if log_dir:
-            if not os.path.exists(log_dir):
-                try:
-                    os.makedirs(log_dir, exist_ok=True)
-                    print(f"DEBUG [utils]: Created directory '{log_dir}'")
-                except Exception as e:
-                    print(f"警告 [utils]: ログディレクトリ '{log_dir}' の作成に失敗しました: {e}", file=sys.stderr)
-                    raise
-            else:
-                print(f"DEBUG [utils]: Directory '{log_dir}' already exists.")
         try:
-            with open(log_file_path, 'a') as f:
-                print(f"DEBUG [utils]: Successfully opened (or created) '{log_file_path}' for appending.")
+            ensure_directory(log_dir) # 作成確認はプロセス内で1回のみ
         except Exception as e:
-             print(f"警告 [utils]: ログファイル '{log_file_path}' を開けません（権限確認）: {e}", file=sys.stderr)
-             raise
+            print(f"警告 [utils]: ログディレクトリ '{log_dir}' の作成に失敗しました: {e}", file=sys.stderr)
+            raise
+        # FileHandler 自体がファイルを開くため、事前の書き込み確認は行わない (失敗時は下の except で捕捉)
         file_handler = logging.FileHandler(log_file_path, encoding='utf-8', mode='a')
         file_handler.setFormatter(formatter)
-        handlers.append(file_handler)
-        log_target += f" and File ('{log_file_path}')"
+        if buffered:
+            handlers.append(logging.handlers.MemoryHandler(config.LOG_BUFFER_CAPACITY, target=file_handler))
+            log_target += f" and Buffered File ('{log_file_path}', capacity={config.LOG_BUFFER_CAPACITY})"
+        else:
+            # ファイル書き込みは QueueListener のスレッドで行い、イベントループをファイルI/Oで止めない
+            handlers.append(_start_queued_file_logging(file_handler))
+            log_target += f" and Queued File ('{log_file_path}')"
         print(f"DEBUG [utils]: FileHandler created for '{log_file_path}'")
     except Exception as e:
         print(f"警告 [utils]: ログファイル '{log_file_path}' のハンドラ設定に失敗しました: {e}", file=sys.stderr)
@@ -66,13 +119,69 @@ def setup_logging_for_standalone(log_file_path: str = config.LOG_FILE):
     current_logger = logging.getLogger(__name__)
     current_logger.info(f"Standalone logger setup complete. Level: {logging.getLevelName(log_level)}. Target: {log_target}")
     print(f"DEBUG [utils]: Logging setup finished. Root handlers: {logging.getLogger().handlers}")
+    if file_handler is not None:
+        _LOGGING_SETUP_KEY = setup_key
+
+def dumps_json(data: Any) -> str:
+    """
+    インデント付き (2スペース)・非ASCIIエスケープなしの JSON 文字列を返す。
+    orjson があればそちらで高速にシリアライズし、扱えない値を含む場合は標準の json にフォールバックする。
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            pass # 非文字列キーなど orjson が扱えない値は標準 json で処理
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+def loads_json(raw: Union[bytes, str]) -> Any:
+    """
+    JSON をパースする。orjson があれば高速パーサーを使用する。
+    orjson.JSONDecodeError は json.JSONDecodeError のサブクラスなので、呼び出し側の例外処理は共通でよい。
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode('utf-8') if isinstance(raw, bytes) else raw)
+
+def dumps_json_line(data: Any) -> bytes:
+    """JSON Lines 用に、改行を含まない1行の JSON (UTF-8, 末尾改行付き) をバイト列で返す。"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    return (json.dumps(data, ensure_ascii=False) + "\n").encode('utf-8')
+
+def _read_file_bytes(filepath: str) -> bytes:
+    """ファイル全体をバイト列として読み込む。バッファ付きIOを介さず、ファイルサイズ分を直接 os.read する。"""
+    fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        remaining = os.fstat(fd).st_size
+        chunks = []
+        while True:
+            chunk = os.read(fd, max(remaining, 65536))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+    finally:
+        os.close(fd)
+
+def _write_file_bytes(filepath: str, data: bytes) -> None:
+    """バイト列をファイルに一括で書き込む。"""
+    with open(filepath, "wb") as f:
+        f.write(data)
+
+async def write_bytes_to_file_async(filepath: str, data: bytes) -> None:
+    """バイト列のファイル書き込みをスレッドで行い、イベントループをブロックしない。"""
+    await asyncio.to_thread(_write_file_bytes, filepath, data)
 
 def load_input_from_json(filepath: str) -> Dict[str, Any]:
-    """指定されたJSONファイルから入力データを読み込む。"""
+    """指定されたJSONファイルから入力データを読み込む。orjson があれば高速パーサーを使用する。"""
     logger.info(f"入力ファイル '{filepath}' の読み込みを開始します...")
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = loads_json(_read_file_bytes(filepath))
         if "target_url" not in data or not data["target_url"]:
             raise ValueError("JSONファイルに必須キー 'target_url' が存在しないか、値が空です。")
         if "actions" not in data or not isinstance(data["actions"], list):
@@ -94,28 +203,229 @@ def load_input_from_json(filepath: str) -> Dict[str, Any]:
         logger.error(f"入力ファイルの読み込み中に予期せぬエラーが発生しました ({filepath}): {e}", exc_info=True)
         raise
 
+# --- PDFテキスト抽出結果のキャッシュ (PDFデータのハッシュ -> 抽出テキスト, LRU) ---
+# extract_text_from_pdf_sync はスレッドから呼ばれるためロックで保護する
+_PDF_TEXT_CACHE: "OrderedDict[bytes, str]" = OrderedDict()
+_PDF_TEXT_CACHE_LOCK = threading.Lock()
+
+def _pdf_text_cache_key(pdf_data: bytes) -> bytes:
+    return hashlib.blake2b(pdf_data, digest_size=16).digest()
+
+# これより大きいPDFのハッシュ計算はスレッドで行う (hashlib はGILを解放するため、イベントループを止めない)
+_PDF_HASH_IN_THREAD_MIN_BYTES = 1 << 20
+
+def _pdf_text_cache_get(cache_key: bytes) -> Optional[str]:
+    with _PDF_TEXT_CACHE_LOCK:
+        cached_text = _PDF_TEXT_CACHE.get(cache_key)
+        if cached_text is not None:
+            _PDF_TEXT_CACHE.move_to_end(cache_key)
+    return cached_text
+
+def _pdf_text_cache_put(cache_key: bytes, text: Optional[str]) -> None:
+    if text is None or text.startswith("Error:"): # エラー結果はキャッシュしない
+        return
+    with _PDF_TEXT_CACHE_LOCK:
+        _PDF_TEXT_CACHE[cache_key] = text
+        _PDF_TEXT_CACHE.move_to_end(cache_key)
+        while len(_PDF_TEXT_CACHE) > config.PDF_TEXT_CACHE_MAX_ENTRIES:
+            _PDF_TEXT_CACHE.popitem(last=False)
+
 def extract_text_from_pdf_sync(pdf_data: bytes) -> Optional[str]:
-    """PDFのバイトデータからテキストを抽出する (同期的)。エラー時はエラーメッセージ文字列を返す。"""
+    """
+    PDFのバイトデータからテキストを抽出する (同期的)。エラー時はエラーメッセージ文字列を返す。
+    同じ内容のPDFは抽出結果をキャッシュから返す (キーはデータの blake2b ハッシュ)。
+    """
+    cache_key = _pdf_text_cache_key(pdf_data)
+    cached_text = _pdf_text_cache_get(cache_key)
+    if cached_text is not None:
+        logger.info(f"PDFテキスト抽出結果をキャッシュから返します (サイズ: {len(pdf_data)} bytes)。")
+        return cached_text
+    text = _extract_text_from_pdf_uncached(pdf_data)
+    _pdf_text_cache_put(cache_key, text)
+    return text
+
+# poppler の pdftotext コマンド (見つからなければ None)
+_PDFTOTEXT_PATH: Optional[str] = shutil.which("pdftotext")
+
+# --- PDFテキスト抽出用プロセスプール (PyMuPDF の処理で GIL を占有しないよう別プロセスで実行) ---
+_PDF_PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+_PDF_PROCESS_POOL_LOCK = threading.Lock()
+
+def _init_pdf_worker_logging(log_level: int) -> None:
+    """(ワーカープロセス用) 抽出処理のログを標準エラーへ出力するよう、ワーカー内のロギングを設定する。"""
+    logging.basicConfig(
+        level=log_level,
+        format='%(asctime)s - %(name)s - %(levelname)s - [pdf-worker %(process)d] %(message)s'
+    )
+
+def _get_pdf_process_pool() -> ProcessPoolExecutor:
+    """PDF抽出用のプロセスプールを初回使用時に作成して返す。"""
+    global _PDF_PROCESS_POOL
+    with _PDF_PROCESS_POOL_LOCK:
+        if _PDF_PROCESS_POOL is None:
+            max_workers = config.PDF_EXTRACT_MAX_WORKERS or max(2, (os.cpu_count() or 2) // 2)
+            # fork はイベントループ・Playwright・ログ出力スレッドを抱えたプロセスを複製するため、spawn で起動する
+            _PDF_PROCESS_POOL = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_pdf_worker_logging,
+                initargs=(logging.getLogger().getEffectiveLevel(),)
+            )
+            atexit.register(_PDF_PROCESS_POOL.shutdown, wait=False)
+            logger.info(f"PDFテキスト抽出用のプロセスプールを作成しました (ワーカー数: {max_workers})。")
+        return _PDF_PROCESS_POOL
+
+def _discard_pdf_process_pool(broken_pool: ProcessPoolExecutor) -> None:
+    """ワーカーの異常終了などで壊れたプロセスプールを破棄する (他の呼び出しで作り直し済みなら何もしない)。"""
+    global _PDF_PROCESS_POOL
+    with _PDF_PROCESS_POOL_LOCK:
+        if _PDF_PROCESS_POOL is broken_pool:
+            _PDF_PROCESS_POOL = None
+    broken_pool.shutdown(wait=False)
+
+async def extract_text_from_pdf_async(pdf_data: bytes) -> Optional[str]:
+    """
+    PDFのバイトデータからテキストを抽出する (非同期)。抽出処理はプロセスプールで実行する。
+    PDFTOTEXT_MIN_BYTES を超えるPDFは、pdftotext があればそちらで抽出する。
+    キャッシュの参照・更新は呼び出し元プロセスで行う。プールが使えない場合はスレッドで実行する。
+    """
+    if len(pdf_data) >= _PDF_HASH_IN_THREAD_MIN_BYTES:
+        cache_key = await asyncio.to_thread(_pdf_text_cache_key, pdf_data)
+    else:
+        cache_key = _pdf_text_cache_key(pdf_data)
+    cached_text = _pdf_text_cache_get(cache_key)
+    if cached_text is not None:
+        logger.info(f"PDFテキスト抽出結果をキャッシュから返します (サイズ: {len(pdf_data)} bytes)。")
+        return cached_text
+    text = None
+    # 大きなPDFは pdftotext (インストールされている場合) で抽出する
+    if _PDFTOTEXT_PATH and len(pdf_data) > config.PDFTOTEXT_MIN_BYTES:
+        text = await _extract_text_from_pdf_pdftotext(pdf_data)
+        if text is not None:
+            _pdf_text_cache_put(cache_key, text)
+            return text
+    loop = asyncio.get_running_loop()
+    pdf_pool = None
+    try:
+        pdf_pool = _get_pdf_process_pool()
+        text = await _run_pdf_extract_in_pool(loop, pdf_pool, pdf_data)
+    except (BrokenProcessPool, OSError, RuntimeError) as pool_err:
+        logger.warning(f"プロセスプールでのPDF抽出に失敗したため、スレッドで再実行します: {pool_err}")
+        if isinstance(pool_err, BrokenProcessPool) and pdf_pool is not None:
+            _discard_pdf_process_pool(pdf_pool) # 壊れたプールは破棄し、次回の抽出で作り直す
+        text = await asyncio.to_thread(_extract_text_from_pdf_uncached, pdf_data)
+    _pdf_text_cache_put(cache_key, text)
+    return text
+
+async def _run_pdf_extract_in_pool(loop: asyncio.AbstractEventLoop, pdf_pool: ProcessPoolExecutor, pdf_data: bytes) -> Optional[str]:
+    """
+    プロセスプールでPDFテキストを抽出する。PDF_SHARED_MEMORY_MIN_BYTES 以上のPDFは共有メモリに書き込み、
+    ワーカーには名前とサイズだけを渡す (ワーカーは共有メモリ上のデータをコピーせずに開く)。
+    共有メモリを確保できない環境ではバイト列をそのまま渡す。
+    """
+    pdf_size = len(pdf_data)
+    if pdf_size < config.PDF_SHARED_MEMORY_MIN_BYTES:
+        return await loop.run_in_executor(pdf_pool, _extract_text_from_pdf_uncached, pdf_data)
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=pdf_size)
+    except OSError as shm_err:
+        logger.debug(f"共有メモリを確保できないため、PDFデータを直接ワーカーへ渡します: {shm_err}")
+        return await loop.run_in_executor(pdf_pool, _extract_text_from_pdf_uncached, pdf_data)
+
+    def release_shared_memory(_=None) -> None:
+        # ワーカー側は close のみ行い、解放は作成した側で行う
+        shm.close()
+        shm.unlink()
+
+    try:
+        shm.buf[:pdf_size] = pdf_data
+        extract_future = pdf_pool.submit(_extract_text_from_pdf_shm, shm.name, pdf_size)
+    except BaseException:
+        release_shared_memory()
+        raise
+    # 呼び出し元がキャンセルされてもワーカーが読み終えるまでは解放しないよう、解放はワーカーの完了時に行う
+    extract_future.add_done_callback(release_shared_memory)
+    return await asyncio.wrap_future(extract_future, loop=loop)
+
+def _attach_shared_memory(shm_name: str) -> shared_memory.SharedMemory:
+    """(ワーカープロセス用) 既存の共有メモリを名前で開く。解放 (unlink) は作成した側が行う。"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    # 3.12 以前は名前で開くとリソーストラッカーに登録されるが、プールのワーカーは親プロセスのトラッカーを共有しており
+    # 登録済みの名前の再登録は何もしない。ここで unregister すると親の登録まで消え、親の unlink 時にトラッカーがエラーを出す
+    return shared_memory.SharedMemory(name=shm_name)
+
+def _extract_text_from_pdf_shm(shm_name: str, pdf_size: int) -> Optional[str]:
+    """(ワーカープロセス用) 共有メモリ上のPDFデータを、コピーせずにそのまま開いてテキストを抽出する。"""
+    shm = _attach_shared_memory(shm_name)
+    pdf_view = shm.buf[:pdf_size]
+    try:
+        return _extract_text_from_pdf_uncached(pdf_view)
+    finally:
+        try:
+            pdf_view.release()
+            shm.close()
+        except BufferError as release_err:
+            # PyMuPDF がまだ参照を持っている場合は、参照が外れた時点で解放される
+            logger.debug(f"共有メモリのクローズを見送りました: {release_err}")
+
+def _join_and_clean_pdf_pages(text_parts: List[str]) -> str:
+    """ページごとのテキストを区切り線で連結し、空行を除去しつつ各行を整形する。"""
+    full_text = "\n--- Page Separator ---\n".join(text_parts)
+    # strip は1行につき1回、中間リストは作らない
+    return '\n'.join(stripped for line in full_text.splitlines() if (stripped := line.strip()))
+
+async def _extract_text_from_pdf_pdftotext(pdf_data: bytes) -> Optional[str]:
+    """
+    poppler の pdftotext コマンドでPDFからテキストを抽出する (標準入出力経由)。
+    失敗時は None を返す (呼び出し元で PyMuPDF にフォールバックする)。
+    """
+    logger.info(f"pdftotext でPDFテキスト抽出を開始します (サイズ: {len(pdf_data)} bytes)...")
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            _PDFTOTEXT_PATH, "-q", "-enc", "UTF-8", "-", "-",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await proc.communicate(pdf_data)
+    except OSError as e:
+        logger.warning(f"pdftotext の実行に失敗しました: {e}")
+        return None
+    if proc.returncode != 0:
+        logger.warning(f"pdftotext が異常終了しました (終了コード: {proc.returncode})。")
+        return None
+    # pdftotext はページ間をフォームフィードで区切る
+    text_parts = [page_text.strip() for page_text in stdout.decode('utf-8', 'ignore').split('\f')]
+    cleaned_text = _join_and_clean_pdf_pages([part for part in text_parts if part])
+    logger.info(f"pdftotext によるテキスト抽出完了。総文字数 (整形後): {len(cleaned_text)}")
+    return cleaned_text if cleaned_text else "(No text extracted from PDF)"
+
+# PDFテキスト抽出フラグ (合字は展開し、画像情報は含めない)
+_PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+
+def _extract_text_from_pdf_uncached(pdf_data: Union[bytes, memoryview]) -> Optional[str]:
+    """extract_text_from_pdf_sync の本体 (キャッシュなし)。pdf_data はメモリビューでもよい (コピーせずに開く)。"""
     doc = None
     try:
         logger.info(f"PDFデータ (サイズ: {len(pdf_data)} bytes) からテキスト抽出を開始します...")
         doc = fitz.open(stream=pdf_data, filetype="pdf")
         text_parts = []
+        debug_enabled = logger.isEnabledFor(logging.DEBUG) # DEBUG無効時はページごとの計測・ログ組み立てを省略
         logger.info(f"PDFページ数: {len(doc)}")
         for page_num in range(len(doc)):
             page_start_time = time.monotonic()
             try:
                 page = doc.load_page(page_num)
-                page_text = page.get_text("text", sort=True)
+                # 座標順の並べ替えは PDF_PRESERVE_READING_ORDER が有効な場合のみ行う
+                page_text = page.get_text("text", flags=_PDF_TEXT_FLAGS, sort=config.PDF_PRESERVE_READING_ORDER)
                 if page_text:
                     text_parts.append(page_text.strip())
-                page_elapsed = (time.monotonic() - page_start_time) * 1000
-                logger.debug(f"ページ {page_num + 1} 処理完了 ({page_elapsed:.0f}ms)。")
+                if debug_enabled:
+                    page_elapsed = (time.monotonic() - page_start_time) * 1000
+                    logger.debug(f"ページ {page_num + 1} 処理完了 ({page_elapsed:.0f}ms)。")
             except Exception as page_e:
                 logger.warning(f"ページ {page_num + 1} の処理中にエラー: {page_e}")
                 text_parts.append(f"--- Error processing page {page_num + 1}: {page_e} ---")
-        full_text = "\n--- Page Separator ---\n".join(text_parts)
-        cleaned_text = '\n'.join([line.strip() for line in full_text.splitlines() if line.strip()])
+        cleaned_text = _join_and_clean_pdf_pages(text_parts)
         logger.info(f"PDFテキスト抽出完了。総文字数 (整形後): {len(cleaned_text)}")
         return cleaned_text if cleaned_text else "(No text extracted from PDF)"
     except fitz.fitz.TryingToReadFromEmptyFileError:
@@ -135,39 +445,199 @@ def extract_text_from_pdf_sync(pdf_data: bytes) -> Optional[str]:
             try: doc.close(); logger.debug("PDFドキュメントを閉じました。")
             except Exception as close_e: logger.warning(f"PDFドキュメントのクローズ中にエラーが発生しました (無視): {close_e}")
 
-async def download_pdf_async(api_request_context: APIRequestContext, url: str) -> Optional[bytes]:
-    """指定されたURLからPDFを非同期でダウンロードし、バイトデータを返す。失敗時はNoneを返す。"""
+# PDFダウンロード時のリクエストヘッダー (呼び出しごとに作り直さないようモジュールレベルで保持)
+_PDF_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
+    'Accept': 'application/pdf,text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br, zstd',
+    'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7'
+}
+
+def is_pdf_too_large(size: Optional[int]) -> bool:
+    """PDFのサイズが PDF_MAX_BYTES を超えているか (上限0または不明の場合は False)。"""
+    return bool(config.PDF_MAX_BYTES) and size is not None and size > config.PDF_MAX_BYTES
+
+def _declared_content_length(headers: Dict[str, str]) -> Optional[int]:
+    """レスポンスヘッダーの Content-Length を返す (ない・不正な場合は None)。"""
+    try:
+        return int(headers.get('content-length', ''))
+    except ValueError:
+        return None
+
+async def _head_pdf_size_async(
+    api_request_context: APIRequestContext,
+    url: str,
+    headers: Dict[str, str]
+) -> Tuple[Optional[int], Dict[str, str]]:
+    """
+    HEAD リクエストでPDFの Content-Length を取得し、(サイズ, レスポンスヘッダー) を返す。
+    HEAD に対応していない・サイズを返さないサーバーや失敗時のサイズは None (本体の GET で改めて確認する)。
+    """
+    try:
+        response = await api_request_context.head(url, headers=headers, timeout=min(config.PDF_DOWNLOAD_TIMEOUT, 10000), fail_on_status_code=False)
+        try:
+            if not response.ok:
+                return None, {}
+            return _declared_content_length(response.headers), response.headers
+        finally:
+            await response.dispose()
+    except Exception as e:
+        logger.debug(f"PDFサイズ確認の HEAD リクエストに失敗しました ({url}): {type(e).__name__} - {e}")
+        return None, {}
+
+async def _request_pdf_async(
+    api_request_context: APIRequestContext,
+    url: str,
+    extra_headers: Optional[Dict[str, str]] = None
+) -> Tuple[Optional[bytes], Dict[str, str], bool]:
+    """
+    PDFをGETし、(ボディ, レスポンスヘッダー, 304 Not Modified か) を返す。失敗時のボディは None。
+    extra_headers で条件付きリクエスト (If-None-Match 等) のヘッダーを追加できる。
+    PDF_MAX_BYTES を超えるPDFは None を返す (以降の抽出処理も行わない)。サイズは GET のレスポンスで確認するため、
+    その時点で本体はすでに受信済みとなる (Playwright の GET はストリーミングできないため)。
+    PDF_MAX_BYTES_HEAD_CHECK が有効な場合は先に HEAD で Content-Length を確認し、超えていればダウンロード自体を行わない
+    (条件付きリクエストでは 304 でサイズが返らないため行わない)。
+    """
+    headers = {**_PDF_HEADERS, **extra_headers} if extra_headers else _PDF_HEADERS
+    if config.PDF_MAX_BYTES and config.PDF_MAX_BYTES_HEAD_CHECK and not extra_headers:
+        head_size, head_headers = await _head_pdf_size_async(api_request_context, url, headers)
+        if is_pdf_too_large(head_size):
+            logger.warning(f"PDFのサイズ ({head_size} bytes) が上限 ({config.PDF_MAX_BYTES} bytes) を超えるため、ダウンロードせずにスキップします ({url})。")
+            return None, head_headers, False
     logger.info(f"PDFを非同期でダウンロード中: {url} (Timeout: {config.PDF_DOWNLOAD_TIMEOUT}ms)")
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
-            'Accept': 'application/pdf,text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
-            'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7'
-        }
         response = await api_request_context.get(url, headers=headers, timeout=config.PDF_DOWNLOAD_TIMEOUT, fail_on_status_code=False)
+        if response.status == 304 and extra_headers:
+            logger.info(f"PDFは前回取得時から変更されていません ({url})。")
+            return None, response.headers, True
         if not response.ok:
             logger.error(f"PDFダウンロード失敗 ({url}) - Status: {response.status} {response.status_text}")
             try:
                 error_body = await response.text(timeout=5000)
                 logger.debug(f"エラーレスポンスボディ (一部): {error_body[:500]}")
             except Exception as body_err: logger.warning(f"エラーレスポンスボディの読み取り中にエラーが発生しました: {body_err}")
-            return None
+            return None, response.headers, False
         content_type = response.headers.get('content-type', '').lower()
         if 'application/pdf' not in content_type:
             logger.warning(f"レスポンスのContent-TypeがPDFではありません ({url}): '{content_type}'。ダウンロードは続行しますが、後続処理で失敗する可能性があります。")
+        declared_size = _declared_content_length(response.headers)
+        if is_pdf_too_large(declared_size):
+            logger.warning(f"PDFのサイズ ({declared_size} bytes) が上限 ({config.PDF_MAX_BYTES} bytes) を超えるため、スキップします ({url})。")
+            return None, response.headers, False
         body = await response.body()
+        if is_pdf_too_large(len(body)): # Content-Length のない (chunked) レスポンス
+            logger.warning(f"PDFのサイズ ({len(body)} bytes) が上限 ({config.PDF_MAX_BYTES} bytes) を超えるため、スキップします ({url})。")
+            return None, {**response.headers, 'content-length': str(len(body))}, False
         if not body:
              logger.warning(f"PDFダウンロード成功 ({url}) Status: {response.status} ですが、レスポンスボディが空です。")
-             return None
+             return None, response.headers, False
         logger.info(f"PDFダウンロード成功 ({url})。サイズ: {len(body)} bytes")
-        return body
+        return body, response.headers, False
     except PlaywrightTimeoutError:
         logger.error(f"PDFダウンロード中にタイムアウトが発生しました ({url})。設定タイムアウト: {config.PDF_DOWNLOAD_TIMEOUT}ms")
-        return None
+        return None, {}, False
     except Exception as e:
         logger.error(f"PDF非同期ダウンロード中に予期せぬエラーが発生しました ({url}): {e}", exc_info=True)
+        return None, {}, False
+
+async def download_pdf_async(api_request_context: APIRequestContext, url: str) -> Optional[bytes]:
+    """
+    指定されたURLからPDFを非同期でダウンロードし、バイトデータを返す。失敗時はNoneを返す。
+    api_request_context はジョブ内で使い回す (接続・TLSセッションが再利用される) ことを想定している。
+    """
+    body, _, _ = await _request_pdf_async(api_request_context, url)
+    return body
+
+# --- URLごとのPDF抽出テキストのディスクキャッシュ (実行をまたいで再利用し、ETag/Last-Modified で再検証する) ---
+def _pdf_disk_cache_path(url: str) -> str:
+    return os.path.join(config.PDF_TEXT_DISK_CACHE_DIR, hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json")
+
+def _read_pdf_disk_cache(url: str) -> Optional[Dict[str, Any]]:
+    """キャッシュエントリを読み込む。URLが一致しない・壊れている場合は None。読み込んだエントリは最終利用時刻を更新する。"""
+    cache_path = _pdf_disk_cache_path(url)
+    try:
+        entry = loads_json(_read_file_bytes(cache_path))
+    except FileNotFoundError:
         return None
+    except (OSError, ValueError) as e:
+        logger.debug(f"PDFテキストのディスクキャッシュを読み込めませんでした ({cache_path}): {e}")
+        return None
+    if not isinstance(entry, dict) or entry.get("url") != url or not isinstance(entry.get("text"), str):
+        return None
+    try:
+        os.utime(cache_path) # 最終利用時刻 (LRU の基準) を更新
+    except OSError:
+        pass
+    return entry
+
+# ディスクキャッシュへの書き込み件数 (上限件数の確認を PDF_TEXT_DISK_CACHE_PRUNE_INTERVAL 件ごとに行うため)
+_PDF_DISK_CACHE_WRITE_COUNT = 0
+_PDF_DISK_CACHE_WRITE_COUNT_LOCK = threading.Lock()
+
+def _write_pdf_disk_cache(url: str, etag: Optional[str], last_modified: Optional[str], text: str) -> None:
+    """
+    キャッシュエントリを書き込み (一時ファイル経由で置き換え)、上限件数を超えた古いエントリを削除する。
+    上限件数の確認はプロセス内の最初の書き込みと、以降 PDF_TEXT_DISK_CACHE_PRUNE_INTERVAL 件ごとに行う。
+    """
+    global _PDF_DISK_CACHE_WRITE_COUNT
+    ensure_directory(config.PDF_TEXT_DISK_CACHE_DIR)
+    cache_path = _pdf_disk_cache_path(url)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _write_file_bytes(tmp_path, dumps_json_line({"url": url, "etag": etag, "last_modified": last_modified, "text": text}))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"PDFテキストのディスクキャッシュを書き込めませんでした ({cache_path}): {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+    with _PDF_DISK_CACHE_WRITE_COUNT_LOCK:
+        write_count = _PDF_DISK_CACHE_WRITE_COUNT
+        _PDF_DISK_CACHE_WRITE_COUNT += 1
+    if write_count % max(1, config.PDF_TEXT_DISK_CACHE_PRUNE_INTERVAL) != 0:
+        return
+    try:
+        with os.scandir(config.PDF_TEXT_DISK_CACHE_DIR) as it:
+            entries = [entry for entry in it if entry.name.endswith(".json")]
+        overflow = len(entries) - config.PDF_TEXT_DISK_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:overflow]:
+                os.remove(entry.path)
+    except OSError as e:
+        logger.debug(f"PDFテキストのディスクキャッシュの整理中にエラー (無視): {e}")
+
+async def download_and_extract_pdf_text_async(api_request_context: APIRequestContext, url: str) -> Optional[str]:
+    """
+    URLのPDFをダウンロードしてテキストを抽出する。エラー時はエラーメッセージ文字列を返す。
+    ディスクキャッシュにエントリがあれば条件付きリクエストを送り、304 ならダウンロード・抽出を省略してキャッシュを返す。
+    キャッシュは ETag または Last-Modified を返すサーバーのPDFのみ保存する (再検証できないため)。
+    """
+    use_disk_cache = bool(config.PDF_TEXT_DISK_CACHE_DIR)
+    cached_entry = await asyncio.to_thread(_read_pdf_disk_cache, url) if use_disk_cache else None
+    conditional_headers: Dict[str, str] = {}
+    if cached_entry:
+        if cached_entry.get("etag"): conditional_headers["If-None-Match"] = cached_entry["etag"]
+        if cached_entry.get("last_modified"): conditional_headers["If-Modified-Since"] = cached_entry["last_modified"]
+
+    pdf_bytes, response_headers, not_modified = await _request_pdf_async(api_request_context, url, conditional_headers or None)
+    if not_modified and cached_entry:
+        logger.info(f"PDFテキストをディスクキャッシュから返します ({url})。")
+        return cached_entry["text"]
+    if not pdf_bytes:
+        declared_size = _declared_content_length(response_headers)
+        if is_pdf_too_large(declared_size):
+            return f"Error: PDF skipped because it is too large ({declared_size} bytes > {config.PDF_MAX_BYTES} bytes)."
+        return "Error: PDF download failed or returned no data."
+
+    pdf_text = await extract_text_from_pdf_async(pdf_bytes)
+    etag = response_headers.get("etag")
+    last_modified = response_headers.get("last-modified")
+    if use_disk_cache and (etag or last_modified) and pdf_text is not None and not pdf_text.startswith("Error:"):
+        await asyncio.to_thread(_write_pdf_disk_cache, url, etag, last_modified, pdf_text)
+    return pdf_text
 
 # --- ▼▼▼ write_results_to_file 修正 ▼▼▼ ---
 def write_results_to_file(
@@ -281,6 +751,13 @@ def write_results_to_file(
                             if isinstance(pdf_text, str) and pdf_text.startswith("Error:"): file.write(f"{prefix} (Error): {pdf_text}\n")
                             elif pdf_text == "(No text extracted from PDF)": file.write(f"{prefix}: (No text extracted)\n")
                             else: file.write(f"{prefix}:\n{pdf_text}\n")
+                    elif action_type == 'download_pdf':
+                        file.write(f"Downloaded: {details_to_write.pop('download_url', None)} ({details_to_write.pop('suggested_filename', '')})\n")
+                        pdf_text = details_to_write.pop('pdf_text', '')
+                        prefix = "Extracted PDF Text"
+                        if isinstance(pdf_text, str) and pdf_text.startswith("Error:"): file.write(f"{prefix} (Error): {pdf_text}\n")
+                        elif pdf_text == "(No text extracted from PDF)": file.write(f"{prefix}: (No text extracted)\n")
+                        else: file.write(f"{prefix}:\n{pdf_text}\n")
                     elif action_type == 'screenshot' and 'filename' in details_to_write: file.write(f"Screenshot saved to: {details_to_write.pop('filename')}\n")
                     elif action_type == 'click' and 'new_page_opened' in details_to_write:
                         if details_to_write.get('new_page_opened'): file.write(f"New page opened: {details_to_write.get('new_page_url')}\n")
@@ -302,7 +779,7 @@ def write_results_to_file(
                         # リスト（配列）形式で出力
                         # JSON形式でインデント付きで書き込む
                         try:
-                             json_output = json.dumps(summary_value, indent=2, ensure_ascii=False)
+                             json_output = dumps_json(summary_value)
                              file.write(json_output + "\n")
                         except TypeError:
                              # JSONシリアライズできない場合は repr で出力
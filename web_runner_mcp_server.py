@@ -1,6 +1,5 @@
 # --- ファイル: web_runner_mcp_server.py (修正版) ---
 
-import json
 import logging # logging をインポート
 import traceback # 詳細なエラー出力用
 from typing import Any, Dict, List, Literal, Union
@@ -18,6 +17,7 @@ try:
     import utils  # ロギング設定などに使う可能性
     # playwright_handler -> playwright_launcher をインポート
     from playwright_launcher import run_playwright_automation_async # メインの実行関数
+    from playwright_launcher import get_cached_browser, run_actions_on_browser # ブラウザを使い回す実行用
 except ImportError as import_err:
     logging.critical(f"致命的エラー: Web-Runnerの必須モジュール (config, utils, playwright_launcher) のインポートに失敗しました: {import_err}")
     logging.critical("config.py, utils.py, playwright_launcher.py が同じディレクトリにあるか、PYTHONPATHに含まれているか確認してください。")
@@ -38,6 +38,7 @@ class ActionStep(BaseModel):
     option_type: Literal['value', 'index', 'label'] | None = Field(None, description="ドロップダウン選択方法 (select_optionの場合)")
     option_value: str | int | None = Field(None, description="選択する値/インデックス/ラベル (select_optionの場合)")
     wait_time_ms: int | None = Field(None, description="このアクション固有の最大待機時間 (ミリ秒)。省略時はdefault_timeout_msが使われる。")
+    opens_new_page: bool | None = Field(None, description="clickで新しいページ (タブ) が開くか。trueなら開くまで上限まで待ち、falseなら待たない。省略時は一定時間だけ待つ。")
 
 class WebRunnerInput(BaseModel):
     target_url: Union[HttpUrl, str] = Field(..., description="自動化を開始するWebページのURL (文字列も許容)")
@@ -82,19 +83,31 @@ async def execute_web_runner(
         await ctx.debug(f"  default_timeout={effective_default_timeout}")
 
         # --- ▼▼▼ 修正 ▼▼▼ ---
-        # playwright_handler -> playwright_launcher のコア関数を呼び出す
-        success, results = await run_playwright_automation_async(
-            target_url=target_url_str,
-            actions=actions_list,
-            headless_mode=input_args.headless,
-            slow_motion=input_args.slow_mo,
-            default_timeout=effective_default_timeout
-        )
+        # ブラウザはツール呼び出し間で使い回す (起動は初回のみ)。
+        # コンテキストの再利用は呼び出し間でストレージが残るため、CONTEXT_POOL_ENABLED で有効化した場合のみ行う
+        try:
+            browser = await get_cached_browser(input_args.headless, input_args.slow_mo)
+        except Exception as launch_err:
+            logger.warning(f"共有ブラウザを用意できなかったため、単発のブラウザで実行します: {type(launch_err).__name__} - {launch_err}")
+            browser = None
+        if browser is not None:
+            success, results = await run_actions_on_browser(
+                browser, target_url_str, actions_list, default_timeout=effective_default_timeout,
+                reuse_context=config.CONTEXT_POOL_ENABLED
+            )
+        else:
+            success, results = await run_playwright_automation_async(
+                target_url=target_url_str,
+                actions=actions_list,
+                headless_mode=input_args.headless,
+                slow_motion=input_args.slow_mo,
+                default_timeout=effective_default_timeout
+            )
         # --- ▲▲▲ 修正 ▲▲▲ ---
 
         # 結果をJSON文字列に変換 (エラー時も含む)
-        # ensure_ascii=False で日本語がエスケープされないようにする
-        results_json = json.dumps(results, indent=2, ensure_ascii=False)
+        # 日本語はエスケープしない。orjson があれば高速にシリアライズされる
+        results_json = utils.dumps_json(results)
         await ctx.debug(f"Task finished. Success: {success}. Results JSON (first 500 chars): {results_json[:500]}...")
 
         if success:
@@ -124,7 +137,7 @@ async def execute_web_runner(
             "error_type": type(e).__name__,
             "raw_error": str(e)
         }]
-        error_json = json.dumps(error_result, indent=2, ensure_ascii=False)
+        error_json = utils.dumps_json(error_result)
         raise ToolError(f"Unhandled server error during execution. Details: {error_json}")
 
 # --- サーバー起動設定 (変更なし) ---